@@ -0,0 +1,95 @@
+"""
+比較各種棋盤格偵測模式 (full / coarse / sb) 的速度與精度。
+
+    python benchmarks/bench_corner_detection.py Q1_Image/ [--board 11x8] [--json out.json]
+
+精度以兩種方式衡量：各模式校準的重投影誤差 (RMS)，以及與 full 模式角點的平均/最大距離。
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.cli import expand_inputs, parse_board  # noqa: E402
+from src.corner_engine import DETECT_MODES, calibrate_camera, detect_corners  # noqa: E402
+
+
+def corner_deviation(corners, reference):
+    # 不同偵測器可能以相反順序回傳角點，取兩種順序中距離較小者
+    corners, reference = corners.reshape(-1, 2), reference.reshape(-1, 2)
+    forward = np.linalg.norm(corners - reference, axis=1)
+    backward = np.linalg.norm(corners[::-1] - reference, axis=1)
+    return forward if forward.mean() <= backward.mean() else backward
+
+
+def run(paths, board_size, modes, workers):
+    rows = []
+    reference = None
+    for mode in modes:
+        start = time.perf_counter()
+        results = detect_corners(paths, board_size, workers=workers, mode=mode)
+        elapsed = time.perf_counter() - start
+        found = [r for r in results if r.found]
+        row = {
+            "mode": mode,
+            "images": len(paths),
+            "found": len(found),
+            "total_s": elapsed,
+            "per_image_ms": 1000 * elapsed / max(1, len(paths)),
+            "rms": None,
+            "mean_dev_px": None,
+            "max_dev_px": None,
+        }
+        if found:
+            row["rms"] = calibrate_camera(found, found[0].image_size, board_size)[0]
+        if mode == "full":
+            reference = {r.path: r.corners for r in found}
+        elif reference:
+            devs = [corner_deviation(r.corners, reference[r.path]) for r in found if r.path in reference]
+            if devs:
+                devs = np.concatenate(devs)
+                row["mean_dev_px"] = float(devs.mean())
+                row["max_dev_px"] = float(devs.max())
+        rows.append(row)
+    return rows
+
+
+def print_table(rows):
+    fmt = "{:<8} {:>6} {:>6} {:>10} {:>12} {:>8} {:>12} {:>11}"
+    print(fmt.format("mode", "images", "found", "total [s]", "per img [ms]", "RMS", "mean dev px", "max dev px"))
+
+    def num(value, spec):
+        return "-" if value is None else format(value, spec)
+    for r in rows:
+        print(fmt.format(r["mode"], r["images"], r["found"], num(r["total_s"], ".3f"), num(r["per_image_ms"], ".1f"),
+                         num(r["rms"], ".4f"), num(r["mean_dev_px"], ".4f"), num(r["max_dev_px"], ".4f")))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", nargs="+", help="image folders, globs or files")
+    parser.add_argument("--board", type=parse_board, default=(11, 8))
+    parser.add_argument("--modes", nargs="+", choices=DETECT_MODES, default=list(DETECT_MODES))
+    parser.add_argument("--workers", type=int, default=1, help="1 = measure single-core cost per image")
+    parser.add_argument("--json", help="write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    paths = expand_inputs(args.images)
+    if not paths:
+        sys.exit("No images found.")
+    # full 模式必須先跑，作為角點距離的基準
+    modes = ["full"] + [m for m in args.modes if m != "full"]
+    rows = run(paths, args.board, modes, args.workers)
+    print_table(rows)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+"""
+以合成資料 (真值已知) 量測各個 handler 熱點路徑的速度與精度：
+
+    corners     棋盤格偵測 (full / coarse / sb)，與真實角點的距離
+    calibrate   完整校準 vs 增量校準，與真實焦距的誤差
+    undistort   每次 cv2.undistort vs UndistortService (快取 remap 表)
+    ar          逐線段 projectPoints + line vs render_segments (一次投影)
+    stereo      StereoBM 單次 vs 切片平行 vs 金字塔，以及 SGBM/LRC/WLS 各模式，與真實視差的誤差
+    sift        BFMatcher + Python ratio 迴圈 vs 向量化 ratio test vs 完整匹配流程 (bf / flann)，單應性誤差
+
+    python benchmarks/run_benchmarks.py [--benchmarks corners stereo] [--sizes 640x480 1280x960]
+                                        [--cores 1 4] [--repeat 3] [--json out.json]
+
+每個項目在每個影像大小與核心數 (cv2.setNumThreads 與 workers) 下量測 repeat 次，取中位數。
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic  # noqa: E402
+from src.ar_renderer import render_segments  # noqa: E402
+from src.corner_engine import DETECT_MODES, calibrate_camera, detect_corners  # noqa: E402
+from src.disparity_engine import BLOCK_SIZE, DISPARITY_MODES, compute_disparity, compute_disparity_mode  # noqa: E402
+from src.feature_cache import get_sift  # noqa: E402
+from src.feature_index import ratio_test  # noqa: E402
+from src.incremental_calib import IncrementalCalibrator  # noqa: E402
+from src.matching import match_descriptors, match_features  # noqa: E402
+from src.undistort_service import UndistortService  # noqa: E402
+
+BENCHMARKS = ("corners", "calibrate", "undistort", "ar", "stereo", "sift")
+
+
+def parse_size(text):
+    w, h = text.lower().split("x")
+    return int(w), int(h)
+
+
+def timeit(fn, repeat):
+    # 回傳 (中位數秒數, 最後一次的結果)
+    times, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def corner_error(results, truth):
+    # 與真實角點的距離 (偵測器可能以相反順序回傳角點，取較小者)
+    devs = []
+    for r in results:
+        if not r.found:
+            continue
+        found, ref = r.corners.reshape(-1, 2), truth[r.path].reshape(-1, 2)
+        forward = np.linalg.norm(found - ref, axis=1)
+        backward = np.linalg.norm(found[::-1] - ref, axis=1)
+        devs.append(forward if forward.mean() <= backward.mean() else backward)
+    if not devs:
+        return None, None
+    devs = np.concatenate(devs)
+    return float(devs.mean()), float(devs.max())
+
+
+class Context:
+    """
+    同一個影像大小的合成資料 (只產生一次，各項目與核心數共用)。
+    """
+    def __init__(self, size, views, workdir):
+        self.size = size
+        self.views = views
+        self.workdir = workdir
+        self._calib = None
+        self._stereo = None
+        self._homography = None
+
+    def calibration_set(self):
+        if self._calib is None:
+            images, corners, mat_intri, cof_dist = synthetic.make_calibration_set(self.views, self.size)
+            folder = os.path.join(self.workdir, "calib_{}x{}".format(*self.size))
+            os.makedirs(folder, exist_ok=True)
+            paths = []
+            for i, img in enumerate(images):
+                path = os.path.join(folder, f"{i + 1}.png")
+                cv2.imwrite(path, img)
+                paths.append(path)
+            truth = dict(zip(paths, corners))
+            self._calib = (paths, images, truth, mat_intri, cof_dist)
+        return self._calib
+
+    def stereo_pair(self):
+        if self._stereo is None:
+            w = self.size[0]
+            self._stereo = synthetic.make_stereo_pair(self.size, min_disp=w // 40, max_disp=w // 6)
+        return self._stereo
+
+    def homography_pair(self):
+        if self._homography is None:
+            self._homography = synthetic.make_homography_pair(self.size)
+        return self._homography
+
+
+def bench_corners(ctx, cores, repeat):
+    paths, _, truth, _, _ = ctx.calibration_set()
+    rows = []
+    for mode in DETECT_MODES:
+        elapsed, results = timeit(lambda: detect_corners(paths, workers=cores, mode=mode), repeat)
+        mean_dev, max_dev = corner_error(results, truth)
+        rows.append({"variant": mode, "time_s": elapsed, "per_image_ms": 1000 * elapsed / len(paths),
+                     "found": sum(r.found for r in results), "images": len(paths),
+                     "mean_err_px": mean_dev, "max_err_px": max_dev})
+    return rows
+
+
+def bench_calibrate(ctx, cores, repeat):
+    paths, _, truth, mat_intri, _ = ctx.calibration_set()
+    results = [r for r in detect_corners(paths, workers=cores) if r.found]
+    if len(results) < 3:
+        return []
+    rows = []
+
+    elapsed, (rms, K, *_rest) = timeit(lambda: calibrate_camera(results, results[0].image_size), repeat)
+    rows.append({"variant": "full", "time_s": elapsed, "rms": rms,
+                 "focal_err_px": float(abs(K[0, 0] - mat_intri[0, 0]))})
+
+    def incremental():
+        # 先以一半的視角求解，再加入其餘視角 (模擬 GUI 中逐步加入影像)
+        calibrator = IncrementalCalibrator()
+        half = max(3, len(results) // 2)
+        calibrator.add_results(results[:half])
+        calibrator.update()
+        start = time.perf_counter()
+        calibrator.add_results(results[half:])
+        calibrator.update()
+        return calibrator, time.perf_counter() - start
+
+    elapsed, (calibrator, warm) = timeit(incremental, repeat)
+    rows.append({"variant": "incremental", "time_s": elapsed, "warm_update_s": warm, "rms": calibrator.rms,
+                 "focal_err_px": float(abs(calibrator.mat_intri[0, 0] - mat_intri[0, 0])),
+                 "rejected": len(calibrator.rejected)})
+    return rows
+
+
+def bench_undistort(ctx, cores, repeat):
+    _, images, _, mat_intri, cof_dist = ctx.calibration_set()
+    service = UndistortService()
+    rows = []
+    elapsed, _ = timeit(lambda: [cv2.undistort(img, mat_intri, cof_dist) for img in images], repeat)
+    rows.append({"variant": "cv2.undistort", "time_s": elapsed, "per_image_ms": 1000 * elapsed / len(images)})
+    service.get_maps(mat_intri, cof_dist, ctx.size)  # 第一次建表的時間另外量
+    elapsed, _ = timeit(lambda: [service.undistort(img, mat_intri, cof_dist) for img in images], repeat)
+    rows.append({"variant": "service", "time_s": elapsed, "per_image_ms": 1000 * elapsed / len(images)})
+    return rows
+
+
+def bench_ar(ctx, cores, repeat, segment_count=400):
+    _, images, _, mat_intri, cof_dist = ctx.calibration_set()
+    rng = np.random.default_rng(0)
+    # 棋盤範圍內的隨機立體線段 (約相當於 6 個字元的資料庫線段數)
+    segments = (rng.random((segment_count * 2, 3)) * [10, 7, -2]).astype(np.float32)
+    rvec, tvec = synthetic.random_pose(rng)
+    base = cv2.cvtColor(images[0], cv2.COLOR_GRAY2BGR)
+    rows = []
+
+    def per_segment():
+        img = base.copy()
+        for i in range(0, len(segments), 2):
+            pts, _ = cv2.projectPoints(segments[i:i + 2], rvec, tvec, mat_intri, cof_dist)
+            p1, p2 = pts.reshape(-1, 2).astype(int)
+            cv2.line(img, tuple(map(int, p1)), tuple(map(int, p2)), (0, 0, 255), 5)
+        return img
+
+    elapsed, _ = timeit(per_segment, repeat)
+    rows.append({"variant": "per_segment", "time_s": elapsed, "segments": segment_count})
+    elapsed, _ = timeit(lambda: render_segments(base.copy(), segments, rvec, tvec, mat_intri, cof_dist), repeat)
+    rows.append({"variant": "render_segments", "time_s": elapsed, "segments": segment_count})
+    return rows
+
+
+def bench_stereo(ctx, cores, repeat):
+    left, right, truth = ctx.stereo_pair()
+    num_disparities = int(np.ceil(truth.max() * 1.2 / 16)) * 16
+    rows = []
+    # default：OpenCV 執行緒開啟時不切 strip (見 default_strips)；strips：強制每個核心一個 strip
+    variants = [("single", dict(strips=1, workers=1)),
+                ("strips", dict(strips=cores, workers=cores)),
+                ("default", dict(workers=cores)),
+                ("pyramid", dict(workers=cores, pyramid=True))]
+    for name, kwargs in variants:
+        elapsed, disparity = timeit(lambda: compute_disparity(left, right, num_disparities, BLOCK_SIZE, **kwargs), repeat)
+        rows.append(dict(disparity_error(disparity, truth), variant=name, time_s=elapsed, num_disparities=num_disparities))
+    # 其他視差模式 (SGBM 系列、左右一致性、WLS)，記錄估計的記憶體與切片數
+    for mode in DISPARITY_MODES[1:]:
+        elapsed, (disparity, report) = timeit(
+            lambda: compute_disparity_mode(left, right, mode, num_disparities, BLOCK_SIZE, workers=cores), repeat)
+        rows.append(dict(disparity_error(disparity, truth), variant=f"mode_{report['mode']}", time_s=elapsed,
+                         num_disparities=num_disparities, strips=report["strips"],
+                         estimated_mb=report["estimated_bytes"] / 2 ** 20))
+    return rows
+
+
+def disparity_error(disparity, truth):
+    valid = disparity >= 0
+    err = np.abs(disparity[valid] / 16.0 - truth[valid])
+    return {"valid_ratio": float(valid.mean()),
+            "mean_err_px": float(err.mean()) if err.size else None,
+            "bad_2px_ratio": float((err > 2).mean()) if err.size else None}
+
+
+def homography_error(pts1, pts2, H_true):
+    # 以估計的單應性轉換四個角落，與真值比較 (像素)
+    if len(pts1) < 4:
+        return None
+    H, _ = cv2.findHomography(pts1, pts2, cv2.RANSAC, 3.0)
+    if H is None:
+        return None
+    corners = np.float32([[0, 0], [1, 0], [1, 1], [0, 1]]).reshape(-1, 1, 2)
+    corners *= np.float32(pts1.max(axis=0))
+    diff = cv2.perspectiveTransform(corners, H) - cv2.perspectiveTransform(corners, H_true)
+    return float(np.linalg.norm(diff.reshape(-1, 2), axis=1).mean())
+
+
+def bench_sift(ctx, cores, repeat):
+    img1, img2, H_true = ctx.homography_pair()
+    sift = get_sift()
+    rows = []
+
+    elapsed, (kp1, des1) = timeit(lambda: sift.detectAndCompute(img1, None), repeat)
+    kp2, des2 = sift.detectAndCompute(img2, None)
+    rows.append({"variant": "detect_describe", "time_s": elapsed, "keypoints": len(kp1)})
+    pts1_all = np.float32([kp.pt for kp in kp1])
+    pts2_all = np.float32([kp.pt for kp in kp2])
+
+    def loop():
+        matches = cv2.BFMatcher().knnMatch(des1, des2, k=2)
+        good = [m for m, n in (pair for pair in matches if len(pair) == 2) if m.distance < 0.75 * n.distance]
+        return np.int32([(m.queryIdx, m.trainIdx) for m in good]).reshape(-1, 2)
+
+    def vectorized():
+        matches = cv2.BFMatcher().knnMatch(des1, des2, k=2)
+        pairs = [pair for pair in matches if len(pair) == 2]
+        distances = np.float32([(m.distance, n.distance) for m, n in pairs]).reshape(-1, 2)
+        index = np.int32([(m.queryIdx, m.trainIdx) for m, _ in pairs]).reshape(-1, 2)
+        return index[ratio_test(distances)]
+
+    for name, fn in (("bf_loop", loop), ("bf_vectorized", vectorized)):
+        elapsed, good = timeit(fn, repeat)
+        rows.append({"variant": name, "time_s": elapsed, "matches": len(good),
+                     "homography_err_px": homography_error(pts1_all[good[:, 0]], pts2_all[good[:, 1]], H_true)})
+
+    # match_descriptors 的 bf 以同一個距離矩陣算出 k=2 與反向最近鄰，與上面的 bf_loop 比較
+    for cross_check in (False, True):
+        elapsed, result = timeit(lambda: match_descriptors(des1, des2, cross_check=cross_check), repeat)
+        rows.append({"variant": "bf_cross_check" if cross_check else "bf_ratio", "time_s": elapsed,
+                     "matches": len(result),
+                     "homography_err_px": homography_error(pts1_all[result.query_idx],
+                                                           pts2_all[result.train_idx], H_true)})
+
+    # ratio test + 互為最近鄰 + USAC_MAGSAC 驗證
+    for method in ("bf", "flann"):
+        elapsed, result = timeit(lambda: match_features(kp1, des1, kp2, des2, method=method), repeat)
+        index = result.verified()
+        rows.append({"variant": f"pipeline_{method}", "time_s": elapsed, "matches": len(result),
+                     "inliers": result.inlier_count,
+                     "homography_err_px": homography_error(pts1_all[result.query_idx[index]],
+                                                           pts2_all[result.train_idx[index]], H_true)})
+    return rows
+
+
+RUNNERS = {"corners": bench_corners, "calibrate": bench_calibrate, "undistort": bench_undistort,
+           "ar": bench_ar, "stereo": bench_stereo, "sift": bench_sift}
+
+
+def run(benchmarks, sizes, cores_list, repeat, views):
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="cvhw1_bench_") as workdir:
+        for size in sizes:
+            ctx = Context(size, views, workdir)
+            for cores in cores_list:
+                cv2.setNumThreads(cores)
+                for name in benchmarks:
+                    for row in RUNNERS[name](ctx, cores, repeat):
+                        rows.append({"benchmark": name, "size": "{}x{}".format(*size), "cores": cores, **row})
+                        print_row(rows[-1])
+    return rows
+
+
+def print_row(row):
+    extra = ", ".join(f"{k}={v:.4g}" if isinstance(v, float) else f"{k}={v}" for k, v in row.items()
+                      if k not in ("benchmark", "size", "cores", "variant", "time_s") and v is not None)
+    print("{:<10} {:<10} {:>5} {:<16} {:>10.2f} ms  {}".format(
+        row["benchmark"], row["size"], row["cores"], row["variant"], 1000 * row["time_s"], extra))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--benchmarks", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--sizes", nargs="+", type=parse_size, default=[(640, 480), (1280, 960)])
+    parser.add_argument("--cores", nargs="+", type=int, default=sorted({1, os.cpu_count() or 1}))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--views", type=int, default=12, help="number of synthetic chessboard views")
+    parser.add_argument("--json", help="write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    print("{:<10} {:<10} {:>5} {:<16} {:>13}".format("benchmark", "size", "cores", "variant", "time"))
+    rows = run(args.benchmarks, args.sizes, args.cores, args.repeat, args.views)
+    if args.json:
+        report = {
+            "environment": {"python": platform.python_version(), "opencv": cv2.__version__,
+                            "numpy": np.__version__, "platform": platform.platform(), "cpu_count": os.cpu_count()},
+            "results": rows,
+        }
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+基準測試用的合成資料 (真值已知)：
+  - render_chessboard: 以已知內參/畸變/姿態算繪的棋盤格影像與真實角點
+  - make_stereo_pair:  已知視差的雙眼影像
+  - make_homography_pair: 已知單應性矩陣的紋理影像對
+"""
+import cv2
+import numpy as np
+
+BOARD_SIZE = (11, 8)
+
+
+def default_intrinsics(image_size):
+    # 焦距約為影像寬度的 0.9 倍，主點在中心
+    w, h = image_size
+    f = 0.9 * w
+    return np.array([[f, 0, w / 2], [0, f, h / 2], [0, 0, 1]], np.float64)
+
+
+DEFAULT_DISTORTION = np.array([-0.12, 0.05, 0.0005, -0.0005, 0.0], np.float64)
+
+
+def random_pose(rng, board_size=BOARD_SIZE, distance=22.0):
+    # 棋盤中心大致位於光軸上，加上隨機旋轉與平移
+    rvec = rng.normal(0, 0.25, 3)
+    center = np.array([(board_size[0] - 1) / 2, (board_size[1] - 1) / 2, 0.0])
+    R, _ = cv2.Rodrigues(rvec)
+    tvec = np.array([0.0, 0.0, distance]) + rng.normal(0, [1.0, 1.0, 2.0]) - R @ center
+    return rvec, tvec
+
+
+def render_chessboard(image_size, mat_intri, cof_dist, rvec, tvec, board_size=BOARD_SIZE, blur=1.0, noise=2.0, rng=None):
+    """
+    回傳 (灰階影像, 真實角點 (N, 1, 2) float32)。
+    每個像素先去畸變回正規化座標，再以平面單應性反投影到棋盤平面決定黑白，
+    因此影像包含真實的鏡頭畸變。
+    """
+    w, h = image_size
+    ys, xs = np.mgrid[0:h, 0:w].astype(np.float32)
+    pixels = np.stack([xs.ravel(), ys.ravel()], axis=1).reshape(-1, 1, 2)
+    normalized = cv2.undistortPoints(pixels, mat_intri, cof_dist).reshape(-1, 2)
+
+    R, _ = cv2.Rodrigues(np.asarray(rvec, np.float64))
+    H = np.column_stack([R[:, 0], R[:, 1], np.asarray(tvec, np.float64).ravel()])
+    plane = np.column_stack([normalized, np.ones(len(normalized))]) @ np.linalg.inv(H).T
+    X = plane[:, 0] / plane[:, 2]
+    Y = plane[:, 1] / plane[:, 2]
+
+    # 內角點在整數座標 0..W-1, 0..H-1，棋盤外圍多一格
+    inside = (X >= -1) & (X < board_size[0]) & (Y >= -1) & (Y < board_size[1]) & (plane[:, 2] > 0)
+    black = ((np.floor(X) + np.floor(Y)) % 2 == 0) & inside
+    img = np.full(len(X), 235, np.float32)
+    img[black] = 20
+    # 棋盤外圍的白色邊框 (findChessboardCorners 需要)
+    margin = (X >= -2) & (X < board_size[0] + 1) & (Y >= -2) & (Y < board_size[1] + 1)
+    img[~margin] = 130
+    img = img.reshape(h, w)
+
+    if blur > 0:
+        img = cv2.GaussianBlur(img, (0, 0), blur)
+    if noise > 0:
+        rng = rng or np.random.default_rng(0)
+        img = img + rng.normal(0, noise, img.shape)
+    img = np.clip(img, 0, 255).astype(np.uint8)
+
+    objpoint = np.zeros((board_size[0] * board_size[1], 3), np.float32)
+    objpoint[:, :2] = np.mgrid[0:board_size[0], 0:board_size[1]].T.reshape(-1, 2)
+    corners, _ = cv2.projectPoints(objpoint, np.asarray(rvec, np.float64), np.asarray(tvec, np.float64), mat_intri, cof_dist)
+    return img, corners.astype(np.float32)
+
+
+def make_calibration_set(count, image_size, seed=0, board_size=BOARD_SIZE):
+    """
+    回傳 (影像清單, 真實角點清單, 內參, 畸變)。
+    """
+    rng = np.random.default_rng(seed)
+    mat_intri = default_intrinsics(image_size)
+    images, corners = [], []
+    for _ in range(count):
+        rvec, tvec = random_pose(rng, board_size)
+        img, pts = render_chessboard(image_size, mat_intri, DEFAULT_DISTORTION, rvec, tvec, board_size, rng=rng)
+        images.append(img)
+        corners.append(pts)
+    return images, corners, mat_intri, DEFAULT_DISTORTION.copy()
+
+
+def random_texture(image_size, seed=0):
+    # 多尺度雜訊紋理 (適合 block matching 與 SIFT)
+    w, h = image_size
+    rng = np.random.default_rng(seed)
+    tex = np.zeros((h, w), np.float32)
+    for scale in (1, 4, 16):
+        small = rng.random((h // scale + 1, w // scale + 1)).astype(np.float32)
+        tex += cv2.resize(small, (w, h), interpolation=cv2.INTER_CUBIC)[:h, :w] * scale
+    tex = cv2.normalize(tex, None, 0, 255, cv2.NORM_MINMAX)
+    return tex.astype(np.uint8)
+
+
+def make_stereo_pair(image_size, min_disp=40, max_disp=200, seed=0):
+    """
+    回傳 (左影像, 右影像, 真實視差 (float32，像素))。左影像 L(x) = R(x - d(x, y))。
+    """
+    w, h = image_size
+    right = random_texture(image_size, seed)
+    ys, xs = np.mgrid[0:h, 0:w].astype(np.float32)
+    # 由左到右漸增，再加上緩慢起伏
+    disparity = (min_disp + (max_disp - min_disp) * xs / w + 0.05 * (max_disp - min_disp) * np.sin(ys / 80)).astype(np.float32)
+    left = cv2.remap(right, xs - disparity, ys, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REFLECT)
+    return left, right, disparity
+
+
+def make_homography_pair(image_size, seed=0, strength=0.15):
+    """
+    回傳 (影像 1, 影像 2, H)，影像 2 = warpPerspective(影像 1, H)。
+    """
+    w, h = image_size
+    rng = np.random.default_rng(seed)
+    img1 = random_texture(image_size, seed)
+    # 加上一些幾何形狀，讓 SIFT 有明顯的特徵點
+    for _ in range(max(20, w * h // 20000)):
+        center = (int(rng.integers(0, w)), int(rng.integers(0, h)))
+        cv2.circle(img1, center, int(rng.integers(4, max(5, w // 30))), int(rng.integers(0, 256)), -1)
+    src = np.float32([[0, 0], [w, 0], [w, h], [0, h]])
+    dst = src + rng.uniform(-strength, strength, (4, 2)).astype(np.float32) * np.float32([w, h])
+    H = cv2.getPerspectiveTransform(src, dst)
+    img2 = cv2.warpPerspective(img1, H, (w, h))
+    return img1, img2, H
@@ -1,70 +1,165 @@
+import time
+_START = time.perf_counter()  # 啟動時間的起點 (匯入 PyQt 之前)
+
+import importlib
+import os
 import sys
-from PyQt5 import QtWidgets, uic
-from PyQt5.QtWidgets import QApplication
+from PyQt5 import QtWidgets
+from PyQt5.QtCore import QTimer
+from PyQt5.QtGui import QKeySequence
+from PyQt5.QtWidgets import QApplication, QShortcut
 
 # 匯入我們新分離出來的邏輯處理器
+# (Q1~Q4 的處理器會匯入 OpenCV，改為第一次按下按鈕時才載入，見 MainWindow.handler)
 from src.base_data import BaseData
-from src.q1_handler import Q1_Handler
-from src.q2_handler import Q2_Handler
-from src.q3_handler import Q3_Handler
-from src.q4_handler import Q4_Handler
+from src.gallery import GalleryDock
+from src.profiling import StageTimer, profiler
+from src.task_scheduler import TaskScheduler
+from src.ui_loader import load_ui
+
+UI_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "MainWindow-cvdlhw1.ui")
+
+# 處理器名稱 -> (模組, 類別, 是否需要 base_data)
+HANDLERS = {
+    "q1": ("src.q1_handler", "Q1_Handler", True),
+    "q2": ("src.q2_handler", "Q2_Handler", True),
+    "q3": ("src.q3_handler", "Q3_Handler", True),
+    "q4": ("src.q4_handler", "Q4_Handler", False),  # Q4 有自己的讀圖按鈕，所以不用 base_data
+}
 
 class MainWindow(QtWidgets.QMainWindow):
-    def __init__(self):
+    def __init__(self, startup=None):
         super().__init__()
-        
+        startup = startup or StageTimer()
+
         # 載入 .ui 檔案
-        # 確保 'MainWindow-cvdlhw1.ui' 和 main.py 在同一個資料夾
-        uic.loadUi('MainWindow-cvdlhw1.ui', self) 
-        
+        # 使用預先編譯的 Python 模組 (.ui 修改後自動重新編譯)，不必每次解析 XML
+        how = load_ui(UI_FILE, self)
+        startup.mark(f"ui ({how})")
+
         # --- 1. 初始化共用資料 ---
         # 建立一個物件來儲存所有 Q (1, 2, 3) 都需要存取的圖片路徑
         self.base_data = BaseData(parent_window=self)
 
-        # --- 2. 初始化所有邏輯處理器 ---
-        # 將 'self' (主視窗) 和 'self.base_data' 傳遞給處理器
+        # 背景工作排程器：所有 OpenCV 運算都在 QThreadPool 中執行，UI 不會凍結
+        self.scheduler = TaskScheduler(parent_window=self)
+        # 結果面板：取代 cv2.imshow + waitKey，顯示結果時不阻塞
+        self.gallery = GalleryDock(self)
+
+        # --- 2. 邏輯處理器 ---
+        # 第一次使用時才建立 (見 handler())，並傳入 'self' (主視窗) 和 'self.base_data'
         # 這樣處理器就能存取 UI 元件 (例如 self.ui.extrinsicSpinBox)
         # 和共用資料 (例如 self.base.images)
-        self.q1 = Q1_Handler(main_window=self, base_data=self.base_data)
-        self.q2 = Q2_Handler(main_window=self, base_data=self.base_data)
-        self.q3 = Q3_Handler(main_window=self, base_data=self.base_data)
-        self.q4 = Q4_Handler(main_window=self) # Q4 有自己的讀圖按鈕，所以不用 base_data
+        self._handlers = {}
+        startup.mark("init")
 
         # --- 3. 連接所有按鈕訊號 ---
-        
+
         # Load Image Group
         # 注意：我們將訊號連接到 base_data 物件的方法
         self.loadFolderButton.clicked.connect(self.base_data.load_folder)
         self.loadImageLButton.clicked.connect(self.base_data.load_imageL)
         self.loadImageRButton.clicked.connect(self.base_data.load_imageR)
-        
+
         # 1. Calibration Group
         # 將 Q1 的按鈕連接到 q1 處理器的方法
-        self.findCornersButton.clicked.connect(self.q1.find_corners)
-        self.findIntrinsicButton.clicked.connect(self.q1.find_intrinsic)
-        self.findExtrinsicButton.clicked.connect(self.q1.find_extrinsic)
-        self.findDistortionButton.clicked.connect(self.q1.find_distortion)
-        self.showResultButton.clicked.connect(self.q1.show_result)
+        self.findCornersButton.clicked.connect(self._slot("q1", "find_corners"))
+        self.findIntrinsicButton.clicked.connect(self._slot("q1", "find_intrinsic"))
+        self.findExtrinsicButton.clicked.connect(self._slot("q1", "find_extrinsic"))
+        self.findDistortionButton.clicked.connect(self._slot("q1", "find_distortion"))
+        self.showResultButton.clicked.connect(self._slot("q1", "show_result"))
 
         # 2. Augmented Reality Group
-        self.showWordsOnBoardButton.clicked.connect(self.q2.show_on_board)
-        self.showWordsVerticalButton.clicked.connect(self.q2.show_vertical)
+        self.showWordsOnBoardButton.clicked.connect(self._slot("q2", "show_on_board"))
+        self.showWordsVerticalButton.clicked.connect(self._slot("q2", "show_vertical"))
+        self.showWordsOnVideoButton.clicked.connect(self._slot("q2", "show_on_video"))
 
         # 3. Stereo Disparity Map Group
-        self.stereoDisparityMapButton.clicked.connect(self.q3.stereo_disparity)
+        self.stereoDisparityMapButton.clicked.connect(self._slot("q3", "stereo_disparity"))
 
         # 4. SIFT Group
         # Q4 的按鈕連接到 q4 處理器的方法
-        self.loadSiftImage1Button.clicked.connect(self.q4.load_image1)
-        self.loadSiftImage2Button.clicked.connect(self.q4.load_image2)
-        self.keypointsButton.clicked.connect(self.q4.get_keypoints)
-        self.matchedKeypointsButton.clicked.connect(self.q4.matched_keypoint)
-        
+        self.loadSiftImage1Button.clicked.connect(self._slot("q4", "load_image1"))
+        self.loadSiftImage2Button.clicked.connect(self._slot("q4", "load_image2"))
+        self.keypointsButton.clicked.connect(self._slot("q4", "get_keypoints"))
+        self.matchedKeypointsButton.clicked.connect(self._slot("q4", "matched_keypoint"))
+
+        # Ctrl+Shift+P：開始/停止量測各階段耗時 (也可用環境變數 CVHW1_PROFILE=1 在啟動時開啟)
+        QShortcut(QKeySequence("Ctrl+Shift+P"), self, activated=self.toggle_profiling)
+        startup.mark("signals")
+
         self.show()
+        startup.mark("show")
+        # 事件迴圈開始 (視窗第一次繪製) 後印出啟動時間
+        QTimer.singleShot(0, lambda: self._report_startup(startup))
         print("UI 載入完成, 等待操作...")
 
+    def _report_startup(self, startup):
+        startup.mark("first paint")
+        print(startup.format())
+
+    def handler(self, name):
+        """
+        回傳 q1~q4 的處理器，第一次使用時才匯入模組並建立 (OpenCV 也在此時才載入)。
+        """
+        handler = self._handlers.get(name)
+        if handler is None:
+            module_name, class_name, uses_base = HANDLERS[name]
+            start = time.perf_counter()
+            handler_class = getattr(importlib.import_module(module_name), class_name)
+            if uses_base:
+                handler = handler_class(main_window=self, base_data=self.base_data)
+            else:
+                handler = handler_class(main_window=self)
+            self._handlers[name] = handler
+            print(f"{class_name} loaded in {(time.perf_counter() - start) * 1000:.1f} ms")
+        return handler
+
+    def _slot(self, name, method):
+        # clicked(bool) 的參數不傳給處理器
+        return lambda *_: getattr(self.handler(name), method)()
+
+    @property
+    def q1(self):
+        return self.handler("q1")
+
+    @property
+    def q2(self):
+        return self.handler("q2")
+
+    @property
+    def q3(self):
+        return self.handler("q3")
+
+    @property
+    def q4(self):
+        return self.handler("q4")
+
+    def toggle_profiling(self):
+        if profiler.enabled:
+            # 停止時印出統計並輸出 Chrome trace
+            profiler.disable()
+            print(profiler.format_summary())
+            profiler.write_chrome_trace("cvhw1_trace.json")
+            self.statusBar().showMessage("Profiling stopped (cvhw1_trace.json)", 3000)
+        else:
+            profiler.reset()
+            profiler.enable()
+            self.statusBar().showMessage("Profiling started", 3000)
+
+    def closeEvent(self, event):
+        # 關閉前取消並等待背景工作
+        self.scheduler.cancel_all()
+        self.scheduler.wait_all()
+        if profiler.enabled:
+            print(profiler.format_summary())
+        super().closeEvent(event)
+
 # --- 程式進入點 ---
 if __name__ == '__main__':
+    startup = StageTimer(_START)
+    startup.mark("import")
     app = QApplication(sys.argv)
-    window = MainWindow()
-    sys.exit(app.exec_())
\ No newline at end of file
+    startup.mark("qapp")
+    window = MainWindow(startup)
+    sys.exit(app.exec_())
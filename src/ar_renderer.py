@@ -0,0 +1,116 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from src.glyph_atlas import atlas_path_for, is_fresh, read_atlas, write_atlas
+from src.profiling import span
+
+# 每個字元在棋盤上的平移 (最多 6 個字)，根據 PDF
+CHAR_OFFSETS = np.array([[7.0, 5.0, 0.0], [4.0, 5.0, 0.0], [1.0, 5.0, 0.0],
+                         [7.0, 2.0, 0.0], [4.0, 2.0, 0.0], [1.0, 2.0, 0.0]], np.float32)
+
+
+class GlyphTable:
+    """
+    字母資料庫的記憶體版本，可由 cv2.FileStorage 文字格式或編譯好的 glyph atlas 建立。
+    載入時一次取得所有字元，之後查詢不需再存取 FileStorage。
+    每個字元存成 (N, 3) float32，連續兩點為一條線段。
+    """
+    def __init__(self, glyphs):
+        self.glyphs = glyphs
+
+    @classmethod
+    def from_file_storage(cls, db_path):
+        fs = cv2.FileStorage(db_path, cv2.FILE_STORAGE_READ)
+        if not fs.isOpened():
+            raise RuntimeError(f"Failed to open database file: {db_path}")
+        try:
+            glyphs = {}
+            for name in fs.root().keys():
+                mat = fs.getNode(name).mat()
+                if mat is not None:
+                    glyphs[name] = np.float32(mat).reshape(-1, 3)
+        finally:
+            fs.release()
+        return cls(glyphs)
+
+    @classmethod
+    def from_atlas(cls, atlas_path):
+        # 不需解析：各字元是 memory-mapped 線段陣列的 view
+        return cls(read_atlas(atlas_path))
+
+    def get(self, ch):
+        return self.glyphs.get(ch.upper())
+
+    def build_segments(self, text, offsets=CHAR_OFFSETS):
+        """
+        將整段文字的所有線段端點串接成一個 (M, 3) 陣列 (已套用各字元的平移)。
+        找不到的字元會略過。
+        """
+        parts = []
+        for i, ch in enumerate(text[:len(offsets)]):
+            ch_mat = self.get(ch)
+            if ch_mat is None:
+                print(f"Character '{ch}' not found in db.")
+                continue
+            # 點數為奇數時捨棄最後一點，避免與下一個字元配錯線段
+            parts.append(ch_mat[:len(ch_mat) // 2 * 2] + offsets[i])
+        if not parts:
+            return np.empty((0, 3), np.float32)
+        return np.concatenate(parts)
+
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def compile_glyph_atlas(db_path, atlas_path=None):
+    """
+    將文字格式的資料庫編譯成 glyph atlas (預設與資料庫同名、副檔名 .glyphs)，回傳 atlas 路徑。
+    """
+    table = GlyphTable.from_file_storage(db_path)
+    return write_atlas(table.glyphs, atlas_path or atlas_path_for(db_path), db_path)
+
+
+def _load_table(db_path):
+    # 優先使用未過期的 atlas；沒有 (或已過期、損毀) 時解析文字格式，並順便編譯 atlas 供下次使用
+    atlas_path = atlas_path_for(db_path)
+    if is_fresh(atlas_path, db_path):
+        try:
+            return GlyphTable.from_atlas(atlas_path)
+        except (OSError, ValueError) as e:
+            print(f"Warning: ignoring glyph atlas {atlas_path} ({e})")
+    table = GlyphTable.from_file_storage(db_path)
+    try:
+        write_atlas(table.glyphs, atlas_path, db_path)
+    except OSError as e:
+        print(f"Warning: could not write glyph atlas {atlas_path} ({e})")
+    return table
+
+
+def load_glyph_table(db_path):
+    # 行程內共用：相同檔案 (且未修改) 只載入一次
+    key = (os.path.abspath(db_path), os.path.getmtime(db_path))
+    with _tables_lock:
+        table = _tables.get(key)
+    if table is None:
+        table = _load_table(db_path)
+        with _tables_lock:
+            _tables[key] = table
+    return table
+
+
+def render_segments(img, segments, rvec, tvec, mat_intri, cof_dist, color=(0, 0, 255), thickness=5):
+    """
+    一次 projectPoints 投影所有線段端點，再以一次 cv2.polylines 畫出所有線段。
+    """
+    if len(segments) < 2 or len(segments) % 2:
+        return img
+    with span("ar.project"):
+        img_points, _ = cv2.projectPoints(segments, rvec, tvec, mat_intri, cof_dist)
+        # 每兩點一條線段 -> (K, 2, 2)，與原本 tuple(map(int, ...)) 一樣截斷為整數
+        lines = img_points.reshape(-1, 2, 2).astype(np.int32)
+    with span("ar.draw"):
+        return cv2.polylines(img, lines, False, color, thickness)
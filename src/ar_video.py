@@ -0,0 +1,159 @@
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from src.ar_renderer import render_segments
+from src.corner_engine import BOARD_SIZE, SUBPIX_CRITERIA, SUBPIX_WIN, SUBPIX_ZERO_ZONE, board_object_points
+from src.image_source import ImageSource
+from src.profiling import span
+
+def open_frame_source(source):
+    """
+    回傳 (frame 迭代器, fps)。source 可以是影片檔、影像資料夾或 glob pattern。
+    影像序列沒有 fps 資訊時回傳 None。
+    """
+    # 繪製會修改影像，且每幀只讀一次，因此不使用共用解碼快取
+    frames = ImageSource(source, prefetch_size=0, cache=None)
+    if frames.video is None and not frames.paths:
+        raise RuntimeError(f"No frames found in: {source}")
+    return (frame for _, frame in frames), frames.fps
+
+
+class ARVideoRenderer:
+    """
+    串流 AR：每一幀以 solvePnP 估計棋盤姿態 (以上一幀的姿態當初始值)，
+    再用 ar_renderer 畫出文字。讀取在獨立執行緒，透過有上限的 queue 交給繪製端；
+    realtime=True 時依來源 fps 讀取，繪製來不及就丟掉最舊的幀 (模擬相機)。
+    """
+    def __init__(self, mat_intri, cof_dist, segments, board_size=BOARD_SIZE, queue_size=4):
+        self.mat_intri = mat_intri
+        self.cof_dist = cof_dist
+        self.segments = segments
+        self.board_size = board_size
+        self.queue_size = queue_size
+        self.objpoint = board_object_points(board_size)
+        self.rvec = None
+        self.tvec = None
+        self.source_fps = None
+
+    def estimate_pose(self, frame):
+        with span("corners.detect"):
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            # FAST_CHECK：沒有棋盤的幀可以很快被排除
+            ret, corners = cv2.findChessboardCorners(gray, self.board_size, None, cv2.CALIB_CB_ADAPTIVE_THRESH | cv2.CALIB_CB_FAST_CHECK)
+        if not ret:
+            return False
+        with span("corners.subpix"):
+            cv2.cornerSubPix(gray, corners, SUBPIX_WIN, SUBPIX_ZERO_ZONE, SUBPIX_CRITERIA)
+
+        use_guess = self.rvec is not None
+        rvec = self.rvec.copy() if use_guess else None
+        tvec = self.tvec.copy() if use_guess else None
+        with span("ar.pose"):
+            ok, rvec, tvec = cv2.solvePnP(self.objpoint, corners, self.mat_intri, self.cof_dist,
+                                          rvec, tvec, useExtrinsicGuess=use_guess, flags=cv2.SOLVEPNP_ITERATIVE)
+        if ok:
+            self.rvec, self.tvec = rvec, tvec
+        return ok
+
+    def render(self, frame):
+        # 找不到棋盤時不畫 (也不沿用舊姿態，避免文字漂在錯誤位置)
+        if self.estimate_pose(frame):
+            render_segments(frame, self.segments, self.rvec, self.tvec, self.mat_intri, self.cof_dist)
+        else:
+            self.rvec = self.tvec = None
+        return frame
+
+    def run(self, source, sink=None, realtime=True, progress=None):
+        """
+        處理整個來源。sink(frame) 接收繪製後的影像 (例如寫入 VideoWriter)。
+        回傳統計資料 dict：frames_read, frames_rendered, frames_dropped, fps (持續繪製速率)。
+        """
+        frames, src_fps = open_frame_source(source)
+        self.source_fps = src_fps
+        frame_queue = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        stats = {"frames_read": 0, "frames_rendered": 0, "frames_dropped": 0, "source_fps": src_fps}
+        period = 1.0 / src_fps if (realtime and src_fps) else 0.0
+
+        def reader():
+            next_time = time.perf_counter()
+            try:
+                for frame in frames:
+                    if stop.is_set():
+                        break
+                    stats["frames_read"] += 1
+                    if period:
+                        # 依來源 fps 讀取；queue 滿時丟棄最舊的幀
+                        next_time += period
+                        delay = next_time - time.perf_counter()
+                        if delay > 0:
+                            time.sleep(delay)
+                        while True:
+                            try:
+                                frame_queue.put_nowait(frame)
+                                break
+                            except queue.Full:
+                                try:
+                                    frame_queue.get_nowait()
+                                    stats["frames_dropped"] += 1
+                                except queue.Empty:
+                                    pass
+                    else:
+                        frame_queue.put(frame)
+            finally:
+                frame_queue.put(None)
+
+        self.rvec = self.tvec = None
+        thread = threading.Thread(target=reader, daemon=True)
+        start = time.perf_counter()
+        thread.start()
+        try:
+            while True:
+                frame = frame_queue.get()
+                if frame is None:
+                    break
+                frame = self.render(frame)
+                stats["frames_rendered"] += 1
+                if sink is not None:
+                    sink(frame)
+                if progress is not None:
+                    progress(stats["frames_rendered"], stats["frames_read"])
+        finally:
+            stop.set()
+            # 讓 reader 不會卡在 put()
+            while thread.is_alive():
+                try:
+                    frame_queue.get_nowait()
+                except queue.Empty:
+                    thread.join(0.05)
+
+        elapsed = time.perf_counter() - start
+        stats["elapsed"] = elapsed
+        stats["fps"] = stats["frames_rendered"] / elapsed if elapsed > 0 else 0.0
+        return stats
+
+
+def render_video(source, output_path, mat_intri, cof_dist, segments, realtime=False, progress=None):
+    """
+    將 source 的 AR 結果寫成影片 (MJPG .avi)，回傳 ARVideoRenderer.run 的統計資料。
+    """
+    writer = None
+
+    def sink(frame):
+        nonlocal writer
+        if writer is None:
+            h, w = frame.shape[:2]
+            fps = renderer.source_fps or 30.0
+            writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (w, h))
+        writer.write(frame)
+
+    renderer = ARVideoRenderer(np.asarray(mat_intri), np.asarray(cof_dist), segments)
+    try:
+        return renderer.run(source, sink, realtime=realtime, progress=progress)
+    finally:
+        if writer is not None:
+            writer.release()
@@ -1,6 +1,4 @@
-import glob
 from PyQt5.QtWidgets import QFileDialog
-import os
 
 class BaseData:
     def __init__(self, parent_window):
@@ -12,16 +10,24 @@ class BaseData:
         self.folder_path = ""  # Q1, Q2 使用
         self.imageL = None     # Q3 使用
         self.imageR = None     # Q3 使用
+        self.corner_cache = None  # Q1, Q2 共用的角點/校準快取
 
     def load_folder(self):
         folder_path = QFileDialog.getExistingDirectory(self.parent, "Select Folder Containing Images")
         if folder_path:
-            # 儲存 .bmp 圖片路徑
-            image_paths = glob.glob(folder_path + "/*.bmp")
-            self.images = sorted(image_paths, key=lambda path: int(os.path.splitext(os.path.basename(path))[0]))
+            # 角點快取與影像清單會匯入 OpenCV/numpy，選好資料夾時才載入 (加快啟動)
+            from src.corner_cache import CornerCache
+            from src.image_source import list_images
+
+            # 儲存圖片路徑 (依檔名自然排序：1, 2, ..., 10；非數字檔名也可以)
+            self.images = list_images(folder_path)
             self.folder_path = folder_path
+            # 每個資料夾各自有一份快取 (存放在資料夾內)
+            if self.corner_cache is not None:
+                self.corner_cache.close()
+            self.corner_cache = CornerCache.open(folder_path)
             print(f"Loaded folder: {folder_path}")
-            print(f"Found {len(self.images)} .bmp files.")
+            print(f"Found {len(self.images)} image files.")
 
     def load_imageL(self):
         # 載入左影像
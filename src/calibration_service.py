@@ -0,0 +1,229 @@
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from src.corner_cache import CornerCache
+from src.corner_engine import BOARD_SIZE, board_object_points, detect_corners
+from src.image_source import list_images, natural_key
+from src.profiling import span
+
+# stereoCalibrate 只求兩相機間的外參 (內參由各相機的單眼校準固定)
+STEREO_FLAGS = cv2.CALIB_FIX_INTRINSIC
+STEREO_CRITERIA = (cv2.TERM_CRITERIA_COUNT + cv2.TERM_CRITERIA_EPS, 100, 1e-6)
+
+
+class BoardSpec:
+    """
+    棋盤格規格：內角點數 (寬, 高) 與方格邊長 (決定外參/基線的單位，預設 1 = 以方格為單位)。
+    """
+    def __init__(self, board_size=BOARD_SIZE, square_size=1.0):
+        self.board_size = tuple(board_size)
+        self.square_size = float(square_size)
+
+    @classmethod
+    def parse(cls, text):
+        # "11x8" 或 "11x8:0.025"
+        size, _, square = text.partition(":")
+        width, height = (int(v) for v in size.lower().split("x"))
+        return cls((width, height), float(square) if square else 1.0)
+
+    def object_points(self):
+        return board_object_points(self.board_size) * np.float32(self.square_size)
+
+    def __repr__(self):
+        return f"{self.board_size[0]}x{self.board_size[1]}:{self.square_size:g}"
+
+
+class CameraSpec:
+    """
+    一台相機的校準輸入：名稱、影像 (資料夾、glob pattern 或路徑清單) 與棋盤格規格。
+    不同相機中檔名相同 (不含副檔名) 的影像視為同一時間拍攝，用於雙相機外參。
+    """
+    def __init__(self, name, images, board=None):
+        self.name = name
+        self.folder = None
+        if isinstance(images, str):
+            # 字串為資料夾或 glob pattern (例如 rig/L/*.bmp)；不可直接 list()，否則會拆成單一字元
+            if os.path.isdir(images):
+                self.folder = images
+                self.paths = list_images(images)
+            elif any(ch in images for ch in "*?["):
+                self.paths = sorted(glob.glob(images), key=natural_key)
+                if not self.paths:
+                    raise ValueError(f"Camera '{name}': no images match '{images}'")
+            else:
+                raise ValueError(f"Camera '{name}': image folder '{images}' does not exist")
+        else:
+            self.paths = list(images)
+        self.board = board or BoardSpec()
+
+    @classmethod
+    def parse(cls, text, default_board=None):
+        # "名稱=資料夾" 或 "名稱=資料夾,11x8:0.025"
+        name, sep, rest = text.partition("=")
+        if not sep:
+            raise ValueError(f"Invalid camera spec '{text}', expected NAME=FOLDER[,BOARD]")
+        folder, _, board = rest.partition(",")
+        return cls(name, folder, BoardSpec.parse(board) if board else default_board)
+
+
+def view_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def _calibrate_job(args):
+    """
+    單一相機的 calibrateCamera (process pool 的工作單位，只傳遞 numpy 陣列)。
+    """
+    name, objpoint, image_points, image_size = args
+    rms, mat_intri, cof_dist, v_rot, v_trans = cv2.calibrateCamera(
+        [objpoint] * len(image_points), image_points, image_size, None, None)
+    errors = []
+    for corners, rvec, tvec in zip(image_points, v_rot, v_trans):
+        projected, _ = cv2.projectPoints(objpoint, rvec, tvec, mat_intri, cof_dist)
+        diff = projected.reshape(-1, 2) - corners.reshape(-1, 2)
+        errors.append(float(np.sqrt((diff ** 2).sum(axis=1).mean())))
+    return name, rms, mat_intri, cof_dist, errors
+
+
+def _stereo_job(args):
+    pair, objpoint, points1, points2, K1, D1, K2, D2, image_size = args
+    rms, _, _, _, _, R, T, E, F = cv2.stereoCalibrate(
+        [objpoint] * len(points1), points1, points2, K1, D1, K2, D2, image_size,
+        flags=STEREO_FLAGS, criteria=STEREO_CRITERIA)
+    return pair, rms, R, T, E, F
+
+
+class CalibrationDatabase:
+    """
+    整組相機的校準結果，存成單一壓縮 .npz：
+    每台相機的 K / D，每對相機的 R / T / E / F，其餘資訊 (RMS、影像大小、棋盤、各視角誤差) 以 JSON 存在 meta。
+    """
+    def __init__(self):
+        self.cameras = {}  # name -> {"K", "D", "image_size", "rms", "board", "views", "errors"}
+        self.pairs = {}    # (name1, name2) -> {"R", "T", "E", "F", "rms", "views"}
+
+    def save(self, path):
+        arrays, meta = {}, {"cameras": {}, "pairs": []}
+        for name, cam in self.cameras.items():
+            arrays[f"camera/{name}/K"] = cam["K"]
+            arrays[f"camera/{name}/D"] = cam["D"]
+            meta["cameras"][name] = {k: cam[k] for k in ("image_size", "rms", "board", "views", "errors")}
+        for (name1, name2), pair in self.pairs.items():
+            for key in ("R", "T", "E", "F"):
+                arrays[f"pair/{name1}/{name2}/{key}"] = pair[key]
+            meta["pairs"].append({"cameras": [name1, name2], "rms": pair["rms"], "views": pair["views"]})
+        np.savez_compressed(path, meta=np.array(json.dumps(meta)), **arrays)
+
+    @classmethod
+    def load(cls, path):
+        db = cls()
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            for name, info in meta["cameras"].items():
+                db.cameras[name] = dict(info, K=data[f"camera/{name}/K"], D=data[f"camera/{name}/D"],
+                                        image_size=tuple(info["image_size"]))
+            for info in meta["pairs"]:
+                name1, name2 = info["cameras"]
+                db.pairs[(name1, name2)] = dict(info, **{key: data[f"pair/{name1}/{name2}/{key}"]
+                                                         for key in ("R", "T", "E", "F")})
+        return db
+
+    def stereo_params(self, name1, name2):
+        """
+        回傳 (K1, D1, K2, D2, R, T)，可直接建立 StereoRectifier。
+        """
+        pair = self.pairs.get((name1, name2))
+        if pair is None:
+            raise KeyError(f"No stereo calibration for pair {name1}:{name2}")
+        cam1, cam2 = self.cameras[name1], self.cameras[name2]
+        return cam1["K"], cam1["D"], cam2["K"], cam2["D"], pair["R"], pair["T"]
+
+    def summary(self):
+        return {
+            "cameras": {name: {"rms": cam["rms"], "image_size": list(cam["image_size"]), "board": cam["board"],
+                               "views": len(cam["views"]), "intrinsic": np.asarray(cam["K"]).tolist(),
+                               "distortion": np.asarray(cam["D"]).ravel().tolist()}
+                        for name, cam in self.cameras.items()},
+            "pairs": [{"cameras": list(key), "rms": pair["rms"], "views": len(pair["views"]),
+                       "baseline": float(np.linalg.norm(pair["T"])), "T": np.asarray(pair["T"]).ravel().tolist()}
+                      for key, pair in self.pairs.items()],
+        }
+
+
+def calibrate_rig(cameras, pairs=(), workers=None, detect_mode="full", use_cache=True, progress=None):
+    """
+    一次校準多台相機：
+      1. 逐台偵測角點 (detect_corners 本身以 process pool 平行，並使用各資料夾的 CornerCache)
+      2. 各相機的 calibrateCamera 在 process pool 中同時進行
+      3. pairs 中的每對相機以檔名相同且兩邊都找到角點的視角執行 stereoCalibrate (同樣平行)
+    回傳 CalibrationDatabase。progress(stage, done, total) 在每個階段回報進度。
+    """
+    cameras = {cam.name: cam for cam in cameras}
+    for name1, name2 in pairs:
+        for name in (name1, name2):
+            if name not in cameras:
+                raise ValueError(f"Unknown camera '{name}' in pair {name1}:{name2}")
+        if cameras[name1].board.board_size != cameras[name2].board.board_size:
+            raise ValueError(f"Cameras {name1} and {name2} use different boards")
+
+    # 1. 角點偵測
+    corners = {}  # name -> {view: corners}
+    image_sizes = {}
+    for i, cam in enumerate(cameras.values()):
+        cache = CornerCache.open(cam.folder) if use_cache and cam.folder else None
+        try:
+            results = detect_corners(cam.paths, cam.board.board_size, workers=workers, cache=cache, mode=detect_mode)
+        finally:
+            if cache is not None:
+                cache.close()
+        found = [r for r in results if r.found]
+        if len(found) < 3:
+            raise RuntimeError(f"Camera '{cam.name}': corners found in only {len(found)} images, need at least 3.")
+        sizes = {r.image_size for r in found}
+        if len(sizes) > 1:
+            raise RuntimeError(f"Camera '{cam.name}': images have different sizes {sorted(sizes)}")
+        corners[cam.name] = {view_name(r.path): r.corners for r in found}
+        image_sizes[cam.name] = found[0].image_size
+        print(f"Camera '{cam.name}': corners found in {len(found)}/{len(results)} images.")
+        if progress is not None:
+            progress("detect", i + 1, len(cameras))
+
+    db = CalibrationDatabase()
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(cameras)))) as pool:
+        # 2. 單眼校準
+        jobs = [(name, cameras[name].board.object_points(), list(views.values()), image_sizes[name])
+                for name, views in corners.items()]
+        with span("calibrate.rig", cameras=len(jobs)):
+            for i, (name, rms, mat_intri, cof_dist, errors) in enumerate(pool.map(_calibrate_job, jobs)):
+                db.cameras[name] = {"K": mat_intri, "D": cof_dist, "image_size": image_sizes[name], "rms": rms,
+                                    "board": repr(cameras[name].board), "views": list(corners[name]), "errors": errors}
+                print(f"Camera '{name}': RMS {rms:.4f} px")
+                if progress is not None:
+                    progress("calibrate", i + 1, len(jobs))
+
+        # 3. 雙相機外參
+        jobs = []
+        for name1, name2 in pairs:
+            if image_sizes[name1] != image_sizes[name2]:
+                raise RuntimeError(f"Cameras {name1} and {name2} have different image sizes")
+            common = [v for v in corners[name1] if v in corners[name2]]
+            if len(common) < 3:
+                raise RuntimeError(f"Pair {name1}:{name2}: only {len(common)} common views with corners, need at least 3.")
+            cam1, cam2 = db.cameras[name1], db.cameras[name2]
+            jobs.append(((name1, name2), cameras[name1].board.object_points(),
+                         [corners[name1][v] for v in common], [corners[name2][v] for v in common],
+                         cam1["K"], cam1["D"], cam2["K"], cam2["D"], image_sizes[name1]))
+            db.pairs[(name1, name2)] = {"views": common}
+        with span("calibrate.stereo", pairs=len(jobs)):
+            for i, (pair, rms, R, T, E, F) in enumerate(pool.map(_stereo_job, jobs)):
+                db.pairs[pair].update(R=R, T=T, E=E, F=F, rms=rms)
+                print(f"Pair {pair[0]}:{pair[1]}: RMS {rms:.4f} px, baseline {np.linalg.norm(T):.4f}")
+                if progress is not None:
+                    progress("stereo", i + 1, len(jobs))
+    return db
@@ -0,0 +1,440 @@
+"""
+不需要 PyQt5 的命令列批次工具，例如：
+
+    python -m src.cli calibrate Q1_Image/ --out out/calib --undistort
+    python -m src.cli calibrate-rig left=rig/L right=rig/R,11x8:0.02 --pair left:right --out out/rig
+    python -m src.cli ar Q2_Image/ --db Q2_Image/Q2_db/alphabet_db_onboard.txt --text CAMERA --out out/ar
+    python -m src.cli glyphs Q2_Image/Q2_db/*.txt
+    python -m src.cli compile-ui
+    python -m src.cli stereo imL.png imR.png --out out/stereo
+    python -m src.cli sift match a.png b.png --out out/sift
+    python -m src.cli sift index photos/ --index-dir out/index
+    python -m src.cli --shard 0/4 sift index photos/ --index-dir out/index   (每份各一個 job)
+    python -m src.cli sift merge --index-dir out/index
+    python -m src.cli sift query q.png --index-dir out/index
+    python -m src.cli --shard 0/4 sift query queries/ --index-dir out/index --out out/query   (每份各一個 job)
+    python -m src.cli sift merge-queries --out out/query
+
+--shard K/N 只處理輸入中的第 K 份 (共 N 份)，方便在叢集上以 job array 分散工作
+(只有 ar、sift index、sift query 支援；sift index 的各份寫入 --index-dir 下的 shard-K-of-N，
+最後以 sift merge 合併；sift query 的各份寫入 --out 下的 query-shard-K-of-N.json，
+最後以 sift merge-queries 合併成 query.json)。
+--profile 在結束時印出各階段的耗時統計，--trace out.json 另外輸出 Chrome trace。
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+
+import cv2
+import numpy as np
+
+from src.ar_renderer import CHAR_OFFSETS, compile_glyph_atlas, load_glyph_table, render_segments
+from src.ar_video import render_video
+from src.calibration_service import BoardSpec, CameraSpec, calibrate_rig
+from src.corner_engine import DETECT_MODES, calibrate_camera, detect_corners
+from src.disparity_engine import DISPARITY_MODES, MEMORY_BUDGET, compute_disparity_mode, disparity_to_display, format_report
+from src.feature_cache import feature_cache
+from src.feature_index import FeatureIndex
+from src.image_source import IMAGE_EXTS, list_images, natural_key
+from src.matching import GEOMETRY_MODELS, MATCH_METHODS, match_features
+from src.profiling import profiler
+from src.stereo_stream import StereoRectifier, make_matcher, process_stereo_sequence
+from src.undistort_service import undistort_service
+
+DEFAULT_UI_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "MainWindow-cvdlhw1.ui")
+
+
+def expand_inputs(inputs, exts=IMAGE_EXTS):
+    """
+    將資料夾、glob pattern 與檔案路徑展開成排序後的路徑清單 (資料夾與 glob 只取副檔名為 exts 的檔案)。
+    """
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.extend(list_images(item, exts))
+        elif any(ch in item for ch in "*?["):
+            paths.extend(p for p in glob.glob(item) if p.lower().endswith(exts))
+        else:
+            paths.append(item)
+    return sorted(set(paths), key=natural_key)
+
+
+def parse_shard(text):
+    k, n = (int(v) for v in text.split("/"))
+    if not (0 <= k < n):
+        raise argparse.ArgumentTypeError(f"Invalid shard {text}, expected K/N with 0 <= K < N")
+    return k, n
+
+
+def apply_shard(items, shard):
+    if shard is None:
+        return list(items)
+    k, n = shard
+    return list(items)[k::n]
+
+
+def parse_board(text):
+    width, height = (int(v) for v in text.lower().split("x"))
+    return width, height
+
+
+def write_json(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    print(f"Wrote {path}")
+
+
+def load_calibration(path):
+    with np.load(path) as data:
+        return data["mat_intri"], data["cof_dist"]
+
+
+# --- 子命令 ---
+def cmd_calibrate(args):
+    paths = expand_inputs(args.images)
+    if not paths:
+        sys.exit("No images found.")
+    os.makedirs(args.out, exist_ok=True)
+    print(f"Finding corners in {len(paths)} images...")
+    results = detect_corners(paths, args.board, workers=args.workers, mode=args.detect_mode)
+    found = [r for r in results if r.found]
+    if not found:
+        sys.exit("No corners found. Cannot calibrate.")
+
+    image_size = found[0].image_size
+    rms, mat_intri, cof_dist, v_rot, v_trans = calibrate_camera(found, image_size, args.board)
+    np.savez_compressed(os.path.join(args.out, "calibration.npz"), mat_intri=mat_intri, cof_dist=cof_dist,
+                        v_rot=np.asarray(v_rot), v_trans=np.asarray(v_trans), image_size=np.asarray(image_size))
+    write_json(os.path.join(args.out, "calibration.json"), {
+        "rms": rms,
+        "image_size": list(image_size),
+        "board_size": list(args.board),
+        "intrinsic": mat_intri.tolist(),
+        "distortion": cof_dist.ravel().tolist(),
+        "images": [{"path": r.path, "found": r.found, "elapsed": r.elapsed} for r in results],
+    })
+
+    if args.undistort:
+        out_dir = os.path.join(args.out, "undistorted")
+        written = undistort_service.undistort_folder(paths, out_dir, mat_intri, cof_dist, workers=args.workers)
+        print(f"Wrote {len(written)} undistorted images to {out_dir}")
+
+
+def cmd_calibrate_rig(args):
+    default_board = BoardSpec(args.board, args.square_size)
+    try:
+        cameras = [CameraSpec.parse(text, default_board) for text in args.cameras]
+    except ValueError as e:
+        sys.exit(str(e))
+    for cam in cameras:
+        if not cam.paths:
+            sys.exit(f"No images found for camera '{cam.name}'.")
+    pairs = [tuple(text.split(":")) for text in args.pair]
+    os.makedirs(args.out, exist_ok=True)
+    try:
+        db = calibrate_rig(cameras, pairs, workers=args.workers, detect_mode=args.detect_mode)
+    except (RuntimeError, ValueError) as e:
+        sys.exit(str(e))
+    db_path = os.path.join(args.out, "rig_calibration.npz")
+    db.save(db_path)
+    print(f"Wrote {db_path}")
+    write_json(os.path.join(args.out, "rig_calibration.json"), db.summary())
+
+
+def cmd_ar(args):
+    glyphs = load_glyph_table(args.db)
+    text = args.text[:len(CHAR_OFFSETS)]
+    segments = glyphs.build_segments(text, CHAR_OFFSETS)
+    os.makedirs(args.out, exist_ok=True)
+
+    if args.video:
+        if args.calibration is None:
+            sys.exit("--video requires --calibration (calibration.npz from the calibrate command).")
+        if args.shard is not None:
+            sys.exit("--shard is not supported with --video.")
+        mat_intri, cof_dist = load_calibration(args.calibration)
+        output_path = os.path.join(args.out, os.path.splitext(os.path.basename(args.video))[0] + "_ar.avi")
+        stats = render_video(args.video, output_path, mat_intri, cof_dist, segments, realtime=args.realtime)
+        write_json(os.path.join(args.out, "ar_video.json"), stats)
+        return
+
+    # 與 Q2 相同：以前 5 張影像校準，並使用校準得到的外參繪製
+    paths = expand_inputs(args.images)[:5]
+    results = detect_corners(paths, workers=args.workers)
+    found = [r for r in results if r.found]
+    if not found:
+        sys.exit("No corners found. Cannot calibrate.")
+    _, mat_intri, cof_dist, v_rot, v_trans = calibrate_camera(found, found[0].image_size)
+    for result, rvec, tvec in apply_shard(zip(found, v_rot, v_trans), args.shard):
+        img = cv2.imread(result.path)
+        img = render_segments(img, segments, rvec, tvec, mat_intri, cof_dist)
+        out_path = os.path.join(args.out, "ar_" + os.path.basename(result.path))
+        cv2.imwrite(out_path, img)
+        print(f"Wrote {out_path}")
+
+
+def cmd_glyphs(args):
+    db_paths = expand_inputs(args.databases, exts=(".txt",))
+    if not db_paths:
+        sys.exit(f"No alphabet databases found in {' '.join(args.databases)}")
+    if args.out and len(db_paths) > 1:
+        sys.exit(f"--out needs a single database, got {len(db_paths)}")
+    for db_path in db_paths:
+        atlas_path = compile_glyph_atlas(db_path, args.out)
+        print(f"Wrote {atlas_path}")
+
+
+def cmd_compile_ui(args):
+    # 共用工作站的安裝資料夾通常無法寫入，先編譯好，GUI 啟動時就不必解析 .ui
+    # (只有這個指令需要 PyQt5)
+    from src.ui_loader import compile_ui
+
+    for ui_path in args.ui_files:
+        print(f"Wrote {compile_ui(ui_path)}")
+
+
+def cmd_stereo(args):
+    os.makedirs(args.out, exist_ok=True)
+    pair = tuple(args.pair.split(":")) if args.pair else None
+    rectifier = StereoRectifier.load(args.calibration, pair) if args.calibration else None
+    memory_budget = args.memory_budget * 1024 * 1024 if args.memory_budget else None
+
+    if os.path.isfile(args.left) and args.left.lower().endswith(IMAGE_EXTS):
+        # 單一影像對 (與 Q3 相同)
+        imgL = cv2.imread(args.left, cv2.IMREAD_GRAYSCALE)
+        imgR = cv2.imread(args.right, cv2.IMREAD_GRAYSCALE)
+        if imgL is None or imgR is None:
+            sys.exit(f"Failed to read {args.left} or {args.right}")
+        if rectifier is not None:
+            imgL, imgR = rectifier.rectify(imgL, imgR)
+        try:
+            disparity, report = compute_disparity_mode(imgL, imgR, args.matcher, memory_budget=memory_budget,
+                                                       workers=args.workers)
+        except RuntimeError as e:
+            sys.exit(str(e))
+        print(format_report(report))
+        cv2.imwrite(os.path.join(args.out, "disparity_raw.png"), np.clip(disparity, 0, None).astype(np.uint16))
+        cv2.imwrite(os.path.join(args.out, "disparity.png"), disparity_to_display(disparity))
+        print(f"Wrote disparity to {args.out}")
+        return
+
+    count = process_stereo_sequence(args.left, args.right, args.out, fmt=args.format,
+                                    rectifier=rectifier, matcher=make_matcher(args.matcher, memory_budget=memory_budget),
+                                    progress=lambda done, total: print(f"{done}/{total}", end="\r"))
+    print(f"Processed {count} stereo pairs into {args.out}")
+
+
+def cmd_sift_match(args):
+    os.makedirs(args.out, exist_ok=True)
+    image1, image2 = cv2.imread(args.image1), cv2.imread(args.image2)
+    if image1 is None or image2 is None:
+        sys.exit(f"Failed to read {args.image1} or {args.image2}")
+    keypoints1, descriptors1 = feature_cache.compute(image1)
+    keypoints2, descriptors2 = feature_cache.compute(image2)
+    if descriptors1 is None or descriptors2 is None:
+        sys.exit("Could not compute descriptors.")
+
+    result = match_features(keypoints1, descriptors1, keypoints2, descriptors2, ratio=args.ratio,
+                            cross_check=not args.no_cross_check, model=args.geometry, method=args.method)
+    print(f"Matches: {result.summary()}")
+    good_matches = result.to_dmatches(inliers_only=result.model is not None)
+
+    cv2.imwrite(os.path.join(args.out, "keypoints.png"),
+                cv2.drawKeypoints(cv2.cvtColor(image1, cv2.COLOR_BGR2GRAY), keypoints1, None, color=(0, 255, 0)))
+    cv2.imwrite(os.path.join(args.out, "matches.png"),
+                cv2.drawMatchesKnn(image1, keypoints1, image2, keypoints2, good_matches, None,
+                                   flags=cv2.DrawMatchesFlags_NOT_DRAW_SINGLE_POINTS))
+    write_json(os.path.join(args.out, "matches.json"), {
+        "keypoints1": len(keypoints1),
+        "keypoints2": len(keypoints2),
+        "counts": result.counts,
+        "timings": result.timings,
+        "model": result.model.tolist() if result.model is not None else None,
+        "matches": [[m.queryIdx, m.trainIdx, m.distance] for (m,) in good_matches],
+    })
+
+
+def shard_name(shard):
+    k, n = shard
+    return f"shard-{k}-of-{n}"
+
+
+def shard_dir(index_dir, shard):
+    return os.path.join(index_dir, shard_name(shard))
+
+
+def find_shards(folder, pattern, given=None):
+    """
+    回傳要合併的各份 (given 或 folder 下符合 pattern 的檔案/資料夾)。
+    自動搜尋時檢查 N 一致且 N 份都已完成，否則結束程式。
+    """
+    if given:
+        return given
+    shards = sorted(glob.glob(os.path.join(folder, pattern)), key=natural_key)
+    if not shards:
+        sys.exit(f"No shards found in {folder}")
+    counts = {os.path.splitext(os.path.basename(s))[0].rsplit("-of-", 1)[-1] for s in shards}
+    if len(counts) != 1 or len(shards) != int(counts.pop()):
+        sys.exit(f"Incomplete or mixed shards in {folder}: {[os.path.basename(s) for s in shards]}")
+    return shards
+
+
+def cmd_sift_index(args):
+    paths = apply_shard(expand_inputs(args.images), args.shard)
+    # 分散建立時每份寫入自己的子資料夾，避免互相覆蓋
+    index_dir = shard_dir(args.index_dir, args.shard) if args.shard else args.index_dir
+    index = FeatureIndex.build(paths, index_dir, quantize=args.quantize, max_features=args.max_features,
+                               workers=args.workers)
+    print(f"Indexed {len(index.paths)} images ({len(index.owner)} descriptors) into {index_dir}")
+    if args.shard:
+        print(f"Run 'sift merge --index-dir {args.index_dir}' after all {args.shard[1]} shards finish.")
+
+
+def cmd_sift_merge(args):
+    shards = find_shards(args.index_dir, "shard-*-of-*", args.shards)
+    try:
+        index = FeatureIndex.merge(shards, args.index_dir)
+    except ValueError as e:
+        sys.exit(str(e))
+    print(f"Merged {len(shards)} indexes: {len(index.paths)} images ({len(index.owner)} descriptors) into {args.index_dir}")
+
+
+def cmd_sift_query(args):
+    index = FeatureIndex(args.index_dir)
+    results = {}
+    for path in apply_shard(expand_inputs(args.images), args.shard):
+        results[path] = index.query_image(path, top_k=args.top_k, ratio=args.ratio)
+        print(path, results[path][:3])
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+        # 分散查詢時每份寫入自己的檔案，避免互相覆蓋
+        name = f"query-{shard_name(args.shard)}.json" if args.shard else "query.json"
+        write_json(os.path.join(args.out, name), results)
+        if args.shard:
+            print(f"Run 'sift merge-queries --out {args.out}' after all {args.shard[1]} shards finish.")
+
+
+def cmd_sift_merge_queries(args):
+    results = {}
+    for path in find_shards(args.out, "query-shard-*-of-*.json", args.shards):
+        with open(path, encoding="utf-8") as f:
+            results.update(json.load(f))
+    write_json(os.path.join(args.out, "query.json"), dict(sorted(results.items(), key=lambda item: natural_key(item[0]))))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m src.cli", description="Headless batch runner for CV HW1 pipelines.")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes/threads")
+    parser.add_argument("--shard", type=parse_shard, default=None, help="process only shard K of N (K/N)")
+    parser.add_argument("--profile", action="store_true", help="print per-stage timing statistics at exit")
+    parser.add_argument("--trace", help="write a Chrome trace JSON of all stages (implies --profile)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("calibrate", help="find corners and calibrate a camera (Q1)")
+    p.add_argument("images", nargs="+", help="image folders, globs or files")
+    p.add_argument("--board", type=parse_board, default=(11, 8), help="inner corners, e.g. 11x8")
+    p.add_argument("--out", required=True)
+    p.add_argument("--detect-mode", choices=DETECT_MODES, default="full",
+                   help="full: original detector; coarse: detect on a downscaled image then refine; sb: findChessboardCornersSB")
+    p.add_argument("--undistort", action="store_true", help="also write undistorted images")
+    p.set_defaults(func=cmd_calibrate)
+
+    p = sub.add_parser("calibrate-rig", help="calibrate several cameras and their stereo pairs in one run")
+    p.add_argument("cameras", nargs="+", help="NAME=FOLDER[,WxH[:SQUARE]] for each camera")
+    p.add_argument("--board", type=parse_board, default=(11, 8), help="default inner corners, e.g. 11x8")
+    p.add_argument("--square-size", type=float, default=1.0, help="default square size (unit of the baselines)")
+    p.add_argument("--pair", action="append", default=[], help="NAME1:NAME2 stereo pair (repeatable)")
+    p.add_argument("--out", required=True)
+    p.add_argument("--detect-mode", choices=DETECT_MODES, default="full")
+    p.set_defaults(func=cmd_calibrate_rig)
+
+    p = sub.add_parser("ar", help="draw words on the chessboard (Q2)")
+    p.add_argument("images", nargs="*", help="image folders, globs or files (first 5 are used)")
+    p.add_argument("--db", required=True, help="alphabet database (alphabet_db_*.txt)")
+    p.add_argument("--text", required=True)
+    p.add_argument("--out", required=True)
+    p.add_argument("--video", help="render a video or image sequence instead of the still images")
+    p.add_argument("--calibration", help="calibration.npz (required with --video)")
+    p.add_argument("--realtime", action="store_true", help="pace the video at source FPS and drop frames")
+    p.set_defaults(func=cmd_ar, shardable=True)
+
+    p = sub.add_parser("glyphs", help="compile alphabet databases into binary glyph atlases (Q2)")
+    p.add_argument("databases", nargs="+", help="alphabet_db_*.txt files, globs or folders")
+    p.add_argument("--out", help="atlas path (single database only; default: next to the database)")
+    p.set_defaults(func=cmd_glyphs)
+
+    p = sub.add_parser("compile-ui", help="precompile .ui files into Python modules for faster GUI startup")
+    p.add_argument("ui_files", nargs="*", default=[DEFAULT_UI_FILE], help=f"default: {DEFAULT_UI_FILE}")
+    p.set_defaults(func=cmd_compile_ui)
+
+    p = sub.add_parser("stereo", help="disparity for an image pair or a stereo sequence (Q3)")
+    p.add_argument("left", help="left image, folder or video")
+    p.add_argument("right", help="right image, folder or video")
+    p.add_argument("--out", required=True)
+    p.add_argument("--matcher", choices=DISPARITY_MODES, default="bm")
+    p.add_argument("--memory-budget", type=int, default=MEMORY_BUDGET // 2 ** 20,
+                   help="memory budget in MB for the SGBM cost volume; larger pairs are split into strips (0 = unlimited)")
+    p.add_argument("--format", choices=("png", "npy"), default="png")
+    p.add_argument("--calibration", help="stereo calibration .npz (K1, D1, K2, D2, R, T) or rig_calibration.npz")
+    p.add_argument("--pair", help="NAME1:NAME2 pair to use from a rig calibration database")
+    p.set_defaults(func=cmd_stereo)
+
+    p = sub.add_parser("sift", help="SIFT keypoints and matching (Q4)")
+    sift_sub = p.add_subparsers(dest="sift_command", required=True)
+    q = sift_sub.add_parser("match", help="match two images")
+    q.add_argument("image1")
+    q.add_argument("image2")
+    q.add_argument("--out", required=True)
+    q.add_argument("--ratio", type=float, default=0.75)
+    q.add_argument("--method", choices=MATCH_METHODS, default="bf", help="bf: exact; flann: approximate, faster")
+    q.add_argument("--geometry", choices=GEOMETRY_MODELS, default="homography",
+                   help="model used for USAC_MAGSAC verification")
+    q.add_argument("--no-cross-check", action="store_true", help="skip the mutual nearest neighbour check")
+    q.set_defaults(func=cmd_sift_match)
+    q = sift_sub.add_parser("index", help="build a feature index for a collection")
+    q.add_argument("images", nargs="+")
+    q.add_argument("--index-dir", required=True)
+    q.add_argument("--max-features", type=int, default=None)
+    q.add_argument("--quantize", action="store_true",
+                   help="store uint8 descriptors (1/4 the size, but the first query writes a float32 copy "
+                        "for FLANN, about 1.25x the float32 index in total)")
+    q.set_defaults(func=cmd_sift_index, shardable=True)
+    q = sift_sub.add_parser("merge", help="merge sharded indexes (from --shard K/N sift index)")
+    q.add_argument("shards", nargs="*", help="index folders to merge (default: INDEX_DIR/shard-*-of-N)")
+    q.add_argument("--index-dir", required=True, help="output index folder")
+    q.set_defaults(func=cmd_sift_merge)
+    q = sift_sub.add_parser("query", help="find matching images in an index")
+    q.add_argument("images", nargs="+")
+    q.add_argument("--index-dir", required=True)
+    q.add_argument("--top-k", type=int, default=5)
+    q.add_argument("--ratio", type=float, default=0.75)
+    q.add_argument("--out")
+    q.set_defaults(func=cmd_sift_query, shardable=True)
+    q = sift_sub.add_parser("merge-queries", help="merge sharded query results (from --shard K/N sift query)")
+    q.add_argument("shards", nargs="*", help="query JSON files to merge (default: OUT/query-shard-*-of-N.json)")
+    q.add_argument("--out", required=True, help="folder of the shard results; query.json is written here")
+    q.set_defaults(func=cmd_sift_merge_queries)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.shard is not None and not getattr(args, "shardable", False):
+        # 其他指令需要全部輸入 (例如校準) 或只有單一輸入，分散執行沒有意義
+        parser.error(f"--shard is not supported by '{args.command}' (only ar, sift index and sift query)")
+    if args.profile or args.trace:
+        profiler.enable()
+    try:
+        args.func(args)
+    finally:
+        if profiler.enabled:
+            print(profiler.format_summary())
+            if args.trace:
+                profiler.write_chrome_trace(args.trace)
+
+
+if __name__ == "__main__":
+    main()
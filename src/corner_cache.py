@@ -0,0 +1,182 @@
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+CACHE_FILENAME = ".cvhw1_cache.sqlite"
+
+
+def _to_blob(**arrays):
+    # 以壓縮的 .npz 格式存放 numpy 陣列
+    buf = io.BytesIO()
+    np.savez_compressed(buf, **arrays)
+    return buf.getvalue()
+
+
+def _from_blob(blob):
+    with np.load(io.BytesIO(blob)) as data:
+        return {name: data[name] for name in data.files}
+
+
+class CornerCache:
+    """
+    存放於影像資料夾中的角點與校準結果快取 (sqlite)。
+    角點以「檔案內容 hash + 棋盤大小 + subpixel 參數」為 key，
+    校準結果以「使用到的角點 key (依序) + 影像大小」為 key。
+    每個表最多保留 max_entries 筆，超過時淘汰最久未使用的資料。
+    命中時的使用時間先記在記憶體中，flush() (或寫入、close()) 時才一次寫入，讀取快取不會每筆都 commit。
+    """
+    def __init__(self, folder_path, max_entries=2000, filename=CACHE_FILENAME):
+        self.path = os.path.join(folder_path, filename)
+        self.max_entries = max_entries
+        # 背景工作執行緒也會存取快取，以 lock 保護同一個連線
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY, mtime REAL, size INTEGER, digest TEXT);
+            CREATE TABLE IF NOT EXISTS corners (
+                key TEXT PRIMARY KEY, found INTEGER, width INTEGER, height INTEGER,
+                data BLOB, last_used REAL);
+            CREATE TABLE IF NOT EXISTS calibration (
+                key TEXT PRIMARY KEY, data BLOB, last_used REAL);
+        """)
+        self.db.commit()
+        self._touched = {}  # (table, key) -> 尚未寫入的 last_used
+
+    @classmethod
+    def open(cls, folder_path, **kwargs):
+        # 資料夾無法寫入時回傳 None，呼叫端會直接略過快取
+        try:
+            return cls(folder_path, **kwargs)
+        except sqlite3.Error as e:
+            print(f"Warning: corner cache disabled ({e})")
+            return None
+
+    def close(self):
+        with self.lock:
+            self.flush()
+            self.db.close()
+
+    def flush(self):
+        # 將累積的 LRU 使用時間以單一交易寫入
+        with self.lock:
+            if self._touched:
+                self._write_touched()
+                self.db.commit()
+
+    # --- key ---
+    def file_digest(self, image_path):
+        with self.lock:
+            # 檔案 mtime/size 未變時沿用上次的 hash，重新開啟資料夾時不必重新讀檔
+            stat = os.stat(image_path)
+            abs_path = os.path.abspath(image_path)
+            row = self.db.execute("SELECT mtime, size, digest FROM files WHERE path = ?", (abs_path,)).fetchone()
+            if row is not None and row[0] == stat.st_mtime and row[1] == stat.st_size:
+                return row[2]
+
+            h = hashlib.sha1()
+            with open(image_path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+            digest = h.hexdigest()
+            self.db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                            (abs_path, stat.st_mtime, stat.st_size, digest))
+            self.db.commit()
+            return digest
+
+    def corner_key(self, image_path, board_size, params):
+        # params: 影響角點結果的其他參數 (例如 subpixel 視窗與終止條件)
+        return f"{self.file_digest(image_path)}|{board_size[0]}x{board_size[1]}|{params!r}"
+
+    @staticmethod
+    def calibration_key(corner_keys, image_size):
+        h = hashlib.sha1()
+        # 保留順序：外參 (v_rot, v_trans) 依影像順序排列
+        for key in corner_keys:
+            h.update(key.encode())
+        h.update(f"{image_size[0]}x{image_size[1]}".encode())
+        return h.hexdigest()
+
+    # --- 角點 ---
+    def get_corners(self, key):
+        """
+        回傳 (found, corners, image_size)，未命中時回傳 None。
+        """
+        with self.lock:
+            row = self.db.execute("SELECT found, width, height, data FROM corners WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._touch("corners", key)
+            found, width, height, data = row
+            corners = _from_blob(data)["corners"] if found else None
+            return bool(found), corners, (width, height)
+
+    def put_corners(self, key, found, corners, image_size):
+        with self.lock:
+            data = _to_blob(corners=corners) if found else None
+            self.db.execute("INSERT OR REPLACE INTO corners VALUES (?, ?, ?, ?, ?, ?)",
+                            (key, int(found), image_size[0], image_size[1], data, time.time()))
+            self._evict("corners")
+            self.db.commit()
+
+    # --- 校準結果 ---
+    def get_calibration(self, key):
+        """
+        回傳 (rms, mat_intri, cof_dist, v_rot, v_trans)，未命中時回傳 None。
+        """
+        with self.lock:
+            row = self.db.execute("SELECT data FROM calibration WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._touch("calibration", key)
+            data = _from_blob(row[0])
+            return float(data["rms"]), data["mat_intri"], data["cof_dist"], tuple(data["v_rot"]), tuple(data["v_trans"])
+
+    def put_calibration(self, key, rms, mat_intri, cof_dist, v_rot, v_trans):
+        with self.lock:
+            data = _to_blob(rms=np.float64(rms), mat_intri=mat_intri, cof_dist=cof_dist,
+                            v_rot=np.asarray(v_rot), v_trans=np.asarray(v_trans))
+            self.db.execute("INSERT OR REPLACE INTO calibration VALUES (?, ?, ?)", (key, data, time.time()))
+            self._evict("calibration")
+            self.db.commit()
+
+    # --- 失效與淘汰 ---
+    def invalidate(self, image_path=None):
+        """
+        清除指定影像的快取 (image_path=None 時清除全部)。
+        校準結果依賴角點，因此一併清除。
+        """
+        with self.lock:
+            if image_path is None:
+                self.db.execute("DELETE FROM corners")
+                self.db.execute("DELETE FROM files")
+            else:
+                digest = self.file_digest(image_path)
+                self.db.execute("DELETE FROM corners WHERE key LIKE ?", (digest + "|%",))
+                self.db.execute("DELETE FROM files WHERE path = ?", (os.path.abspath(image_path),))
+            self.db.execute("DELETE FROM calibration")
+            self.db.commit()
+
+    def _touch(self, table, key):
+        self._touched[(table, key)] = time.time()
+
+    def _write_touched(self):
+        for table in ("corners", "calibration"):
+            rows = [(t, key) for (name, key), t in self._touched.items() if name == table]
+            if rows:
+                self.db.executemany(f"UPDATE {table} SET last_used = ? WHERE key = ?", rows)
+        self._touched.clear()
+
+    def _evict(self, table):
+        # 淘汰前先寫入使用時間，避免剛命中的資料被當成最久未使用
+        self._write_touched()
+        count = self.db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        if count > self.max_entries:
+            self.db.execute(
+                f"DELETE FROM {table} WHERE key IN "
+                f"(SELECT key FROM {table} ORDER BY last_used LIMIT ?)", (count - self.max_entries,))
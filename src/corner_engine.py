@@ -0,0 +1,260 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from src.image_source import frame_cache
+from src.profiling import profiler, span
+
+# 棋盤格內角點數 (寬, 高)，根據 PDF 為 11x8
+BOARD_SIZE = (11, 8)
+# cornerSubPix 參數 (與原本 Q1 相同)
+SUBPIX_WIN = (5, 5)
+SUBPIX_ZERO_ZONE = (-1, -1)
+SUBPIX_CRITERIA = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+
+
+class CornerResult:
+    """
+    單張影像的角點偵測結果 (不依賴 Qt，可在子行程間傳遞)。
+    """
+    def __init__(self, path, found, corners, image_size, elapsed, key=None):
+        self.path = path
+        self.found = found            # 是否找到棋盤格
+        self.corners = corners        # (N, 1, 2) float32，找不到時為 None
+        self.image_size = image_size  # (width, height)，讀檔失敗時為 None
+        self.elapsed = elapsed        # 偵測耗時 (秒)
+        self.key = key                # 快取 key (未使用快取時為 None)
+
+    def __repr__(self):
+        return f"CornerResult({os.path.basename(self.path)}, found={self.found}, {self.elapsed * 1000:.1f} ms)"
+
+
+def board_object_points(board_size=BOARD_SIZE):
+    # 建立棋盤格的 3D 世界座標 (z = 0)
+    width, height = board_size
+    objpoint = np.zeros((width * height, 3), np.float32)
+    objpoint[:, :2] = np.mgrid[0:width, 0:height].T.reshape(-1, 2)
+    return objpoint
+
+
+# 偵測模式：
+#   "full"   : 全解析度 findChessboardCorners (原本 Q1 的做法)
+#   "coarse" : 先在縮小的影像上找棋盤 (FAST_CHECK 快速排除沒有棋盤的影像)，再於全解析度 cornerSubPix
+#   "sb"     : findChessboardCornersSB (本身即為次像素精度)
+DETECT_MODES = ("full", "coarse", "sb")
+# coarse 模式縮小後的最長邊
+COARSE_MAX_SIDE = 640
+
+
+def _find_full(grayimg, board_size, subpix):
+    with span("corners.detect"):
+        ret, corners = cv2.findChessboardCorners(grayimg, board_size, None)
+    if ret and subpix:
+        with span("corners.subpix"):
+            cv2.cornerSubPix(grayimg, corners, SUBPIX_WIN, SUBPIX_ZERO_ZONE, SUBPIX_CRITERIA)
+    return ret, corners
+
+
+def _find_coarse(grayimg, board_size, subpix):
+    h, w = grayimg.shape[:2]
+    scale = COARSE_MAX_SIDE / max(h, w)
+    if scale >= 1:
+        return _find_full(grayimg, board_size, subpix)
+
+    with span("corners.detect"):
+        small = cv2.resize(grayimg, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        flags = cv2.CALIB_CB_ADAPTIVE_THRESH | cv2.CALIB_CB_NORMALIZE_IMAGE | cv2.CALIB_CB_FAST_CHECK
+        ret, corners = cv2.findChessboardCorners(small, board_size, None, flags)
+    if not ret:
+        return False, None
+
+    # 換回全解析度座標 (以像素中心對齊)
+    corners = ((corners + 0.5) / scale - 0.5).astype(np.float32)
+    # 粗略位置誤差約 1/scale 像素，先用較大的視窗收斂，再用與 full 模式相同的視窗精修
+    half = max(SUBPIX_WIN[0], int(np.ceil(2 / scale)))
+    with span("corners.subpix"):
+        cv2.cornerSubPix(grayimg, corners, (half, half), SUBPIX_ZERO_ZONE, SUBPIX_CRITERIA)
+        if subpix:
+            cv2.cornerSubPix(grayimg, corners, SUBPIX_WIN, SUBPIX_ZERO_ZONE, SUBPIX_CRITERIA)
+    return True, corners
+
+
+def _find_sb(grayimg, board_size, subpix):
+    # SB 偵測本身即包含次像素精修，整段記為 detect
+    with span("corners.detect"):
+        ret, corners = cv2.findChessboardCornersSB(grayimg, board_size, None, cv2.CALIB_CB_NORMALIZE_IMAGE)
+    return ret, corners.astype(np.float32) if ret else None
+
+
+_FINDERS = {"full": _find_full, "coarse": _find_coarse, "sb": _find_sb}
+
+
+def detect_image(image_path, board_size=BOARD_SIZE, subpix=True, mode="full"):
+    """
+    偵測單張影像的棋盤格角點。此函式是 process pool 的工作單位，
+    因此必須是模組層級的函式且只回傳可 pickle 的資料。
+    """
+    start = time.perf_counter()
+    with span("decode"):
+        grayimg = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+    if grayimg is None:
+        return CornerResult(image_path, False, None, None, time.perf_counter() - start)
+
+    image_size = (grayimg.shape[1], grayimg.shape[0])
+    ret, corners = _FINDERS[mode](grayimg, board_size, subpix)
+    return CornerResult(image_path, bool(ret), corners if ret else None, image_size, time.perf_counter() - start)
+
+
+def _detect_chunk(args):
+    image_paths, board_size, subpix, mode, collect = args
+    if not collect:
+        return [detect_image(path, board_size, subpix, mode) for path in image_paths], []
+    # 子行程：量測後把事件一併回傳，由主行程合併
+    # fork 出來的子行程會繼承主行程已記錄的事件，先清空，只回傳這個 chunk 自己的事件
+    profiler.reset()
+    profiler.enable()
+    results = [detect_image(path, board_size, subpix, mode) for path in image_paths]
+    return results, profiler.take_events()
+
+
+def detect_corners(image_paths, board_size=BOARD_SIZE, subpix=True, workers=None, chunk_size=4, cache=None, progress=None,
+                   mode="full"):
+    """
+    以 process pool 平行偵測多張影像的角點，回傳順序與 image_paths 相同的 CornerResult 清單。
+    workers=1 (或影像很少) 時直接在目前行程執行，省去建立 pool 的成本。
+    若提供 cache (CornerCache)，已偵測過的影像直接由快取取得，新結果也會寫回快取。
+    progress(done, total) 會在每批影像完成後呼叫 (例如 Task.report，可藉此取消)。
+    mode 為 DETECT_MODES 之一。
+    """
+    if mode not in _FINDERS:
+        raise ValueError(f"Unknown detection mode: {mode}")
+    image_paths = list(image_paths)
+    results = [None] * len(image_paths)
+    keys = [None] * len(image_paths)
+
+    if cache is not None:
+        params = _cache_params(subpix, mode)
+        for i, path in enumerate(image_paths):
+            keys[i] = cache.corner_key(path, board_size, params)
+            hit = cache.get_corners(keys[i])
+            if hit is not None:
+                found, corners, image_size = hit
+                results[i] = CornerResult(path, found, corners, image_size, 0.0, keys[i])
+
+    pending = [i for i in range(len(image_paths)) if results[i] is None]
+    total = len(image_paths)
+    done = total - len(pending)
+    if progress is not None:
+        progress(done, total)
+
+    def on_chunk(count):
+        nonlocal done
+        done += count
+        if progress is not None:
+            progress(done, total)
+
+    for i, result in zip(pending, _detect_many([image_paths[i] for i in pending], board_size, subpix, mode, workers, chunk_size, on_chunk)):
+        result.key = keys[i]
+        results[i] = result
+        if cache is not None and result.image_size is not None:
+            cache.put_corners(result.key, result.found, result.corners, result.image_size)
+    if cache is not None:
+        cache.flush()  # 命中的使用時間整批寫入
+    return results
+
+
+def _cache_params(subpix, mode):
+    params = (SUBPIX_WIN, SUBPIX_ZERO_ZONE, SUBPIX_CRITERIA) if subpix else None
+    # 保持 full 模式的 key 不變，既有的快取仍然有效
+    return params if mode == "full" else (params, mode)
+
+
+def _detect_many(image_paths, board_size, subpix, mode, workers, chunk_size, on_chunk):
+    if not image_paths:
+        return []
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(image_paths)))
+
+    # 每個工作包含數張影像，降低行程間通訊的次數
+    chunks = [(image_paths[i:i + chunk_size], board_size, subpix, mode) for i in range(0, len(image_paths), chunk_size)]
+    results = []
+    if workers == 1:
+        for chunk in chunks:
+            # 在目前行程執行，span 直接記錄到 profiler
+            results.extend(_detect_chunk(chunk + (False,))[0])
+            on_chunk(len(chunk[0]))
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_detect_chunk, chunk + (profiler.enabled,)) for chunk in chunks]
+        try:
+            for future in futures:
+                chunk_result, events = future.result()
+                profiler.merge(events)
+                results.extend(chunk_result)
+                on_chunk(len(chunk_result))
+        except BaseException:
+            # 例如取消時：丟棄尚未開始的工作
+            for future in futures:
+                future.cancel()
+            raise
+    return results
+
+
+def calibrate_camera(results, image_size, board_size=BOARD_SIZE, cache=None):
+    """
+    以找到角點的 CornerResult 執行 cv2.calibrateCamera。
+    回傳 (rms, mat_intri, cof_dist, v_rot, v_trans)；若提供 cache 且角點集合相同則直接取用快取。
+    """
+    found = [r for r in results if r.found]
+    if not found:
+        return None
+
+    calib_key = None
+    if cache is not None and all(r.key is not None for r in found):
+        calib_key = cache.calibration_key([r.key for r in found], image_size)
+        hit = cache.get_calibration(calib_key)
+        if hit is not None:
+            cache.flush()
+            return hit
+
+    objpoint = board_object_points(board_size)
+    object_points = [objpoint] * len(found)
+    image_points = [r.corners for r in found]
+    with span("calibrate", views=len(found)):
+        rms, mat_intri, cof_dist, v_rot, v_trans = cv2.calibrateCamera(object_points, image_points, image_size, None, None)
+
+    if calib_key is not None:
+        cache.put_calibration(calib_key, rms, mat_intri, cof_dist, v_rot, v_trans)
+    return rms, mat_intri, cof_dist, v_rot, v_trans
+
+
+def draw_corners(result, board_size=BOARD_SIZE, size=(1000, 800)):
+    # 產生角點視覺化影像 (選用步驟，與偵測分離)
+    img_draw = frame_cache.imread(result.path, cv2.IMREAD_COLOR)
+    if img_draw is None:
+        return None
+    with span("corners.draw"):
+        img_draw = img_draw.copy()
+        if result.found:
+            cv2.drawChessboardCorners(img_draw, board_size, result.corners, True)
+        return cv2.resize(img_draw, size, interpolation=cv2.INTER_AREA)
+
+
+def show_corners(results, board_size=BOARD_SIZE, delay=1, window_name="Corner detection"):
+    """
+    在同一個視窗依序顯示偵測結果。delay 預設為 1 ms，只刷新畫面而不阻塞。
+    """
+    for result in results:
+        if not result.found:
+            continue
+        img_draw = draw_corners(result, board_size)
+        if img_draw is None:
+            continue
+        cv2.imshow(window_name, img_draw)
+        cv2.setWindowTitle(window_name, os.path.basename(result.path))
+        cv2.waitKey(delay)
@@ -0,0 +1,333 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from src.profiling import span
+
+try:
+    import resource  # Windows 沒有此模組，只能回報估計值
+except ImportError:
+    resource = None
+
+# Q3 的 StereoBM 參數 (根據 PDF)
+NUM_DISPARITIES = 432
+BLOCK_SIZE = 25
+
+# Q3 可選的視差模式：
+#   bm        StereoBM (原本的作法)
+#   sgbm      StereoSGBM 5 方向單次掃描 (只需每列的 cost buffer)
+#   sgbm_hh   StereoSGBM 8 方向完整兩次掃描 (需要整張 W*H*D 的 cost volume)
+#   sgbm_hh4  StereoSGBM 4 方向 (同樣需要整張 cost volume，可平行)
+#   sgbm_3way StereoSGBM 3 方向 (最快、記憶體最少)
+#   lrc       sgbm + 左右一致性檢查 (不一致的像素設為無效)
+#   wls       sgbm + 左右視差的 WLS 濾波 (需要 opencv-contrib 的 ximgproc，否則退回 lrc)
+DISPARITY_MODES = ("bm", "sgbm", "sgbm_hh", "sgbm_hh4", "sgbm_3way", "lrc", "wls")
+SGBM_MODES = {
+    "sgbm": cv2.STEREO_SGBM_MODE_SGBM,
+    "sgbm_hh": cv2.STEREO_SGBM_MODE_HH,
+    "sgbm_hh4": cv2.STEREO_SGBM_MODE_HH4,
+    "sgbm_3way": cv2.STEREO_SGBM_MODE_SGBM_3WAY,
+}
+# SGBM 的匹配視窗通常 3~11，Q3 的 25 太大 (P1/P2 隨視窗面積成長)
+SGBM_MAX_BLOCK = 11
+# SGBM 的路徑會跨越整張影像，strip 之間多留的列數 (接縫附近的結果為近似)
+SGBM_STRIP_MARGIN = 48
+# 預設的記憶體上限 (bytes)；None 表示不限制
+MEMORY_BUDGET = 1024 * 1024 * 1024
+WLS_LAMBDA = 8000.0
+WLS_SIGMA = 1.5
+
+
+def _make_bm(num_disparities, block_size, min_disparity=0):
+    stereo = cv2.StereoBM_create(numDisparities=num_disparities, blockSize=block_size)
+    stereo.setMinDisparity(min_disparity)
+    return stereo
+
+
+def _make_sgbm(num_disparities, block_size, mode="sgbm", min_disparity=0):
+    # 參數與 stereo_stream 原本的 sgbm matcher 相同 (灰階影像，P1/P2 依 OpenCV 建議)
+    block = min(block_size, SGBM_MAX_BLOCK)
+    return cv2.StereoSGBM_create(min_disparity, num_disparities, block, P1=8 * block * block, P2=32 * block * block,
+                                 uniquenessRatio=10, speckleWindowSize=100, speckleRange=2, mode=SGBM_MODES[mode])
+
+
+def strip_margin(stereo):
+    # 每個 strip 上下需要多讀的列數：匹配視窗半徑 + 前處理濾波器半徑
+    # (XSOBEL 前處理為 3x3，NORMALIZED_RESPONSE 則使用 preFilterSize)
+    return stereo.getBlockSize() // 2 + stereo.getPreFilterSize() // 2 + 1
+
+
+def default_strips(workers=None):
+    """
+    未指定 strips 時的切片數。StereoBM 已以 OpenCV 的執行緒 (parallel_for_) 平行計算，
+    再自行切 strip 只會多算重疊的 margin 列 (640x480、1~2 核時量測反而較慢)，
+    所以只有 OpenCV 執行緒被關閉 (cv2.getNumThreads() == 1) 時才依 CPU 數切 strip。
+    """
+    if cv2.getNumThreads() > 1:
+        return 1
+    return workers or os.cpu_count() or 1
+
+
+def compute_strips(imgL, imgR, make_stereo, strips=None, workers=None, margin=None):
+    """
+    將影像切成水平 strip (上下各多留 margin 列)，在 thread pool 上分別計算後拼接。
+    StereoBM 的每個輸出像素只依賴鄰近 margin 列，且 speckle filter 預設關閉，
+    因此結果與整張一次計算完全相同。make_stereo() 每個 strip 建立一個 matcher (matcher 不是 thread-safe)。
+    margin 為 None 時由 StereoBM 的參數計算；其他 matcher (SGBM) 需自行指定。
+    strips 為 None 時見 default_strips。
+    """
+    h = imgL.shape[0]
+    workers = workers or os.cpu_count() or 1
+    strips = max(1, min(strips or default_strips(workers), h))
+    if margin is None:
+        margin = strip_margin(make_stereo())
+    bounds = [(h * i // strips, h * (i + 1) // strips) for i in range(strips)]
+
+    def work(bound):
+        y0, y1 = bound
+        top, bottom = max(0, y0 - margin), min(h, y1 + margin)
+        # StereoBM 對最後一列有效列的處理與 strip 高度的奇偶有關，
+        # 讓 strip 起點為偶數列，使最下方 strip 與整張影像的奇偶一致
+        top -= top % 2
+        disp = make_stereo().compute(imgL[top:bottom], imgR[top:bottom])
+        return disp[y0 - top:y1 - top]
+
+    if strips == 1:
+        return make_stereo().compute(imgL, imgR)
+
+    disparity = np.empty(imgL.shape[:2], np.int16)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for (y0, y1), part in zip(bounds, pool.map(work, bounds)):
+            disparity[y0:y1] = part
+    return disparity
+
+
+def _round_up16(n):
+    return max(16, (n + 15) // 16 * 16)
+
+
+def estimate_disparity_range(imgL, imgR, num_disparities, block_size, workers=None):
+    """
+    在縮小一半的影像上計算視差，估計實際使用到的視差範圍 (全解析度)。
+    回傳 (min_disparity, num_disparities)；找不到有效視差時回傳 None。
+    """
+    smallL, smallR = cv2.pyrDown(imgL), cv2.pyrDown(imgR)
+    small_num = _round_up16(num_disparities // 2)
+    small_block = max(5, (block_size // 2) | 1)
+    disp = compute_strips(smallL, smallR, lambda: _make_bm(small_num, small_block), workers=workers)
+    valid = disp[disp > 0].astype(np.float32) / 16.0
+    if valid.size == 0:
+        return None
+    # 排除少量離群值後放大回全解析度，並保留安全邊界
+    lo, hi = np.percentile(valid, [1, 99]) * 2
+    pad = 8
+    min_disp = max(0, int(np.floor(lo)) - pad)
+    max_disp = min(num_disparities, int(np.ceil(hi)) + pad)
+    return min_disp, _round_up16(max_disp - min_disp)
+
+
+def compute_disparity(imgL, imgR, num_disparities=NUM_DISPARITIES, block_size=BLOCK_SIZE,
+                      strips=None, workers=None, pyramid=False):
+    """
+    Q3 的 StereoBM 視差計算 (輸出為 int16，單位 1/16 像素，與 StereoBM.compute 相同)。
+    strips/workers 控制平行切片 (結果與單次計算相同)；
+    pyramid=True 時先在半解析度估計視差範圍再縮小全解析度的搜尋範圍，
+    速度更快但範圍外的像素會變成無效值 (誤差有界)。
+    """
+    min_disp = 0
+    if pyramid:
+        with span("disparity.range"):
+            disp_range = estimate_disparity_range(imgL, imgR, num_disparities, block_size, workers)
+        if disp_range is not None:
+            min_disp, num_disparities = disp_range
+    with span("disparity", num_disparities=num_disparities):
+        disparity = compute_strips(imgL, imgR, lambda: _make_bm(num_disparities, block_size, min_disp), strips, workers)
+    if min_disp > 0:
+        # StereoBM 的無效值為 (minDisparity - 1) * 16，統一成 min_disp=0 時的 -16
+        disparity[disparity < min_disp * 16] = -16
+    return disparity
+
+
+def estimate_memory(mode, shape, num_disparities=NUM_DISPARITIES, block_size=BLOCK_SIZE, threads=None):
+    """
+    估計一次 matcher.compute 的工作記憶體 (bytes)，不含輸入/輸出影像。
+    sgbm_hh / sgbm_hh4 保存整張 cost volume 與累積 cost (各 W*H*D 個 int16)，與影像高度成正比；
+    其餘模式只需每列 (或每個執行緒) 的 W*D buffer，切 strip 無法減少。
+    """
+    h, w = shape[:2]
+    threads = threads or cv2.getNumThreads() or 1
+    if mode == "bm":
+        # 每個執行緒一組 W*D 的 int32 cost 與 SAD buffer
+        return w * num_disparities * 4 * 2 * threads
+    block = min(block_size, SGBM_MAX_BLOCK)
+    row = w * num_disparities * 2
+    sgbm_mode = "sgbm" if mode in ("lrc", "wls") else mode
+    if sgbm_mode in ("sgbm_hh", "sgbm_hh4"):
+        return 2 * row * h
+    if sgbm_mode == "sgbm_3way":
+        return row * (block // 2 + 2) * threads
+    return row * (block + 8)
+
+
+def _extra_memory(mode, shape):
+    # 一致性檢查/WLS 需要額外保存右視差 (int16) 與 WLS 的浮點暫存影像
+    h, w = shape[:2]
+    if mode == "lrc":
+        return h * w * 2
+    if mode == "wls":
+        return h * w * 2 + h * w * 4 * 8
+    return 0
+
+
+def plan_strips(mode, shape, num_disparities=NUM_DISPARITIES, block_size=BLOCK_SIZE,
+                memory_budget=MEMORY_BUDGET, workers=None):
+    """
+    依記憶體上限決定 (strips, workers, 估計峰值 bytes)。
+    整張計算的估計值在上限內時不切割 (SGBM 本身已以 OpenCV 執行緒平行)；
+    超過時選擇最少的 strip 數，使單一 strip 的 cost volume 在上限內，並限制同時計算的 strip 數。
+    bm 的 strip 數見 default_strips。上限內無法完成時丟出 RuntimeError。
+    """
+    h = shape[0]
+    workers = workers or os.cpu_count() or 1
+    extra = _extra_memory(mode, shape)
+    if mode == "bm":
+        strips = max(1, min(default_strips(workers), h))
+        if strips == 1:
+            # 不切 strip 時由 OpenCV 的執行緒平行
+            return 1, 1, estimate_memory(mode, shape, num_disparities, block_size) + extra
+        per_strip = estimate_memory(mode, shape, num_disparities, block_size, threads=1)
+        return strips, min(workers, strips), per_strip * min(workers, strips) + extra
+    full = estimate_memory(mode, shape, num_disparities, block_size) + extra
+    if memory_budget is None or full <= memory_budget:
+        return 1, 1, full
+
+    # 只有 cost volume 與高度成正比的模式，切 strip 才能降低記憶體
+    margin = max(SGBM_STRIP_MARGIN, block_size)
+    if mode in ("sgbm_hh", "sgbm_hh4"):
+        for strips in range(2, max(2, h // margin) + 1):
+            rows = min(h, -(-h // strips) + 2 * margin)
+            per_strip = estimate_memory(mode, (rows,) + tuple(shape[1:]), num_disparities, block_size, threads=1)
+            if per_strip + extra <= memory_budget:
+                concurrent = max(1, min(workers, strips, (memory_budget - extra) // per_strip))
+                return strips, concurrent, per_strip * concurrent + extra
+    raise RuntimeError(f"Disparity mode '{mode}' needs about {full / 2 ** 20:.0f} MB, "
+                       f"exceeding the memory budget of {memory_budget / 2 ** 20:.0f} MB")
+
+
+def _peak_rss():
+    # 行程的最高常駐記憶體 (bytes)；Linux 的 ru_maxrss 單位為 KB，macOS 為 bytes
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def left_right_check(disp_left, disp_right, max_diff=1):
+    """
+    左右一致性檢查：左視差 d 的像素 x 對應右影像的 x - d，兩邊視差相差超過 max_diff 像素時設為無效 (-16)。
+    disp_right 為右影像的視差 (正值，單位 1/16 像素)。
+    """
+    h, w = disp_left.shape
+    xs = np.arange(w)[None, :] - np.maximum(disp_left, 0) // 16
+    valid = (disp_left >= 0) & (xs >= 0)
+    matched = np.take_along_axis(disp_right, np.clip(xs, 0, w - 1), axis=1)
+    valid &= (matched >= 0) & (np.abs(disp_left.astype(np.int32) - matched) <= max_diff * 16)
+    checked = disp_left.copy()
+    checked[~valid] = -16
+    return checked
+
+
+def _right_disparity(imgL, imgR, make_left, strips, workers, margin):
+    # 左右翻轉後以同一 matcher 計算右影像的視差 (不需要 ximgproc)
+    flipped = compute_strips(imgR[:, ::-1].copy(), imgL[:, ::-1].copy(), make_left, strips, workers, margin)
+    return flipped[:, ::-1].copy()
+
+
+def compute_disparity_mode(imgL, imgR, mode="bm", num_disparities=NUM_DISPARITIES, block_size=BLOCK_SIZE,
+                           memory_budget=MEMORY_BUDGET, workers=None, pyramid=False):
+    """
+    依 mode 計算視差 (int16，單位 1/16 像素，無效值 -16)，回傳 (disparity, report)。
+    report 包含模式、strip 數、同時計算數、估計峰值記憶體、行程峰值記憶體的增加量與各階段耗時 (秒)。
+    sgbm 系列超過 memory_budget 時改為 strip 計算 (接縫附近的結果為近似)。
+    """
+    if mode not in DISPARITY_MODES:
+        raise ValueError(f"Unknown disparity mode: {mode}")
+    if mode == "wls" and not hasattr(cv2, "ximgproc"):
+        print("cv2.ximgproc is not available (needs opencv-contrib-python), using left-right check instead of WLS.")
+        mode = "lrc"
+    strips, concurrent, estimate = plan_strips(mode, imgL.shape, num_disparities, block_size, memory_budget, workers)
+    report = {"mode": mode, "strips": strips, "workers": concurrent, "estimated_bytes": estimate,
+              "budget_bytes": memory_budget, "timings": {}}
+    rss_before = _peak_rss()
+
+    start = time.perf_counter()
+    if mode == "bm":
+        disparity = compute_disparity(imgL, imgR, num_disparities, block_size, strips, workers, pyramid)
+        report["timings"]["disparity"] = time.perf_counter() - start
+    else:
+        sgbm_mode = "sgbm" if mode in ("lrc", "wls") else mode
+        make_left = lambda: _make_sgbm(num_disparities, block_size, sgbm_mode)
+        margin = max(SGBM_STRIP_MARGIN, block_size)
+        with span("disparity", mode=mode, strips=strips):
+            disparity = compute_strips(imgL, imgR, make_left, strips, concurrent, margin)
+        report["timings"]["disparity"] = time.perf_counter() - start
+
+        if mode == "lrc":
+            start = time.perf_counter()
+            with span("disparity.right", mode=mode):
+                disp_right = _right_disparity(imgL, imgR, make_left, strips, concurrent, margin)
+            with span("disparity.filter", mode=mode):
+                disparity = left_right_check(disparity, disp_right)
+            report["timings"]["right_check"] = time.perf_counter() - start
+        elif mode == "wls":
+            start = time.perf_counter()
+            with span("disparity.right", mode=mode):
+                # createRightMatcher 的右視差為負值，正是 WLS filter 需要的格式
+                make_right = lambda: cv2.ximgproc.createRightMatcher(make_left())
+                disp_right = compute_strips(imgR, imgL, make_right, strips, concurrent, margin)
+            report["timings"]["right"] = time.perf_counter() - start
+            start = time.perf_counter()
+            with span("disparity.filter", mode=mode):
+                wls = cv2.ximgproc.createDisparityWLSFilter(make_left())
+                wls.setLambda(WLS_LAMBDA)
+                wls.setSigmaColor(WLS_SIGMA)
+                disparity = wls.filter(disparity, imgL, disparity_map_right=disp_right)
+                # 信心度低的像素視為無效
+                disparity[wls.getConfidenceMap() < 1] = -16
+            report["timings"]["filter"] = time.perf_counter() - start
+
+    rss_after = _peak_rss()
+    report["peak_rss_growth_bytes"] = rss_after - rss_before if rss_before is not None else None
+    report["valid_ratio"] = float((disparity >= 0).mean())
+    return disparity, report
+
+
+def format_report(report):
+    # 例如 "sgbm_hh: strips 2, workers 1, ~720 MB (budget 1024 MB), disparity 812.3 ms, valid 87.1%"
+    budget = report["budget_bytes"]
+    parts = [f"{report['mode']}: strips {report['strips']}, workers {report['workers']}",
+             f"~{report['estimated_bytes'] / 2 ** 20:.0f} MB" +
+             (f" (budget {budget / 2 ** 20:.0f} MB)" if budget is not None else "")]
+    if report.get("peak_rss_growth_bytes") is not None:
+        parts.append(f"peak RSS +{report['peak_rss_growth_bytes'] / 2 ** 20:.0f} MB")
+    parts += [f"{stage} {elapsed * 1000:.1f} ms" for stage, elapsed in report["timings"].items()]
+    parts.append(f"valid {report['valid_ratio'] * 100:.1f}%")
+    return ", ".join(parts)
+
+
+def disparity_to_display(disparity):
+    """
+    將視差轉成顯示用的 uint8：只以有效像素 (>= 0) 的最小/最大值正規化，無效像素為 0。
+    (對整張 int16 做 NORM_MINMAX 時，無效值 -16 會佔用灰階範圍)
+    """
+    valid = disparity >= 0
+    display = np.zeros(disparity.shape, np.uint8)
+    if not valid.any():
+        return display
+    values = disparity[valid].astype(np.float32)
+    lo, hi = values.min(), values.max()
+    display[valid] = np.round((values - lo) * (255.0 / max(hi - lo, 1))).astype(np.uint8)
+    return display
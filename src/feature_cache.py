@@ -0,0 +1,135 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from src.profiling import span
+
+# SIFT 預設參數 (與 cv2.SIFT_create() 相同)
+DEFAULT_SIFT_PARAMS = (("nfeatures", 0), ("nOctaveLayers", 3), ("contrastThreshold", 0.04),
+                       ("edgeThreshold", 10), ("sigma", 1.6))
+
+
+def keypoints_to_arrays(keypoints):
+    """
+    將 cv2.KeyPoint 清單轉成 numpy 陣列：
+    (N, 5) float32 [x, y, size, angle, response] 與 (N, 2) int32 [octave, class_id]。
+    """
+    floats = np.array([(*kp.pt, kp.size, kp.angle, kp.response) for kp in keypoints], np.float32).reshape(-1, 5)
+    ints = np.array([(kp.octave, kp.class_id) for kp in keypoints], np.int32).reshape(-1, 2)
+    return floats, ints
+
+
+def arrays_to_keypoints(floats, ints):
+    return [cv2.KeyPoint(float(x), float(y), float(size), float(angle), float(response), int(octave), int(class_id))
+            for (x, y, size, angle, response), (octave, class_id) in zip(floats, ints)]
+
+
+_local = threading.local()
+
+
+def get_sift(params=DEFAULT_SIFT_PARAMS):
+    # 每個執行緒、每組參數共用一個 SIFT 物件，不必每次都 SIFT_create()
+    if not hasattr(_local, "sift"):
+        _local.sift = {}
+    if params not in _local.sift:
+        _local.sift[params] = cv2.SIFT_create(**dict(params))
+    return _local.sift[params]
+
+
+class FeatureCache:
+    """
+    行程共用的 SIFT 特徵快取，key 為「影像內容 hash + SIFT 參數」。
+    KeyPoint 以 numpy 陣列保存；超過 max_bytes 時淘汰最久未使用的項目，
+    若設定 spill_dir 則淘汰的項目會寫入磁碟 (.npz)，之後可直接讀回。
+    """
+    def __init__(self, max_bytes=256 * 1024 * 1024, spill_dir=None):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self._entries = OrderedDict()  # key -> (floats, ints, descriptors)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(image, params=DEFAULT_SIFT_PARAMS):
+        h = hashlib.sha1(np.ascontiguousarray(image).data)
+        h.update(f"{image.shape}{image.dtype}{params}".encode())
+        return h.hexdigest()
+
+    def compute(self, image, params=DEFAULT_SIFT_PARAMS):
+        """
+        回傳 (keypoints, descriptors)，與 sift.detectAndCompute(gray, None) 相同。
+        image 可以是彩色 (BGR) 或灰階影像。
+        """
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        key = self.make_key(gray, params)
+        entry = self._get(key)
+        if entry is None:
+            self.misses += 1
+            with span("sift.detect_describe"):
+                keypoints, descriptors = get_sift(params).detectAndCompute(gray, None)
+            floats, ints = keypoints_to_arrays(keypoints)
+            self._put(key, (floats, ints, descriptors))
+            return keypoints, descriptors
+        self.hits += 1
+        floats, ints, descriptors = entry
+        return arrays_to_keypoints(floats, ints), descriptors
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+        entry = self._load_spilled(key)
+        if entry is not None:
+            self._put(key, entry)
+        return entry
+
+    def _put(self, key, entry):
+        size = sum(a.nbytes for a in entry if a is not None)
+        evicted = []
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = entry
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, old_entry = self._entries.popitem(last=False)
+                self._bytes -= sum(a.nbytes for a in old_entry if a is not None)
+                evicted.append((old_key, old_entry))
+        for old_key, old_entry in evicted:
+            self._spill(old_key, old_entry)
+
+    def _spill_path(self, key):
+        return os.path.join(self.spill_dir, f"{key}.npz")
+
+    def _spill(self, key, entry):
+        if self.spill_dir is None:
+            return
+        os.makedirs(self.spill_dir, exist_ok=True)
+        floats, ints, descriptors = entry
+        if descriptors is None:
+            descriptors = np.empty((0, 128), np.float32)
+        np.savez(self._spill_path(key), floats=floats, ints=ints, descriptors=descriptors)
+
+    def _load_spilled(self, key):
+        if self.spill_dir is None or not os.path.exists(self._spill_path(key)):
+            return None
+        with np.load(self._spill_path(key)) as data:
+            descriptors = data["descriptors"] if len(data["descriptors"]) else None
+            return data["floats"], data["ints"], descriptors
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+# 整個行程共用的快取 (Q4 的兩張影像共用)
+feature_cache = FeatureCache()
@@ -0,0 +1,234 @@
+import json
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from src.image_source import list_images
+from src.profiling import span
+
+DESCRIPTOR_DIM = 128
+
+# FLANN KD-tree 參數 (algorithm=1 為 FLANN_INDEX_KDTREE)
+FLANN_INDEX_PARAMS = dict(algorithm=1, trees=4)
+FLANN_SEARCH_PARAMS = dict(checks=64)
+# 查詢時每個特徵取的鄰居數；ratio test 在每張影像內各自進行 (見 FeatureIndex.query)
+QUERY_NEIGHBORS = 10
+# uint8 descriptors 轉成 float32 時每次處理的列數 (128 維 float32 約 32 MB)
+CONVERT_CHUNK_ROWS = 65536
+
+_local = threading.local()
+
+
+def _sift():
+    # cv2.SIFT 物件不是 thread-safe，每個執行緒各自建立一個
+    if not hasattr(_local, "sift"):
+        _local.sift = cv2.SIFT_create()
+    return _local.sift
+
+
+def extract_sift(image_path, max_features=None):
+    """
+    回傳 (keypoint 座標 (N, 2) float32, descriptors (N, 128) float32)。
+    """
+    with span("decode"):
+        gray = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        print(f"Warning: Could not read {image_path}")
+        return np.empty((0, 2), np.float32), np.empty((0, DESCRIPTOR_DIM), np.float32)
+    with span("sift.detect_describe"):
+        keypoints, descriptors = _sift().detectAndCompute(gray, None)
+    if descriptors is None:
+        return np.empty((0, 2), np.float32), np.empty((0, DESCRIPTOR_DIM), np.float32)
+    if max_features is not None and len(keypoints) > max_features:
+        # 只保留 response 最強的特徵點
+        order = np.argsort([-kp.response for kp in keypoints])[:max_features]
+        keypoints = [keypoints[i] for i in order]
+        descriptors = descriptors[order]
+    points = np.array([kp.pt for kp in keypoints], np.float32).reshape(-1, 2)
+    return points, descriptors
+
+
+def ratio_test(distances, ratio=0.75, squared=False):
+    """
+    向量化的 Lowe ratio test。distances 為 (N, 2) 的最近/次近距離，回傳布林遮罩。
+    squared=True 表示距離為平方 L2 (FLANN KD-tree 的輸出)。
+    """
+    distances = np.asarray(distances, np.float32)
+    r = ratio * ratio if squared else ratio
+    return distances[:, 0] < r * distances[:, 1]
+
+
+class FeatureIndex:
+    """
+    整個資料夾的 SIFT 特徵索引。
+    descriptors 依序存成一個 memory-mapped 檔案 (float32，FLANN 直接使用，不需要複製；
+    或 quantize=True 時為 uint8，SIFT descriptor 的值域本來就在 0~255，量化誤差很小)，
+    再以 FLANN KD-tree 回答「哪些影像與查詢影像相符」。
+    """
+    META_FILE = "index.json"
+    DESC_FILE = "descriptors.bin"
+    POINTS_FILE = "points.npy"
+    FLANN_FILE = "flann.idx"
+    FEATURES_FILE = "features.f32"  # 量化索引給 FLANN 用的 float32 副本 (第一次查詢時建立)
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, self.META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.paths = meta["paths"]
+        self.offsets = np.asarray(meta["offsets"], np.int64)  # 長度為影像數 + 1
+        self.dtype = np.dtype(meta["dtype"])
+        total = int(self.offsets[-1])
+        self.descriptors = np.memmap(os.path.join(index_dir, self.DESC_FILE), self.dtype, "r", shape=(total, DESCRIPTOR_DIM)) \
+            if total else np.empty((0, DESCRIPTOR_DIM), self.dtype)
+        self.points = np.load(os.path.join(index_dir, self.POINTS_FILE), mmap_mode="r")
+        self.owner = np.repeat(np.arange(len(self.paths)), np.diff(self.offsets))
+        self._flann = None
+
+    @classmethod
+    def build(cls, images, index_dir, quantize=False, max_features=None, workers=None, progress=None):
+        """
+        對 images (資料夾或路徑清單) 抽取 SIFT 並寫入 index_dir，回傳 FeatureIndex。
+        descriptors 逐張寫入檔案，不會同時把整個資料夾的特徵放在記憶體中。
+        quantize=True 的 descriptors.bin 只有 1/4 大小 (適合傳輸/封存各份索引)，
+        但第一次查詢時會建立 4 倍大小的 float32 副本 features.f32 給 FLANN 使用，
+        查詢過的索引總共約佔 float32 索引的 1.25 倍磁碟空間。
+        """
+        if isinstance(images, str):
+            images = list_images(images)
+        images = list(images)
+        os.makedirs(index_dir, exist_ok=True)
+        dtype = np.uint8 if quantize else np.float32
+
+        offsets = [0]
+        all_points = []
+        with open(os.path.join(index_dir, cls.DESC_FILE), "wb") as desc_file, \
+                ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            for i, (points, descriptors) in enumerate(pool.map(lambda p: extract_sift(p, max_features), images)):
+                if quantize:
+                    descriptors = np.clip(np.rint(descriptors), 0, 255)
+                desc_file.write(np.ascontiguousarray(descriptors, dtype).tobytes())
+                all_points.append(points)
+                offsets.append(offsets[-1] + len(descriptors))
+                if progress is not None:
+                    progress(i + 1, len(images))
+
+        np.save(os.path.join(index_dir, cls.POINTS_FILE),
+                np.concatenate(all_points) if all_points else np.empty((0, 2), np.float32))
+        with open(os.path.join(index_dir, cls.META_FILE), "w", encoding="utf-8") as f:
+            json.dump({"paths": [os.path.abspath(p) for p in images], "offsets": offsets,
+                       "dtype": np.dtype(dtype).name}, f)
+        cls._remove_derived(index_dir)
+        return cls(index_dir)
+
+    @classmethod
+    def merge(cls, shard_dirs, index_dir):
+        """
+        將多個索引 (例如 --shard 分散建立的各份) 合併成一個，回傳 FeatureIndex。
+        descriptors 以檔案串流複製，不會整個載入記憶體。所有索引的 dtype 必須相同。
+        """
+        shards = [cls(d) for d in shard_dirs]
+        if not shards:
+            raise ValueError("No indexes to merge")
+        dtypes = {shard.dtype for shard in shards}
+        if len(dtypes) > 1:
+            raise ValueError(f"Cannot merge indexes with different descriptor types: {sorted(d.name for d in dtypes)}")
+        os.makedirs(index_dir, exist_ok=True)
+
+        paths, offsets = [], [0]
+        with open(os.path.join(index_dir, cls.DESC_FILE), "wb") as desc_file:
+            for shard in shards:
+                with open(os.path.join(shard.index_dir, cls.DESC_FILE), "rb") as f:
+                    shutil.copyfileobj(f, desc_file)
+                paths.extend(shard.paths)
+                base = offsets[-1]
+                offsets.extend(base + int(o) for o in shard.offsets[1:])
+        np.save(os.path.join(index_dir, cls.POINTS_FILE),
+                np.concatenate([np.asarray(shard.points) for shard in shards]))
+        with open(os.path.join(index_dir, cls.META_FILE), "w", encoding="utf-8") as f:
+            json.dump({"paths": paths, "offsets": offsets, "dtype": shards[0].dtype.name}, f)
+        cls._remove_derived(index_dir)
+        return cls(index_dir)
+
+    @classmethod
+    def _remove_derived(cls, index_dir):
+        # descriptors 改變後，舊的 KD-tree 與 float32 副本都不再有效
+        for name in (cls.FLANN_FILE, cls.FEATURES_FILE):
+            path = os.path.join(index_dir, name)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _float_features(self):
+        """
+        回傳 FLANN 用的 float32 descriptors (memory-mapped)。
+        float32 索引直接使用原本的檔案；uint8 索引第一次使用時分塊轉成 FEATURES_FILE，
+        不會在記憶體中建立整個索引的 float32 副本 (資料由作業系統分頁載入，可被換出)。
+        """
+        if self.dtype == np.float32 or len(self.owner) == 0:
+            return np.ascontiguousarray(self.descriptors, np.float32)
+        path = os.path.join(self.index_dir, self.FEATURES_FILE)
+        shape = self.descriptors.shape
+        if not os.path.exists(path) or os.path.getsize(path) != shape[0] * shape[1] * 4:
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                for start in range(0, shape[0], CONVERT_CHUNK_ROWS):
+                    f.write(self.descriptors[start:start + CONVERT_CHUNK_ROWS].astype(np.float32).tobytes())
+            os.replace(tmp_path, path)
+        return np.memmap(path, np.float32, "r", shape=shape)
+
+    def _get_flann(self):
+        # FLANN 需要 float32 的連續陣列 (memory-mapped，見 _float_features)；KD-tree 建立一次後存檔，之後直接載入
+        if self._flann is None:
+            features = self._float_features()
+            flann_path = os.path.join(self.index_dir, self.FLANN_FILE)
+            self._flann = cv2.flann_Index()
+            if not (os.path.exists(flann_path) and self._flann.load(features, flann_path)):
+                self._flann = cv2.flann_Index(features, FLANN_INDEX_PARAMS)
+                self._flann.save(flann_path)
+            self._features = features  # FLANN 不會複製資料，必須保留參考
+        return self._flann
+
+    def query(self, descriptors, top_k=5, ratio=0.75, min_votes=1):
+        """
+        以查詢影像的 descriptors 搜尋整個索引。
+        每個查詢特徵取 QUERY_NEIGHBORS 個最近鄰，ratio test 在每張影像內各自進行
+        (該影像最近的特徵 vs 該影像次近的特徵，與兩張影像之間的匹配相同)，通過者投票給該影像。
+        若用全域的最近/次近，集合中有近似重複的影像 (影片幀、連拍、重新存檔) 時兩者來自不同的複本，
+        比值接近 1，正確的影像反而拿不到票。
+        回傳 [(影像路徑, 票數), ...]，依票數遞減排序。
+        """
+        if descriptors is None or len(descriptors) == 0 or len(self.owner) < 2:
+            return []
+        flann = self._get_flann()
+        k = min(QUERY_NEIGHBORS, len(self.owner))
+        with span("sift.match", queries=len(descriptors)):
+            indices, distances = flann.knnSearch(np.ascontiguousarray(descriptors, np.float32), k, params=FLANN_SEARCH_PARAMS)
+            owners = self.owner[indices]
+            voters = []
+            for j in range(k):
+                # 只看每張影像在鄰居中第一次出現 (最近) 的位置
+                first = ~(owners[:, :j] == owners[:, j:j + 1]).any(axis=1)
+                # 同一張影像的次近特徵；不在鄰居中時，第 k 個鄰居的距離是它的下界
+                same = owners[:, j + 1:] == owners[:, j:j + 1]
+                second = distances[:, -1].copy()
+                has_second = same.any(axis=1)
+                if has_second.any():
+                    second[has_second] = distances[:, j + 1:][has_second, same[has_second].argmax(axis=1)]
+                good = first & ratio_test(np.column_stack([distances[:, j], second]), ratio, squared=True)
+                voters.append(owners[good, j])
+        votes = np.bincount(np.concatenate(voters), minlength=len(self.paths))
+        order = np.argsort(-votes, kind="stable")[:top_k]
+        return [(self.paths[i], int(votes[i])) for i in order if votes[i] >= min_votes]
+
+    def query_image(self, image_path, **kwargs):
+        _, descriptors = extract_sift(image_path)
+        return self.query(descriptors, **kwargs)
+
+    def image_features(self, i):
+        # 第 i 張影像的 (座標, descriptors) (memory-mapped，不會整個載入)
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.points[start:end], self.descriptors[start:end]
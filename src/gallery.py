@@ -0,0 +1,163 @@
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, QSize, Qt
+from PyQt5.QtGui import QImage, QPixmap
+from PyQt5.QtWidgets import QDockWidget, QLabel, QListView, QScrollArea, QSplitter, QVBoxLayout, QWidget
+
+# Qt 5.14 之後才有 BGR888，舊版只能先轉成 RGB (會多一次複製)
+_BGR888 = getattr(QImage, "Format_BGR888", None)
+
+
+def numpy_to_qimage(img):
+    """
+    將 OpenCV 影像 (灰階 / BGR / BGRA, uint8) 包成 QImage，直接共用 numpy 的記憶體而不複製。
+    QImage 會保留 numpy 陣列的參考 (qimage.ndarray)，呼叫端之後不可再修改該陣列。
+    非 uint8 的影像 (例如視差) 會先以 NORM_MINMAX 正規化。
+    """
+    # 第一次顯示影像時才匯入 (主視窗啟動時不需要 OpenCV)
+    import cv2
+    import numpy as np
+
+    if img.dtype != np.uint8:
+        img = cv2.normalize(img, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+    if img.ndim == 3 and img.shape[2] == 1:
+        img = img[:, :, 0]
+    if img.ndim == 3 and img.shape[2] == 3 and _BGR888 is None:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    # QImage 要求每列連續 (列之間可以有 padding，但像素必須連續)
+    if img.strides[-1] != img.itemsize or (img.ndim == 3 and img.strides[1] != img.shape[2]):
+        img = np.ascontiguousarray(img)
+
+    h, w = img.shape[:2]
+    if img.ndim == 2:
+        fmt = QImage.Format_Grayscale8
+    elif img.shape[2] == 3:
+        fmt = _BGR888 if _BGR888 is not None else QImage.Format_RGB888
+    elif img.shape[2] == 4:
+        fmt = QImage.Format_ARGB32  # little-endian 的 ARGB32 在記憶體中即為 BGRA
+    else:
+        raise ValueError(f"Unsupported image shape: {img.shape}")
+    qimage = QImage(img.data, w, h, img.strides[0], fmt)
+    qimage.ndarray = img  # QImage 不擁有這塊記憶體，必須保留 numpy 陣列
+    return qimage
+
+
+class ImageListModel(QAbstractListModel):
+    """
+    結果影像的清單 model。縮圖在 view 第一次要求 (項目真正可見) 時才產生並快取。
+    """
+    def __init__(self, thumb_size=160, parent=None):
+        super().__init__(parent)
+        self.thumb_size = thumb_size
+        self._items = []  # [title, QImage, 縮圖 QPixmap 或 None]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._items)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        item = self._items[index.row()]
+        title, qimage, thumb = item
+        if role == Qt.DisplayRole:
+            return title
+        if role == Qt.DecorationRole:
+            if thumb is None:
+                thumb = item[2] = QPixmap.fromImage(qimage.scaled(
+                    self.thumb_size, self.thumb_size, Qt.KeepAspectRatio, Qt.SmoothTransformation))
+            return thumb
+        if role == Qt.ToolTipRole:
+            return f"{title} ({qimage.width()}x{qimage.height()})"
+        if role == Qt.UserRole:
+            return qimage
+        return None
+
+    def add(self, qimage, title):
+        row = len(self._items)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._items.append([title, qimage, None])
+        self.endInsertRows()
+        return self.index(row)
+
+    def clear(self):
+        self.beginResetModel()
+        self._items.clear()
+        self.endResetModel()
+
+
+class GalleryWidget(QWidget):
+    """
+    顯示處理結果的影像庫：上方為大圖，下方為縮圖清單 (點選切換)。
+    add_image() 只包裝影像並插入清單，不等待使用者按鍵，運算可繼續進行。
+    必須在主執行緒呼叫 (例如 TaskScheduler 的 callback)。
+    """
+    def __init__(self, parent=None, thumb_size=160):
+        super().__init__(parent)
+        self.model = ImageListModel(thumb_size, self)
+
+        self.view = QListView(self)
+        self.view.setViewMode(QListView.IconMode)
+        self.view.setFlow(QListView.LeftToRight)
+        self.view.setWrapping(False)
+        self.view.setResizeMode(QListView.Adjust)
+        self.view.setUniformItemSizes(True)  # 只需詢問可見項目的縮圖
+        self.view.setIconSize(QSize(thumb_size, thumb_size))
+        self.view.setModel(self.model)
+        self.view.selectionModel().currentChanged.connect(self._on_current_changed)
+
+        self.preview = QLabel(self)
+        self.preview.setAlignment(Qt.AlignCenter)
+        scroll = QScrollArea(self)
+        scroll.setWidget(self.preview)
+        scroll.setWidgetResizable(True)
+
+        splitter = QSplitter(Qt.Vertical, self)
+        splitter.addWidget(scroll)
+        splitter.addWidget(self.view)
+        splitter.setStretchFactor(0, 4)
+        splitter.setStretchFactor(1, 1)
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(splitter)
+
+    def add_image(self, img, title, select=True):
+        if img is None:
+            print(f"Error: Image provided to gallery '{title}' is None.")
+            return
+        index = self.model.add(numpy_to_qimage(img), title)
+        if select:
+            self.view.setCurrentIndex(index)
+            self.view.scrollTo(index)
+
+    def clear(self):
+        self.model.clear()
+        self.preview.clear()
+
+    def _on_current_changed(self, current, _previous):
+        if not current.isValid():
+            return
+        qimage = self.model.data(current, Qt.UserRole)
+        self.preview.setPixmap(QPixmap.fromImage(qimage))
+        self.preview.setToolTip(self.model.data(current, Qt.ToolTipRole))
+
+
+class GalleryDock(QDockWidget):
+    """
+    主視窗的結果面板 (預設浮動，收到第一張影像時才顯示)。
+    """
+    def __init__(self, main_window, title="Results"):
+        super().__init__(title, main_window)
+        self.setObjectName("galleryDock")
+        self.gallery = GalleryWidget(self)
+        self.setWidget(self.gallery)
+        main_window.addDockWidget(Qt.RightDockWidgetArea, self)
+        self.setFloating(True)
+        self.resize(1000, 800)
+        self.hide()
+
+    def add_image(self, img, title, select=True):
+        self.gallery.add_image(img, title, select)
+        if not self.isVisible():
+            self.show()
+        self.raise_()
+
+    def clear(self):
+        self.gallery.clear()
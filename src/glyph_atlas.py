@@ -0,0 +1,88 @@
+"""
+Q2 字母資料庫的二進位格式 (glyph atlas)：
+
+    header  : magic "CVHWGLY1", uint32 字元數, uint32 總點數,
+              int64 來源檔 mtime (ns), int64 來源檔大小
+    index   : 每個字元一筆 (名稱 S16, 起點 uint32, 點數 uint32)
+    segments: (總點數, 3) float32，所有字元的線段端點連續存放 (16 byte 對齊)
+
+segments 以 np.memmap 讀取，不需解析文字，各字元只是其中一段的 view。
+"""
+import os
+
+import numpy as np
+
+ATLAS_MAGIC = b"CVHWGLY1"
+ATLAS_EXT = ".glyphs"
+_HEADER = np.dtype([("magic", "S8"), ("count", "<u4"), ("points", "<u4"), ("mtime_ns", "<i8"), ("size", "<i8")])
+_INDEX = np.dtype([("name", "S16"), ("start", "<u4"), ("count", "<u4")])
+
+
+def atlas_path_for(db_path):
+    # alphabet_db_onboard.txt -> alphabet_db_onboard.glyphs
+    return os.path.splitext(db_path)[0] + ATLAS_EXT
+
+
+def _data_offset(count):
+    offset = _HEADER.itemsize + count * _INDEX.itemsize
+    return (offset + 15) // 16 * 16
+
+
+def write_atlas(glyphs, atlas_path, source_path=None):
+    """
+    將 {字元: (N, 3) float32} 寫成 atlas。source_path 的 mtime/大小會記錄在 header，用於檢查是否過期。
+    先寫入暫存檔再改名，其他行程不會讀到寫到一半的檔案。
+    """
+    names = sorted(glyphs)
+    index = np.zeros(len(names), _INDEX)
+    start = 0
+    for i, name in enumerate(names):
+        index[i] = (name.encode("utf-8"), start, len(glyphs[name]))
+        start += len(glyphs[name])
+
+    header = np.zeros(1, _HEADER)
+    header["magic"] = ATLAS_MAGIC
+    header["count"] = len(names)
+    header["points"] = start
+    if source_path is not None:
+        stat = os.stat(source_path)
+        header["mtime_ns"], header["size"] = stat.st_mtime_ns, stat.st_size
+
+    tmp_path = f"{atlas_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header.tobytes())
+        f.write(index.tobytes())
+        f.write(b"\0" * (_data_offset(len(names)) - f.tell()))
+        for name in names:
+            f.write(np.ascontiguousarray(glyphs[name], np.float32).reshape(-1, 3).tobytes())
+    os.replace(tmp_path, atlas_path)
+    return atlas_path
+
+
+def is_fresh(atlas_path, source_path):
+    # atlas 存在且記錄的來源 mtime/大小與目前的來源檔一致
+    try:
+        header = np.fromfile(atlas_path, _HEADER, count=1)
+        stat = os.stat(source_path)
+    except (OSError, ValueError):
+        return False
+    return (len(header) == 1 and header["magic"][0] == ATLAS_MAGIC
+            and header["mtime_ns"][0] == stat.st_mtime_ns and header["size"][0] == stat.st_size)
+
+
+def read_atlas(atlas_path):
+    """
+    回傳 {字元: (N, 3) float32 唯讀 view}，資料以 memmap 讀取。格式錯誤時丟出 ValueError。
+    """
+    header = np.fromfile(atlas_path, _HEADER, count=1)
+    if len(header) != 1 or header["magic"][0] != ATLAS_MAGIC:
+        raise ValueError(f"Not a glyph atlas: {atlas_path}")
+    count, points = int(header["count"][0]), int(header["points"][0])
+    index = np.fromfile(atlas_path, _INDEX, count=count, offset=_HEADER.itemsize)
+    if len(index) != count:
+        raise ValueError(f"Truncated glyph atlas: {atlas_path}")
+    if points == 0:
+        segments = np.empty((0, 3), np.float32)
+    else:
+        segments = np.memmap(atlas_path, np.float32, "r", offset=_data_offset(count), shape=(points, 3))
+    return {name.decode("utf-8"): segments[start:start + n] for name, start, n in index}
@@ -0,0 +1,194 @@
+import glob
+import os
+import queue
+import re
+import threading
+from collections import OrderedDict
+
+import cv2
+
+from src.profiling import span
+
+IMAGE_EXTS = (".bmp", ".png", ".jpg", ".jpeg", ".tif", ".tiff")
+VIDEO_EXTS = (".mp4", ".avi", ".mov", ".mkv")
+
+
+def natural_key(path):
+    # 依檔名中的數字排序 (1.bmp, 2.bmp, ..., 10.bmp)，非數字檔名也不會出錯
+    name = os.path.basename(path)
+    return [int(t) if t.isdigit() else t.lower() for t in re.split(r"(\d+)", name)]
+
+
+def list_images(folder, exts=IMAGE_EXTS):
+    paths = [p for p in glob.glob(os.path.join(folder, "*")) if p.lower().endswith(exts)]
+    return sorted(paths, key=natural_key)
+
+
+class FrameCache:
+    """
+    已解碼影像的快取 (依 byte 數上限做 LRU 淘汰)，Q1、Q2、Q3 共用。
+    key 為 (路徑, mtime, 解碼 flags)。不同 flags 各自解碼 (解碼器的灰階與 cvtColor 結果不完全相同，
+    回傳結果不可取決於快取中已有哪些版本)。
+    回傳的影像是共用的，呼叫端若要修改請先 copy()。
+    """
+    def __init__(self, max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _lookup(self, key):
+        with self._lock:
+            img = self._entries.get(key)
+            if img is not None:
+                self._entries.move_to_end(key)
+            return img
+
+    def _store(self, key, img):
+        with self._lock:
+            if key in self._entries or img.nbytes > self.max_bytes:
+                return
+            self._entries[key] = img
+            self._bytes += img.nbytes
+            while self._bytes > self.max_bytes:
+                _, old = self._entries.popitem(last=False)
+                self._bytes -= old.nbytes
+
+    def imread(self, path, flags=cv2.IMREAD_COLOR):
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+        key = (os.path.abspath(path), mtime, flags)
+        img = self._lookup(key)
+        if img is not None:
+            return img
+
+        with span("decode"):
+            img = cv2.imread(path, flags)
+        if img is None:
+            return None
+        img.flags.writeable = False  # 避免呼叫端不小心改到快取內容
+        self._store(key, img)
+        return img
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+# 整個行程共用的解碼快取
+frame_cache = FrameCache()
+
+
+def prefetch(iterable, size=2):
+    """
+    在背景執行緒預先讀取 iterable (解碼與計算重疊)，queue 大小限制記憶體用量。
+    """
+    items = queue.Queue(maxsize=size)
+    done = object()
+    stop = threading.Event()
+
+    def producer():
+        try:
+            for item in iterable:
+                if stop.is_set():
+                    return
+                items.put(item)
+        except Exception as e:
+            items.put(e)
+        finally:
+            items.put(done)
+
+    thread = threading.Thread(target=producer, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        # 清空 queue 讓 producer 能結束
+        while thread.is_alive():
+            try:
+                items.get_nowait()
+            except queue.Empty:
+                thread.join(0.05)
+
+
+class ImageSource:
+    """
+    影像資料夾 / 路徑清單 / glob pattern / 影片的延遲讀取來源。
+    迭代時才解碼 (背景執行緒預先讀取 prefetch_size 張)，產生 (name, image)。
+    """
+    def __init__(self, source, grayscale=False, prefetch_size=2, cache=frame_cache):
+        self.video = None
+        if isinstance(source, str) and os.path.isfile(source) and source.lower().endswith(VIDEO_EXTS):
+            self.video = source
+            self.paths = []
+        elif isinstance(source, str) and os.path.isdir(source):
+            self.paths = list_images(source)
+        elif isinstance(source, str):
+            self.paths = sorted(glob.glob(source), key=natural_key)
+        else:
+            self.paths = list(source)
+        self.grayscale = grayscale
+        self.flags = cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR
+        self.prefetch_size = prefetch_size
+        self.cache = cache
+        self.fps = None
+        if self.video is not None:
+            cap = cv2.VideoCapture(self.video)
+            self.fps = cap.get(cv2.CAP_PROP_FPS) or None
+            cap.release()
+
+    def __len__(self):
+        if self.video is not None:
+            cap = cv2.VideoCapture(self.video)
+            count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            cap.release()
+            return count
+        return len(self.paths)
+
+    def read(self, path):
+        if self.cache is not None:
+            return self.cache.imread(path, self.flags)
+        with span("decode"):
+            return cv2.imread(path, self.flags)
+
+    def _frames(self):
+        if self.video is not None:
+            cap = cv2.VideoCapture(self.video)
+            if not cap.isOpened():
+                raise RuntimeError(f"Failed to open video: {self.video}")
+            try:
+                index = 0
+                while True:
+                    with span("decode"):
+                        ok, frame = cap.read()
+                    if not ok:
+                        return
+                    if self.grayscale:
+                        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                    yield f"{index:06d}", frame
+                    index += 1
+            finally:
+                cap.release()
+            return
+
+        for path in self.paths:
+            img = self.read(path)
+            if img is None:
+                print(f"Warning: Could not read {path}")
+                continue
+            yield path, img
+
+    def __iter__(self):
+        if self.prefetch_size > 0:
+            return prefetch(self._frames(), self.prefetch_size)
+        return self._frames()
@@ -0,0 +1,132 @@
+import copy
+
+import cv2
+import numpy as np
+
+from src.corner_engine import BOARD_SIZE, board_object_points
+from src.profiling import span
+
+# 暖啟動時的終止條件 (初始值已接近解，不需要預設的 30 次迭代)
+WARM_CRITERIA = (cv2.TERM_CRITERIA_COUNT + cv2.TERM_CRITERIA_EPS, 10, 1e-6)
+
+
+class IncrementalCalibrator:
+    """
+    增量式相機校準：新的視角加入後，以前一次的內參當初始值
+    (CALIB_USE_INTRINSIC_GUESS) 重新求解，而不是每次都從頭完整求解。
+    每次求解後計算各視角的重投影誤差，誤差超過 max(中位數 * outlier_factor, min_outlier_error)
+    的視角會被自動剔除並重新求解。影像大小由加入的資料決定。
+    與原本的 1.2 相同，只要有 min_views 個視角就能求解；暖啟動與離群剔除則需要至少 min_robust_views 個視角
+    (視角太少時前一次的內參不可靠，誤差的中位數也沒有意義)，不足時從頭求解且不剔除。
+    """
+    def __init__(self, board_size=BOARD_SIZE, outlier_factor=3.0, min_outlier_error=1.0, min_views=1,
+                 min_robust_views=3):
+        self.board_size = board_size
+        self.objpoint = board_object_points(board_size)
+        self.outlier_factor = outlier_factor
+        self.min_outlier_error = min_outlier_error
+        self.min_views = min_views
+        self.min_robust_views = min_robust_views
+
+        self.image_size = None
+        self.names = []          # 參與校準的視角 (依加入順序)
+        self.corners = {}        # name -> corners (包含被剔除的視角)
+        self.rejected = []       # 被判定為離群值的視角
+        self.rms = None
+        self.mat_intri = None
+        self.cof_dist = None
+        self.v_rot = []
+        self.v_trans = []
+        self.per_view_errors = []
+        self._solved_views = 0     # 目前的內參是以幾個視角求得的
+
+    def __contains__(self, name):
+        return name in self.corners
+
+    def copy(self):
+        # 複製清單/字典 (陣列在求解時整個替換，不會就地修改，可以共用)，
+        # 背景執行緒可在副本上求解，不影響主執行緒正在讀取的物件
+        other = copy.copy(self)
+        other.names, other.corners, other.rejected = list(self.names), dict(self.corners), list(self.rejected)
+        other.v_rot, other.v_trans = list(self.v_rot), list(self.v_trans)
+        other.per_view_errors = list(self.per_view_errors)
+        return other
+
+    def add_view(self, name, corners, image_size):
+        # 回傳是否加入了新的視角
+        if self.image_size is None:
+            self.image_size = tuple(image_size)
+        elif tuple(image_size) != self.image_size:
+            raise ValueError(f"Image size {image_size} of '{name}' differs from {self.image_size}")
+        if name in self.corners:
+            return False
+        self.corners[name] = np.asarray(corners, np.float32)
+        self.names.append(name)
+        return True
+
+    def add_results(self, results):
+        # 加入 corner_engine 的 CornerResult (只加入找到角點且尚未加入的影像)，回傳新加入的視角數
+        added = 0
+        for result in results:
+            if result.found and result.path not in self:
+                added += self.add_view(result.path, result.corners, result.image_size)
+        return added
+
+    def _solve(self):
+        object_points = [self.objpoint] * len(self.names)
+        image_points = [self.corners[name] for name in self.names]
+        warm = self.mat_intri is not None and self._solved_views >= self.min_robust_views
+        with span("calibrate", views=len(self.names), warm=warm):
+            if not warm:
+                rms, mat_intri, cof_dist, v_rot, v_trans = cv2.calibrateCamera(
+                    object_points, image_points, self.image_size, None, None)
+            else:
+                rms, mat_intri, cof_dist, v_rot, v_trans = cv2.calibrateCamera(
+                    object_points, image_points, self.image_size, self.mat_intri.copy(), self.cof_dist.copy(),
+                    flags=cv2.CALIB_USE_INTRINSIC_GUESS, criteria=WARM_CRITERIA)
+        self.rms, self.mat_intri, self.cof_dist = rms, mat_intri, cof_dist
+        self._solved_views = len(self.names)
+        self.v_rot, self.v_trans = list(v_rot), list(v_trans)
+        self.per_view_errors = [self._view_error(name, rvec, tvec)
+                                for name, rvec, tvec in zip(self.names, self.v_rot, self.v_trans)]
+
+    def _view_error(self, name, rvec, tvec):
+        projected, _ = cv2.projectPoints(self.objpoint, rvec, tvec, self.mat_intri, self.cof_dist)
+        diff = projected.reshape(-1, 2) - self.corners[name].reshape(-1, 2)
+        return float(np.sqrt((diff ** 2).sum(axis=1).mean()))
+
+    def update(self):
+        """
+        以目前的視角求解 (有前一次結果時暖啟動)，剔除離群視角後回傳 RMS。
+        視角數不足 min_views 時回傳 None。
+        """
+        if len(self.names) < self.min_views:
+            return None
+        self._solve()
+
+        errors = np.asarray(self.per_view_errors)
+        threshold = max(float(np.median(errors)) * self.outlier_factor, self.min_outlier_error)
+        outliers = [name for name, err in zip(self.names, errors) if err > threshold]
+        if outliers and len(self.names) - len(outliers) >= self.min_robust_views:
+            for name in outliers:
+                print(f"Dropping outlier view {name} (reprojection error {errors[self.names.index(name)]:.3f} px)")
+                self.names.remove(name)
+                self.rejected.append(name)
+            self._solve()
+        return self.rms
+
+    def extrinsic(self, name):
+        """
+        回傳視角的 (rvec, tvec)。被剔除的視角以目前的內參 solvePnP 求得。
+        """
+        if name in self.names:
+            i = self.names.index(name)
+            return self.v_rot[i], self.v_trans[i]
+        if name not in self.corners or self.mat_intri is None:
+            return None
+        ok, rvec, tvec = cv2.solvePnP(self.objpoint, self.corners[name], self.mat_intri, self.cof_dist)
+        return (rvec, tvec) if ok else None
+
+    def report(self):
+        # 各視角的重投影誤差 (像素)
+        return list(zip(self.names, self.per_view_errors))
@@ -0,0 +1,189 @@
+import time
+
+import cv2
+import numpy as np
+
+from src.feature_index import FLANN_INDEX_PARAMS, FLANN_SEARCH_PARAMS, ratio_test
+from src.profiling import span
+
+# OpenCV 4.5 之後才有 USAC；舊版退回一般 RANSAC
+ROBUST_METHOD = getattr(cv2, "USAC_MAGSAC", cv2.RANSAC)
+GEOMETRY_MODELS = ("homography", "fundamental", "none")
+# bf: 暴力搜尋 (精確，與原本 Q4 相同)；flann: KD-tree 近似搜尋 (大量特徵點時較快，結果直接是 numpy)
+MATCH_METHODS = ("bf", "flann")
+# bf 的距離矩陣每次計算的大小上限 (bytes)
+BF_CHUNK_BYTES = 64 * 1024 * 1024
+
+
+def keypoint_coords(keypoints):
+    return np.array([kp.pt for kp in keypoints], np.float32).reshape(-1, 2)
+
+
+class MatchResult:
+    """
+    特徵匹配的結果 (numpy 陣列)：每個通過篩選的匹配為 (query_idx[i], train_idx[i], distance[i])。
+    inliers 為幾何驗證的遮罩 (未驗證時為 None)，model 為估計的 H 或 F。
+    counts / timings 記錄各階段剩下的匹配數與耗時 (秒)。
+    """
+    def __init__(self, query_idx, train_idx, distance):
+        self.query_idx = query_idx
+        self.train_idx = train_idx
+        self.distance = distance
+        self.inliers = None
+        self.model = None
+        self.model_type = None
+        self.counts = {}
+        self.timings = {}
+
+    def __len__(self):
+        return len(self.query_idx)
+
+    @property
+    def inlier_count(self):
+        return int(self.inliers.sum()) if self.inliers is not None else len(self)
+
+    def verified(self):
+        # 通過幾何驗證的匹配索引 (未驗證時為全部)
+        if self.inliers is None:
+            return np.arange(len(self))
+        return np.flatnonzero(self.inliers)
+
+    def to_dmatches(self, inliers_only=True):
+        # 轉回 cv2.DMatch (drawMatchesKnn 用的 [[m], ...] 格式)
+        index = self.verified() if inliers_only else np.arange(len(self))
+        return [[cv2.DMatch(int(self.query_idx[i]), int(self.train_idx[i]), float(self.distance[i]))] for i in index]
+
+    def summary(self):
+        text = ", ".join(f"{k} {v}" for k, v in self.counts.items())
+        ms = ", ".join(f"{k} {v * 1000:.1f} ms" for k, v in self.timings.items())
+        return f"{text} ({ms})"
+
+
+def _knn_bf(descriptors1, descriptors2, reverse=False):
+    """
+    以 BLAS 計算平方 L2 距離矩陣 (|a|^2 + |b|^2 - 2ab，依 BF_CHUNK_BYTES 分塊)，
+    一次得到每個查詢的最近/次近鄰，以及 (reverse=True 時) 每個訓練特徵到 descriptors1 的最近距離，
+    不必逐一轉換 cv2.DMatch，也不必為 cross-check 再做一次暴力搜尋。
+    回傳 (query_idx, train_idx, 平方距離 (N, 2), 各訓練特徵的最小平方距離或 None)。
+    """
+    d1 = np.ascontiguousarray(descriptors1, np.float32)
+    d2 = np.ascontiguousarray(descriptors2, np.float32)
+    norms2 = np.einsum("ij,ij->i", d2, d2)
+    rows = max(1, BF_CHUNK_BYTES // (4 * len(d2)))
+    nearest = np.empty((len(d1), 2), np.int32)
+    distances = np.empty((len(d1), 2), np.float32)
+    reverse_dist = np.full(len(d2), np.inf, np.float32) if reverse else None
+    for start in range(0, len(d1), rows):
+        block = d1[start:start + rows]
+        dist = norms2 - 2 * (block @ d2.T)
+        dist += np.einsum("ij,ij->i", block, block)[:, None]
+        np.maximum(dist, 0, out=dist)
+        top2 = np.argpartition(dist, 1, axis=1)[:, :2]
+        top2_dist = np.take_along_axis(dist, top2, axis=1)
+        swap = top2_dist[:, 0] > top2_dist[:, 1]
+        top2[swap] = top2[swap, ::-1]
+        top2_dist[swap] = top2_dist[swap, ::-1]
+        nearest[start:start + len(block)] = top2
+        distances[start:start + len(block)] = top2_dist
+        if reverse:
+            # 沿 axis=0 取最小值是連續記憶體的逐列比較，比 argmin(axis=0) 快很多
+            np.minimum(reverse_dist, dist.min(axis=0), out=reverse_dist)
+    return np.arange(len(d1), dtype=np.int32), nearest[:, 0], distances, reverse_dist
+
+
+def _knn_flann(descriptors1, descriptors2):
+    index = cv2.flann_Index(np.ascontiguousarray(descriptors2, np.float32), FLANN_INDEX_PARAMS)
+    indices, distances = index.knnSearch(np.ascontiguousarray(descriptors1, np.float32), 2, params=FLANN_SEARCH_PARAMS)
+    return np.arange(len(descriptors1), dtype=np.int32), indices[:, 0].astype(np.int32), distances, True
+
+
+def _nearest(descriptors1, queries):
+    # flann 的反方向 (descriptors1 中的最近鄰) 只需要 k=1
+    index = cv2.flann_Index(np.ascontiguousarray(descriptors1, np.float32), FLANN_INDEX_PARAMS)
+    indices, _ = index.knnSearch(np.ascontiguousarray(queries, np.float32), 1, params=FLANN_SEARCH_PARAMS)
+    return indices[:, 0].astype(np.int32)
+
+
+def match_descriptors(descriptors1, descriptors2, ratio=0.75, cross_check=True, method="bf"):
+    """
+    knnMatch (k=2) + 向量化 ratio test，cross_check=True 時再保留互為最近鄰的匹配。
+    回傳 MatchResult (尚未做幾何驗證)。
+    """
+    if method not in MATCH_METHODS:
+        raise ValueError(f"Unknown match method: {method}")
+    timings, counts = {}, {}
+    if len(descriptors1) == 0 or len(descriptors2) < 2:
+        result = MatchResult(np.empty(0, np.int32), np.empty(0, np.int32), np.empty(0, np.float32))
+        result.counts = {"candidates": 0, "ratio": 0}
+        return result
+
+    start = time.perf_counter()
+    with span("sift.match", method=method):
+        reverse = None
+        if method == "flann":
+            query_idx, train_idx, distances, squared = _knn_flann(descriptors1, descriptors2)
+        else:
+            query_idx, train_idx, distances, reverse = _knn_bf(descriptors1, descriptors2, cross_check)
+            squared = True
+        counts["candidates"] = len(query_idx)
+        good = ratio_test(distances, ratio, squared)
+        nearest_dist = distances[good, 0]
+        distance = np.sqrt(nearest_dist) if squared else nearest_dist
+        query_idx, train_idx = query_idx[good], train_idx[good]
+        counts["ratio"] = len(query_idx)
+        timings["match"] = time.perf_counter() - start
+
+        if cross_check and len(query_idx):
+            start = time.perf_counter()
+            if reverse is not None:
+                # bf：同一個距離矩陣的值，查詢點的距離等於該訓練特徵那一欄的最小值即互為最近鄰
+                mutual = nearest_dist <= reverse[train_idx]
+            else:
+                # 只需反查通過 ratio test 的訓練特徵
+                targets, inverse = np.unique(train_idx, return_inverse=True)
+                mutual = _nearest(descriptors1, descriptors2[targets])[inverse] == query_idx
+            query_idx, train_idx, distance = query_idx[mutual], train_idx[mutual], distance[mutual]
+            counts["mutual"] = len(query_idx)
+            timings["cross_check"] = time.perf_counter() - start
+
+    result = MatchResult(query_idx, train_idx, distance)
+    result.counts, result.timings = counts, timings
+    return result
+
+
+def verify_geometry(result, points1, points2, model="homography", threshold=3.0, confidence=0.999):
+    """
+    以 USAC_MAGSAC (或 RANSAC) 估計單應性 (平面場景) 或基本矩陣 (一般場景)，設定 result.inliers/model。
+    匹配數不足 (H 需 4 點、F 需 8 點) 或估計失敗時 inliers 全為 False。
+    """
+    if model == "none":
+        return result
+    if model not in GEOMETRY_MODELS:
+        raise ValueError(f"Unknown geometry model: {model}")
+    start = time.perf_counter()
+    pts1 = points1[result.query_idx]
+    pts2 = points2[result.train_idx]
+    inliers = np.zeros(len(result), bool)
+    estimate = None
+    with span("sift.verify", model=model):
+        if model == "homography" and len(result) >= 4:
+            estimate, mask = cv2.findHomography(pts1, pts2, ROBUST_METHOD, threshold, confidence=confidence)
+        elif model == "fundamental" and len(result) >= 8:
+            estimate, mask = cv2.findFundamentalMat(pts1, pts2, ROBUST_METHOD, threshold, confidence)
+        if estimate is not None and estimate.size:
+            inliers = mask.ravel().astype(bool)
+        else:
+            estimate = None
+    result.model, result.model_type, result.inliers = estimate, model, inliers
+    result.counts["inliers"] = int(inliers.sum())
+    result.timings["verify"] = time.perf_counter() - start
+    return result
+
+
+def match_features(keypoints1, descriptors1, keypoints2, descriptors2, ratio=0.75, cross_check=True,
+                   model="homography", threshold=3.0, method="bf"):
+    """
+    完整的匹配流程：knnMatch -> ratio test -> 互為最近鄰 -> 幾何驗證。
+    """
+    result = match_descriptors(descriptors1, descriptors2, ratio, cross_check, method)
+    return verify_geometry(result, keypoint_coords(keypoints1), keypoint_coords(keypoints2), model, threshold)
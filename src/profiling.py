@@ -0,0 +1,209 @@
+import bisect
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# 設定環境變數 CVHW1_PROFILE=1 時啟動即開啟量測 (也可在執行中以 profiler.enable() 切換)
+PROFILE_ENV = "CVHW1_PROFILE"
+# 延遲直方圖的桶子上界 (毫秒)：0.01 ms 起每格加倍，最後一格約 168 秒
+# (只用標準函式庫，GUI 啟動時匯入 task_scheduler 不會連帶載入 numpy)
+HIST_EDGES_MS = [0.01 * 2.0 ** i for i in range(25)]
+
+
+class _NullSpan:
+    # 關閉量測時使用，幾乎沒有額外成本
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, time.perf_counter() - self.start, self.start, self.args)
+        return False
+
+
+class SpanStats:
+    """
+    單一階段的統計：次數、總時間、最小/最大值與對數刻度的延遲直方圖。
+    """
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+        self.hist = [0] * (len(HIST_EDGES_MS) + 1)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        self.hist[bisect.bisect_left(HIST_EDGES_MS, seconds * 1000)] += 1
+
+    def percentile(self, q):
+        # 由直方圖估計百分位數 (回傳所在桶子的上界，單位秒，不超過最大值)
+        if self.count == 0:
+            return 0.0
+        i = bisect.bisect_left(list(itertools.accumulate(self.hist)), q / 100 * self.count)
+        upper = HIST_EDGES_MS[i] / 1000 if i < len(HIST_EDGES_MS) else self.max
+        return min(upper, self.max)
+
+
+class Profiler:
+    """
+    熱點路徑的時間量測。以 span(name) (context manager) 或 @profiled(name) 包住各階段，
+    記錄每個階段的次數與延遲直方圖，並保留最近 max_events 個事件供輸出 Chrome trace
+    (chrome://tracing 或 Perfetto 開啟)。關閉時 span() 回傳空物件，不做任何記錄。
+    """
+    def __init__(self, enabled=False, max_events=100000):
+        self.enabled = enabled
+        self.stats = {}
+        self.events = deque(maxlen=max_events)
+        self._lock = threading.Lock()
+        # trace 的時間以 epoch 微秒表示，子行程的事件也能對齊
+        self._epoch_offset = time.time() - time.perf_counter()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def span(self, name, **args):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def profiled(self, name=None):
+        # 裝飾器版本：@profiler.profiled("calibrate")
+        def decorator(fn):
+            span_name = name or fn.__qualname__
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def record(self, name, seconds, start=None, args=None):
+        # 也可直接記錄在其他地方量好的時間 (例如子行程回傳的事件)
+        if not self.enabled:
+            return
+        if start is None:
+            start = time.perf_counter() - seconds
+        event = {"name": name, "ph": "X", "ts": (start + self._epoch_offset) * 1e6, "dur": seconds * 1e6,
+                 "pid": os.getpid(), "tid": threading.get_ident()}
+        if args:
+            event["args"] = args
+        self._add(name, seconds, event)
+
+    def _add(self, name, seconds, event):
+        with self._lock:
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = SpanStats()
+            stats.add(seconds)
+            self.events.append(event)
+
+    def take_events(self):
+        # 取出並清空目前的事件 (process pool 的子行程用來把事件送回主行程)
+        with self._lock:
+            events = list(self.events)
+            self.events.clear()
+            self.stats.clear()
+        return events
+
+    def merge(self, events):
+        if not self.enabled:
+            return
+        for event in events:
+            self._add(event["name"], event["dur"] / 1e6, event)
+
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
+            self.events.clear()
+
+    def summary(self):
+        """
+        回傳各階段的統計 (依總時間排序)，時間單位為毫秒。
+        """
+        with self._lock:
+            items = list(self.stats.items())
+        rows = []
+        for name, s in items:
+            rows.append({"stage": name, "count": s.count, "total_ms": s.total * 1000,
+                         "mean_ms": s.total * 1000 / s.count, "min_ms": s.min * 1000,
+                         "p50_ms": s.percentile(50) * 1000, "p95_ms": s.percentile(95) * 1000,
+                         "max_ms": s.max * 1000})
+        return sorted(rows, key=lambda r: -r["total_ms"])
+
+    def format_summary(self):
+        rows = self.summary()
+        if not rows:
+            return "No profiling data (set CVHW1_PROFILE=1 or call profiler.enable())."
+        fmt = "{:<24} {:>7} {:>11} {:>9} {:>9} {:>9} {:>9} {:>9}"
+        lines = [fmt.format("stage", "count", "total ms", "mean", "min", "p50", "p95", "max")]
+        for r in rows:
+            lines.append(fmt.format(r["stage"], r["count"], f"{r['total_ms']:.1f}", f"{r['mean_ms']:.2f}",
+                                    f"{r['min_ms']:.2f}", f"{r['p50_ms']:.2f}", f"{r['p95_ms']:.2f}",
+                                    f"{r['max_ms']:.2f}"))
+        return "\n".join(lines)
+
+    def write_chrome_trace(self, path):
+        with self._lock:
+            events = list(self.events)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        print(f"Wrote {path}")
+
+
+# 整個行程共用的量測器
+profiler = Profiler(enabled=os.environ.get(PROFILE_ENV, "") not in ("", "0"))
+span = profiler.span
+profiled = profiler.profiled
+
+
+class StageTimer:
+    """
+    依序量測一連串階段 (例如程式啟動)：mark(name) 結束目前的階段並開始下一個。
+    量測開啟時各階段也會記錄到 profiler，出現在 Chrome trace 中。
+    """
+    def __init__(self, start=None):
+        self.start = self.last = start if start is not None else time.perf_counter()
+        self.stages = []
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.stages.append((name, now - self.last))
+        profiler.record(name, now - self.last, self.last)
+        self.last = now
+
+    @property
+    def total(self):
+        return self.last - self.start
+
+    def format(self, title="Startup"):
+        # 例如 "Startup: import 52.1 ms, ui 8.4 ms, ... (total 95.0 ms)"
+        parts = ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in self.stages)
+        return f"{title}: {parts} (total {self.total * 1000:.1f} ms)"
@@ -1,14 +1,23 @@
 import cv2
 import numpy as np
 import os
+import time
 from PyQt5.QtWidgets import QMessageBox
 
+from src.corner_engine import BOARD_SIZE, board_object_points, detect_corners, draw_corners
+from src.image_source import frame_cache
+from src.incremental_calib import IncrementalCalibrator
+from src.ui_util import preview_service
+from src.undistort_service import undistort_service
+
 class Q1_Handler:
     def __init__(self, main_window, base_data):
         # 儲存對主視窗 UI 的參考
         self.ui = main_window 
         # 儲存對共用資料的參考
         self.base = base_data 
+        # 背景工作排程器 (由主視窗建立)
+        self.scheduler = main_window.scheduler
         
         # Q1 自己的內部狀態變數
         self.ObjectPoints = []
@@ -17,66 +26,102 @@ class Q1_Handler:
         self.cof_dist = None
         self.v_rot = None
         self.v_trans = None
+        self.corner_results = []
+        self.calibrator = None
+        self.calibrator_folder = None
+        # 是否在偵測完成後顯示角點
+        self.show_corners = True
 
     def find_corners(self):
-        self.ImagePoints.clear()
-        self.ObjectPoints.clear()
-        
-        width, height = 11, 8
-        objpoint=np.zeros((width*height,3),np.float32)
-        objpoint[:,:2]=np.mgrid[0:width,0:height].T.reshape(-1, 2)
-        
         # 從 base_data 獲取圖片路徑
-        images_paths = self.base.images
+        images_paths = list(self.base.images)
         if not images_paths:
             QMessageBox.warning(self.ui, "Warning", "Please load folder first.")
             return
         print("=1.1 Corner detection")
         print(f"Finding corners in {len(images_paths)} images...")
-        for image_path in images_paths:
-            img = cv2.imread(image_path)
-            grayimg=cv2.cvtColor(img,cv2.COLOR_BGR2GRAY)
-            ret,corners=cv2.findChessboardCorners(grayimg, (width, height), None)
-
-            if ret:
-                winSize = (5, 5)
-                zeroZone = (-1, -1)
-                criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
-                cv2.cornerSubPix(grayimg, corners, winSize, zeroZone, criteria)
-                
-                self.ImagePoints.append(corners)
+        
+        # 在背景執行緒以多行程平行偵測，不阻塞 UI
+        self.scheduler.submit("1.1 Find Corners", self._detect_task, images_paths, self.base.corner_cache,
+                              self.show_corners, on_result=self._on_corners_found, on_partial=self._on_corner_image)
+
+    @staticmethod
+    def _detect_task(task, images_paths, cache, show):
+        start = time.perf_counter()
+        results = detect_corners(images_paths, BOARD_SIZE, cache=cache, progress=task.report)
+        elapsed = time.perf_counter() - start
+        # 視覺化為選用步驟：在背景執行緒繪製，每張畫好就送到結果面板
+        if show:
+            for result in results:
+                if result.found:
+                    img_draw = draw_corners(result, BOARD_SIZE)
+                    if img_draw is not None:
+                        task.publish((os.path.basename(result.path), img_draw))
+        return results, elapsed
+
+    def _on_corner_image(self, item):
+        title, img_draw = item
+        self.ui.gallery.add_image(img_draw, title)
+
+    def _on_corners_found(self, payload):
+        results, elapsed = payload
+        self.ImagePoints.clear()
+        self.ObjectPoints.clear()
+        
+        objpoint = board_object_points(BOARD_SIZE)
+        self.corner_results = results
+        for result in results:
+            if result.found:
+                self.ImagePoints.append(result.corners)
                 self.ObjectPoints.append(objpoint)
-                
-                img_draw=cv2.cvtColor(grayimg,cv2.COLOR_GRAY2RGB)
-                cv2.drawChessboardCorners(img_draw, (width, height), corners, ret)
-                img_draw=cv2.resize(img_draw,(1000,800))
-                cv2.imshow(os.path.basename(image_path), img_draw)
-                cv2.waitKey(900)
-                cv2.destroyAllWindows()
+        print(f"Found corners in {len(self.ImagePoints)}/{len(results)} images ({elapsed:.2f} s).")
         print("Corner detection finished.")
 
     def find_intrinsic(self):
         if not self.ObjectPoints:
             QMessageBox.warning(self.ui, "Warning", "Please run 1.1 Find Corners first.")
             return
-            
-        width, height = 11, 8 
-        img_size = (2048, 2048) # 根據 PDF
         
-        ret, ins, cof_dist, v_rot, v_trans = cv2.calibrateCamera (self.ObjectPoints, self.ImagePoints, img_size ,None, None)
+        # 增量式校準：同一資料夾再次執行時以前一次的內參暖啟動，只加入新的影像
+        # 影像大小由偵測結果決定 (不再固定為 2048x2048)
+        folder = self.base.folder_path
+        if self.calibrator is None or self.calibrator_folder != folder:
+            calibrator = IncrementalCalibrator(BOARD_SIZE)
+        else:
+            # 在副本上求解，1.3 在主執行緒讀取的 self.calibrator 於完成前不會被修改
+            calibrator = self.calibrator.copy()
+        self.scheduler.submit("1.2 Find Intrinsic", self._calibrate_task, calibrator, list(self.corner_results),
+                              on_result=lambda result: self._on_calibrated(result, folder))
+
+    @staticmethod
+    def _calibrate_task(task, calibrator, corner_results):
+        # 沒有新視角時沿用上一次的結果，不再暖啟動重解 (避免每次按下都讓內參漂移)
+        if calibrator.add_results(corner_results) == 0 and calibrator.rms is not None:
+            return calibrator
+        if calibrator.update() is None:
+            raise RuntimeError(f"Need at least {calibrator.min_views} images with corners to calibrate.")
+        return calibrator
+
+    def _on_calibrated(self, calibrator, folder):
+        self.calibrator = calibrator
+        self.calibrator_folder = folder
+        ins = calibrator.mat_intri
         
         self.mat_intri = ins
-        self.cof_dist = cof_dist
-        self.v_rot = v_rot
-        self.v_trans = v_trans
-
-        if ret:
-            print("=1.2 Intrinsic:", ins)
-            msg = QMessageBox()
-            msg.setIcon(QMessageBox.Information)
-            msg.setText(np.array2string(ins))
-            msg.setWindowTitle("Intrinsic")
-            msg.exec_()
+        self.cof_dist = calibrator.cof_dist
+        self.v_rot = calibrator.v_rot
+        self.v_trans = calibrator.v_trans
+
+        print(f"Calibration RMS: {calibrator.rms:.4f} px ({len(calibrator.names)} views, {len(calibrator.rejected)} dropped)")
+        for name, err in calibrator.report():
+            print(f"  {os.path.basename(name)}: {err:.4f} px")
+
+        print("=1.2 Intrinsic:", ins)
+        msg = QMessageBox()
+        msg.setIcon(QMessageBox.Information)
+        msg.setText(np.array2string(ins))
+        msg.setWindowTitle("Intrinsic")
+        msg.exec_()
 
     def find_extrinsic(self):
         if self.mat_intri is None:
@@ -86,12 +131,16 @@ class Q1_Handler:
         # *** 關鍵點：從 self.ui 存取 UI 元件 ***
         num = self.ui.extrinsicSpinBox.value() - 1 
         
-        if num >= len(self.v_rot) or num < 0:
+        if num >= len(self.base.images) or num < 0:
             print(f"Invalid image index {num+1}.")
             return
 
-        rvec = self.v_rot[num]
-        tvec = self.v_trans[num]
+        # 以影像路徑查詢外參 (被剔除或未參與校準的影像會以 solvePnP 求得)
+        extrinsic = self.calibrator.extrinsic(self.base.images[num])
+        if extrinsic is None:
+            print(f"No corners found in image {num+1}.")
+            return
+        rvec, tvec = extrinsic
         
         Rotation_matrix,_=cv2.Rodrigues(rvec)
         Extrinsic_matrix=np.column_stack((Rotation_matrix,tvec))
@@ -140,27 +189,36 @@ class Q1_Handler:
         # 4. 獲取單一影像路徑 (移除 for 迴圈)
         img_path = self.base.images[selected_index]
         
-        img = cv2.imread(img_path)
+        # 5~7 在背景執行緒計算，完成後於主執行緒顯示
+        self.scheduler.submit("1.5 Show Result", self._undistort_task, img_path, self.mat_intri, self.cof_dist,
+                              on_result=self._on_undistorted)
+
+    @staticmethod
+    def _undistort_task(task, img_path, mat_intri, cof_dist):
+        # 相同影像與內參的比較圖直接取用快取
+        source_id = ("undistort", img_path, os.path.getmtime(img_path), mat_intri.tobytes(), cof_dist.tobytes())
+        cached = preview_service.cached(source_id, (1500, 800))
+        if cached is not None:
+            return img_path, cached
+
+        img = frame_cache.imread(img_path) # 快取中的影像是唯讀的，文字改畫在預覽畫布上
         if img is None:
-            QMessageBox.critical(self.ui, "Error", f"Failed to read image: {img_path}")
-            return
+            raise RuntimeError(f"Failed to read image: {img_path}")
             
         # 5. 執行校正
-        undistorted_img = cv2.undistort(img, self.mat_intri, self.cof_dist)
+        # 使用快取的 remap 表 (同一組內參只建一次)
+        undistorted_img = undistort_service.undistort(img, mat_intri, cof_dist)
         
-        # 6. 加上文字
-        cv2.putText(img, 'Distorted', (20, 100), cv2.FONT_HERSHEY_SIMPLEX, 4, (255, 255, 255), 10)
-        cv2.putText(undistorted_img, 'Undistorted', (20, 100), cv2.FONT_HERSHEY_SIMPLEX, 4, (255, 255, 255), 10)
+        # 6~7. 在預覽解析度組合影像並加上文字 (不需先 hstack 全解析度影像)
+        concatenated_img = preview_service.side_by_side([img, undistorted_img], (1500, 800),
+                                                        labels=['Distorted', 'Undistorted'], source_id=source_id)
+        return img_path, concatenated_img
 
-        # 7. 組合影像
-        concatenated_img = np.hstack([img, undistorted_img])
-        concatenated_img = cv2.resize(concatenated_img, (1500, 800))
-        
-        # 8. 顯示單一結果
+    def _on_undistorted(self, payload):
+        img_path, concatenated_img = payload
+        # 8. 顯示單一結果 (結果面板，不阻塞)
         win_name = f'{os.path.basename(img_path)} - Distorted (left) vs Undistorted (right)'
-        cv2.imshow(win_name, concatenated_img)
-        cv2.waitKey(0) # 改成 0，無限等待，直到使用者按下按鍵
-        cv2.destroyAllWindows()
+        self.ui.gallery.add_image(concatenated_img, win_name)
     # def show_result(self):
     #     if self.mat_intri is None or self.cof_dist is None:
     #         QMessageBox.warning(self.ui, "Warning", "Please run 1.2 Find Intrinsic first.")
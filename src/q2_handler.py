@@ -1,7 +1,12 @@
-import cv2
-import numpy as np
 import os
-from PyQt5.QtWidgets import QMessageBox
+import threading
+from PyQt5.QtWidgets import QFileDialog, QMessageBox
+
+from src.ar_renderer import CHAR_OFFSETS, load_glyph_table, render_segments
+from src.ar_video import render_video
+from src.corner_engine import BOARD_SIZE, board_object_points, calibrate_camera, detect_corners
+from src.image_source import frame_cache
+from src.ui_util import preview_service
 
 class Q2_Handler:
     def __init__(self, main_window, base_data):
@@ -9,6 +14,8 @@ class Q2_Handler:
         self.ui = main_window 
         # 儲存對共用資料的參考
         self.base = base_data 
+        # 背景工作排程器 (由主視窗建立)
+        self.scheduler = main_window.scheduler
         
         # Q2 自己的內部狀態變數 (用於快取校準結果)
         self.ImagePoints = []
@@ -17,11 +24,18 @@ class Q2_Handler:
         self.cof_dist = None
         self.v_rot = None
         self.v_trans = None
+        # AR 與 AR 影片工作可能同時在背景執行，校準只做一次
+        self._calib_lock = threading.Lock()
 
     def _calibrate_q2_images(self):
+        with self._calib_lock:
+            return self._calibrate_q2_images_locked()
+
+    def _calibrate_q2_images_locked(self):
         """
         為 Q2 執行獨立的相機校準。
         根據 PDF，Q2 使用 5 張影像 (1-5.bmp)。
+        在背景執行緒中執行，失敗時拋出 RuntimeError (由排程器在主執行緒顯示)。
         """
         # 檢查是否已校準
         if self.mat_intri is not None:
@@ -30,50 +44,44 @@ class Q2_Handler:
         self.ImagePoints.clear()
         self.ObjectPoints.clear()
         
-        width, height = 11, 8
-        objpoint=np.zeros((width*height,3),np.float32)
-        objpoint[:,:2]=np.mgrid[0:width,0:height].T.reshape(-1, 2)
+        objpoint = board_object_points(BOARD_SIZE)
         
         # 從 base_data 獲取圖片路徑，並只取前 5 張
         q2_image_paths = self.base.images[:5]
         
-        if len(q2_image_paths) < 5:
-            QMessageBox.warning(self.ui, "Warning", f"Q2 requires at least 5 images in the loaded folder. Found {len(q2_image_paths)}.")
-            return False
-            
         print(f"Calibrating for Q2 using {len(q2_image_paths)} images...")
 
-        for image_path in q2_image_paths:
-            img = cv2.imread(image_path)
-            if img is None:
-                print(f"Warning: Could not read {image_path}")
-                continue
-            grayimg=cv2.cvtColor(img,cv2.COLOR_BGR2GRAY)
-            ret,corners=cv2.findChessboardCorners(grayimg, (width, height), None)
-
-            if ret:
-                self.ImagePoints.append(corners)
+        # 與 Q1 共用角點快取，Q1 已偵測過的影像不必重新偵測
+        results = detect_corners(q2_image_paths, BOARD_SIZE, cache=self.base.corner_cache)
+        for result in results:
+            if result.image_size is None:
+                print(f"Warning: Could not read {result.path}")
+            elif result.found:
+                self.ImagePoints.append(result.corners)
                 self.ObjectPoints.append(objpoint)
         
         if not self.ObjectPoints:
-            QMessageBox.critical(self.ui, "Error", "No corners found in Q2 images (1-5.bmp). Cannot calibrate.")
-            return False
+            raise RuntimeError("No corners found in Q2 images (1-5.bmp). Cannot calibrate.")
 
         # 根據 PDF，影像大小為 2048x2048
-        ret, self.mat_intri, self.cof_dist, self.v_rot, self.v_trans = cv2.calibrateCamera (self.ObjectPoints, self.ImagePoints, (2048, 2048) ,None, None)
+        ret, self.mat_intri, self.cof_dist, self.v_rot, self.v_trans = calibrate_camera(results, (2048, 2048), BOARD_SIZE, cache=self.base.corner_cache)
         
         if ret:
             # print("Q2 Calibration successful.")
             return True
         else:
-            QMessageBox.critical(self.ui, "Error", "Q2 Calibration failed.")
-            return False
+            raise RuntimeError("Q2 Calibration failed.")
 
-    def _run_ar(self, vertical: bool):
-        # 1. 確保已校準
-        if not self._calibrate_q2_images():
+    def _prepare_ar(self, vertical: bool):
+        """
+        檢查 UI 輸入，回傳 (q2_image_paths, text, db_path)；輸入無效時回傳 None。
+        """
+        # 1. 確保有足夠的影像 (校準在背景工作中進行)
+        q2_image_paths = self.base.images[:5]
+        if len(q2_image_paths) < 5:
+            QMessageBox.warning(self.ui, "Warning", f"Q2 requires at least 5 images in the loaded folder. Found {len(q2_image_paths)}.")
             print("Cannot run AR without calibration.")
-            return
+            return None
 
         # 2. 獲取 UI 文字
         # *** 關鍵點：從 self.ui 存取 UI 元件 ***
@@ -81,14 +89,12 @@ class Q2_Handler:
         
         if not text:
             QMessageBox.warning(self.ui, "Warning", "Please enter text in the box.")
-            return
+            return None
         if len(text) > 6:
             QMessageBox.warning(self.ui, "Warning", "Text must be 6 characters or less.")
             text = text[:6] # 截斷
 
         # 3. 準備資料庫
-        offsets =[[7.0, 5.0, 0.0], [4.0, 5.0, 0.0], [1.0, 5.0, 0.0], [7.0, 2.0, 0.0], [4.0, 2.0, 0.0], [1.0, 2.0, 0.0]]
-        
         if vertical:
             db_name = 'alphabet_db_vertical.txt'
         else:
@@ -99,42 +105,39 @@ class Q2_Handler:
         
         if not os.path.exists(db_path):
             QMessageBox.critical(self.ui, "Error", f"Database file not found. Expected at: {db_path}")
+            return None
+        return q2_image_paths, text, db_path
+
+    def _run_ar(self, vertical: bool):
+        prepared = self._prepare_ar(vertical)
+        if prepared is None:
             return
-            
-        fs = cv2.FileStorage(db_path, cv2.FILE_STORAGE_READ)
-        if not fs.isOpened():
-            QMessageBox.critical(self.ui, "Error", f"Failed to open database file: {db_path}")
-            return
+        q2_image_paths, text, db_path = prepared
 
-        # 4. 迭代影像並繪製
-        q2_image_paths = self.base.images[:5]
-        for j in range(len(q2_image_paths)):
-            img = cv2.imread(q2_image_paths[j])
-            
-            for i in range(len(text)):
-                ch_mat = fs.getNode(text[i].upper()).mat() # 轉大寫
-                if ch_mat is None:
-                    print(f"Character '{text[i]}' not found in db.")
-                    continue
-                    
-                ch_mat=np.float32(ch_mat).reshape(-1,3)
-                ch_mat_offset = ch_mat + offsets[i] # 應用平移
-                
-                # 投影到 2D 影像
-                img_points, jac = cv2.projectPoints(ch_mat_offset, self.v_rot[j], self.v_trans[j], self.mat_intri, self.cof_dist)
-                
-                # 繪製線條
-                for k in range(len(img_points)//2):
-                    pt1=tuple(map(int,img_points[2*k].ravel()))
-                    pt2=tuple(map(int,img_points[2*k+1].ravel()))
-                    img = cv2.line(img, pt1, pt2, (0, 0, 255), 5) # 畫紅線
-                        
-            img=cv2.resize(img,(1000,800))
-            cv2.imshow(f'AR {j+1}.bmp',img)
-            cv2.waitKey(1200)
-            cv2.destroyAllWindows()
+        # 校準與繪製在背景執行緒進行 (同一時間只允許一個 AR 工作)
+        # 每張影像繪製完成就送到結果面板顯示，不必等全部完成
+        self.scheduler.submit("2 Augmented Reality", self._ar_task, q2_image_paths, text, db_path,
+                              on_partial=self._on_ar_frame)
+
+    def _ar_task(self, task, q2_image_paths, text, db_path):
+        self._calibrate_q2_images()
         
-        fs.release()
+        # 資料庫只解析一次 (行程內共用)，整段文字的線段串成一個陣列
+        glyphs = load_glyph_table(db_path)
+        segments = glyphs.build_segments(text, CHAR_OFFSETS)
+
+        # 4. 迭代影像並繪製 (每張影像一次 projectPoints + 一次 polylines)
+        for j in range(len(q2_image_paths)):
+            img = frame_cache.imread(q2_image_paths[j]).copy() # 共用解碼快取，繪製前先複製
+            img = render_segments(img, segments, self.v_rot[j], self.v_trans[j], self.mat_intri, self.cof_dist)
+            task.publish((f'AR {j+1}.bmp', preview_service.preview(img, (1000, 800), keep_aspect=False)))
+            task.report(j + 1, len(q2_image_paths))
+        return len(q2_image_paths)
+
+    def _on_ar_frame(self, frame):
+        # 顯示必須在主執行緒
+        title, img = frame
+        self.ui.gallery.add_image(img, title)
 
     def show_on_board(self):
         print("=2.1 Show Words on Board")
@@ -142,4 +145,34 @@ class Q2_Handler:
 
     def show_vertical(self):
         print("=2.2 Show Words Vertical")
-        self._run_ar(vertical=True)
\ No newline at end of file
+        self._run_ar(vertical=True)
+
+    def show_on_video(self):
+        # 以 Q2 的內參對影片 (或影像序列) 逐幀估計姿態並繪製文字，結果寫成 *_ar.avi
+        print("=2.3 Show Words on Video")
+        prepared = self._prepare_ar(vertical=False)
+        if prepared is None:
+            return
+        _, text, db_path = prepared
+
+        source, _ = QFileDialog.getOpenFileName(self.ui, "Open Video File", "", "Videos (*.mp4 *.avi *.mov *.mkv)")
+        if not source:
+            return
+        output_path = os.path.splitext(source)[0] + "_ar.avi"
+        self.scheduler.submit("2.3 AR Video", self._ar_video_task, source, output_path, text, db_path,
+                              on_result=self._on_ar_video_done)
+
+    def _ar_video_task(self, task, source, output_path, text, db_path):
+        self._calibrate_q2_images()
+        segments = load_glyph_table(db_path).build_segments(text, CHAR_OFFSETS)
+        stats = render_video(source, output_path, self.mat_intri, self.cof_dist, segments, realtime=False,
+                             progress=task.report)
+        return output_path, stats
+
+    def _on_ar_video_done(self, payload):
+        output_path, stats = payload
+        # GUI 輸出成檔案 (離線模式，每一幀都會繪製)，不會丟幀；丟幀統計只在 CLI 的 --realtime 有意義
+        summary = (f"Rendered {stats['frames_rendered']}/{stats['frames_read']} frames "
+                   f"at {stats['fps']:.1f} FPS.\nSaved to: {output_path}")
+        print(summary)
+        QMessageBox.information(self.ui, "AR Video", summary)
\ No newline at end of file
@@ -1,8 +1,10 @@
 import cv2
-import numpy as np
 from PyQt5.QtWidgets import QMessageBox
 
 # 匯入我們將建立的輔助工具
+from src.disparity_engine import (BLOCK_SIZE, DISPARITY_MODES, MEMORY_BUDGET, NUM_DISPARITIES, compute_disparity_mode,
+                                  disparity_to_display, format_report)
+from src.image_source import frame_cache
 from src.ui_util import ImageWindow
 
 class Q3_Handler:
@@ -11,6 +13,21 @@ class Q3_Handler:
         self.ui = main_window 
         # 儲存對共用資料的參考
         self.base = base_data 
+        # 背景工作排程器 (由主視窗建立)
+        self.scheduler = main_window.scheduler
+        # True 時先以半解析度估計視差範圍 (較快，但結果非完全相同)
+        self.pyramid = False
+        # 視差模式 (bm = 作業要求的 StereoBM) 與 SGBM cost volume 的記憶體上限 (bytes)
+        self.memory_budget = MEMORY_BUDGET
+        # 選項寫在 .ui 中 (處理器第一次使用時才建立)；舊版 .ui 沒有選項時再補上
+        combo = getattr(main_window, "disparityModeComboBox", None)
+        if combo is not None and combo.count() == 0:
+            combo.addItems(DISPARITY_MODES)
+
+    @property
+    def mode(self):
+        combo = getattr(self.ui, "disparityModeComboBox", None)
+        return combo.currentText() if combo is not None else DISPARITY_MODES[0]
 
     def stereo_disparity(self):
         # 1. 檢查圖片是否已載入
@@ -18,30 +35,39 @@ class Q3_Handler:
             QMessageBox.warning(self.ui, "Warning", "Please load Image_L and Image_R first!")
             return
         
-        print("=3.1 Stereo Disparity Map")
+        print(f"=3.1 Stereo Disparity Map ({self.mode})")
+
+        # 2~5 在背景執行緒計算，完成後於主執行緒顯示
+        self.scheduler.submit("3.1 Stereo Disparity", self._disparity_task, self.base.imageL, self.base.imageR,
+                              self.mode, self.memory_budget, self.pyramid, on_result=self._on_disparity)
 
-        # 2. 讀取灰階影像
-        imgL = cv2.imread(self.base.imageL, cv2.IMREAD_GRAYSCALE)
-        imgR = cv2.imread(self.base.imageR, cv2.IMREAD_GRAYSCALE)
+    @staticmethod
+    def _disparity_task(task, pathL, pathR, mode, memory_budget, pyramid):
+        # 2. 讀取影像 (每個檔案只讀一次，灰階由彩色影像轉換)
+        imgL_color = frame_cache.imread(pathL, cv2.IMREAD_COLOR)
+        imgR_color = frame_cache.imread(pathR, cv2.IMREAD_COLOR)
         
-        if imgL is None or imgR is None:
-            QMessageBox.critical(self.ui, "Error", f"Failed to read {self.base.imageL} or {self.base.imageR}")
-            return
+        if imgL_color is None or imgR_color is None:
+            raise RuntimeError(f"Failed to read {pathL} or {pathR}")
+        imgL = cv2.cvtColor(imgL_color, cv2.COLOR_BGR2GRAY)
+        imgR = cv2.cvtColor(imgR_color, cv2.COLOR_BGR2GRAY)
 
-        # 3. 計算視差 (根據 PDF 參數)
-        stereo = cv2.StereoBM_create(numDisparities=432, blockSize=25)
-        disparity = stereo.compute(imgL, imgR)
+        # 3. 計算視差 (根據 PDF 參數：numDisparities=432, blockSize=25)
+        # bm 切成 strip 平行計算，結果與單次 StereoBM.compute 相同；
+        # sgbm 系列的 cost volume 超過 memory_budget 時才切 strip
+        disparity, report = compute_disparity_mode(imgL, imgR, mode, NUM_DISPARITIES, BLOCK_SIZE,
+                                                   memory_budget=memory_budget, pyramid=pyramid)
         
-        # 4. 正規化以便顯示
-        disp_norm = cv2.normalize(disparity, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+        # 4. 正規化以便顯示 (只使用有效視差的範圍)
+        disp_norm = disparity_to_display(disparity)
 
-        # 5. 顯示結果 (同時載入彩色影像用於對比)
-        imgL_color = cv2.imread(self.base.imageL, cv2.IMREAD_COLOR)
-        imgR_color = cv2.imread(self.base.imageR, cv2.IMREAD_COLOR)
+        # 5. 同時回傳彩色影像用於對比
+        return imgL_color, imgR_color, disp_norm, report
 
-        ImageWindow(imgL_color, "ImgL")
-        ImageWindow(imgR_color, "ImgR")
-        ImageWindow(disp_norm, "Disparity Map")
-        
-        cv2.waitKey(0)
-        cv2.destroyAllWindows()
\ No newline at end of file
+    def _on_disparity(self, payload):
+        imgL_color, imgR_color, disp_norm, report = payload
+        print(format_report(report))
+        # 顯示結果 (結果面板，不阻塞)
+        ImageWindow(imgL_color, "ImgL", gallery=self.ui.gallery)
+        ImageWindow(imgR_color, "ImgR", gallery=self.ui.gallery)
+        ImageWindow(disp_norm, f"Disparity Map ({report['mode']})", gallery=self.ui.gallery)
\ No newline at end of file
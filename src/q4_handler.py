@@ -1,12 +1,16 @@
 import cv2
-import numpy as np
 from PyQt5.QtWidgets import QFileDialog, QMessageBox
+from src.feature_cache import feature_cache
+from src.matching import match_features
+from src.profiling import span
 from src.ui_util import ImageWindow # 您可以保留 ui_util.py 來放 ImageWindow
 
 class Q4_Handler:
     def __init__(self, main_window):
         # 儲存對主視窗 UI 的參考
         self.ui = main_window 
+        # 背景工作排程器 (由主視窗建立)
+        self.scheduler = main_window.scheduler
         
         # Q4 自己的內部狀態變數
         self.image1 = None
@@ -15,6 +19,10 @@ class Q4_Handler:
         self.descriptors1 = None
         self.keypoints2 = None
         self.descriptors2 = None
+        # 匹配設定：bf 與原本相同 (精確)，flann 適合大量特徵點；
+        # 幾何驗證預設用基本矩陣 (兩張影像不一定是平面場景)
+        self.match_method = "bf"
+        self.geometry = "fundamental"
 
     def load_image1(self):
         file_name, _ = QFileDialog.getOpenFileName(self.ui, "Open Image File", "", "Images (*.png *.xpm *.jpg *.bmp *.gif)")
@@ -37,51 +45,67 @@ class Q4_Handler:
             QMessageBox.warning(self.ui, "Warning", "Please load Image 1 first")
             return
 
-        gray = cv2.cvtColor(self.image1, cv2.COLOR_BGR2GRAY)
-        sift = cv2.SIFT_create()
-        self.keypoints1, self.descriptors1 = sift.detectAndCompute(gray, None)
-        img_with_keypoints = cv2.drawKeypoints(gray, self.keypoints1, None, color=(0, 255, 0))
+        self.scheduler.submit("4.1 Keypoints", self._keypoints_task, self.image1, on_result=self._on_keypoints)
+
+    @staticmethod
+    def _keypoints_task(task, image1):
+        gray = cv2.cvtColor(image1, cv2.COLOR_BGR2GRAY)
+        # 相同影像的特徵只計算一次 (重新載入或交換影像時直接取用快取)
+        keypoints1, descriptors1 = feature_cache.compute(gray)
+        img_with_keypoints = cv2.drawKeypoints(gray, keypoints1, None, color=(0, 255, 0))
+        return image1, keypoints1, descriptors1, img_with_keypoints
+
+    def _on_keypoints(self, payload):
+        image1, keypoints1, descriptors1, img_with_keypoints = payload
+        # 期間若已載入其他影像，就不保留這次的特徵
+        if image1 is self.image1:
+            self.keypoints1, self.descriptors1 = keypoints1, descriptors1
         print("=4.1 Keypoints")
-        ImageWindow(img_with_keypoints, "4.1 Keypoints") # 使用輔助類別
-        cv2.waitKey(0)
-        cv2.destroyAllWindows()
+        ImageWindow(img_with_keypoints, "4.1 Keypoints", gallery=self.ui.gallery) # 顯示在結果面板，不阻塞
 
     def matched_keypoint(self):
         if self.image1 is None or self.image2 is None:
             QMessageBox.warning(self.ui, "Warning", "Please load both images first")
             return
-            
-        try:
-            if self.keypoints1 is None:
-                gray1 = cv2.cvtColor(self.image1, cv2.COLOR_BGR2GRAY)
-                sift1 = cv2.SIFT_create()
-                self.keypoints1, self.descriptors1 = sift1.detectAndCompute(gray1, None)
-            
-            if self.keypoints2 is None:
-                gray2 = cv2.cvtColor(self.image2, cv2.COLOR_BGR2GRAY)
-                sift2 = cv2.SIFT_create()
-                self.keypoints2, self.descriptors2 = sift2.detectAndCompute(gray2, None)
 
-            if self.descriptors1 is None or self.descriptors2 is None:
-                print("Could not compute descriptors.")
-                return
+        features1 = (self.image1, self.keypoints1, self.descriptors1)
+        features2 = (self.image2, self.keypoints2, self.descriptors2)
+        self.scheduler.submit("4.2 Matched Keypoints", self._match_task, features1, features2,
+                              self.match_method, self.geometry,
+                              on_result=self._on_matched, on_error=lambda e: print(f"An error occurred: {e}"))
+
+    @staticmethod
+    def _match_task(task, features1, features2, method, geometry):
+        image1, keypoints1, descriptors1 = features1
+        image2, keypoints2, descriptors2 = features2
+        if keypoints1 is None:
+            keypoints1, descriptors1 = feature_cache.compute(image1)
+        
+        if keypoints2 is None:
+            keypoints2, descriptors2 = feature_cache.compute(image2)
+
+        if descriptors1 is None or descriptors2 is None:
+            raise RuntimeError("Could not compute descriptors.")
 
-            bf = cv2.BFMatcher()
-            matches = bf.knnMatch(self.descriptors1, self.descriptors2, k=2)
-            
-            good_matches = []
-            for m, n in matches:
-                if m.distance < 0.75 * n.distance:
-                    good_matches.append([m]) 
+        # knnMatch -> 向量化 ratio test -> 互為最近鄰 -> USAC_MAGSAC 幾何驗證
+        result = match_features(keypoints1, descriptors1, keypoints2, descriptors2, ratio=0.75,
+                                cross_check=True, model=geometry, method=method)
+        # 幾何驗證失敗 (匹配太少) 時仍顯示通過 ratio test 的匹配
+        good_matches = result.to_dmatches(inliers_only=result.model is not None)
 
-            img_matches = cv2.drawMatchesKnn(self.image1, self.keypoints1, 
-                                             self.image2, self.keypoints2, 
-                                             good_matches, None, 
+        with span("sift.draw"):
+            img_matches = cv2.drawMatchesKnn(image1, keypoints1,
+                                             image2, keypoints2,
+                                             good_matches, None,
                                              flags=cv2.DrawMatchesFlags_NOT_DRAW_SINGLE_POINTS)
-            print("=4.2 Matched Keypoints")
-            ImageWindow(img_matches, "4.2 Matched Keypoints")
-            cv2.waitKey(0)
-            cv2.destroyAllWindows()
-            
-        except Exception as e:
-            print(f"An error occurred: {e}")
\ No newline at end of file
+        return (image1, keypoints1, descriptors1), (image2, keypoints2, descriptors2), img_matches, result
+
+    def _on_matched(self, payload):
+        (image1, keypoints1, descriptors1), (image2, keypoints2, descriptors2), img_matches, result = payload
+        if image1 is self.image1:
+            self.keypoints1, self.descriptors1 = keypoints1, descriptors1
+        if image2 is self.image2:
+            self.keypoints2, self.descriptors2 = keypoints2, descriptors2
+        print("=4.2 Matched Keypoints")
+        print(f"Matches: {result.summary()}")
+        ImageWindow(img_matches, "4.2 Matched Keypoints", gallery=self.ui.gallery)
\ No newline at end of file
@@ -0,0 +1,226 @@
+import os
+
+import cv2
+import numpy as np
+
+from src.disparity_engine import (BLOCK_SIZE, DISPARITY_MODES, MEMORY_BUDGET, NUM_DISPARITIES, compute_disparity,
+                                  compute_disparity_mode)
+from src.image_source import list_images, prefetch
+from src.profiling import span
+
+
+def iter_stereo_pairs(left, right):
+    """
+    依序產生 (name, imgL, imgR) (彩色影像，每個檔案只讀一次)。
+    left/right 可以是兩個資料夾 (依檔名自然排序配對) 或兩個影片檔。
+    """
+    if os.path.isdir(left) and os.path.isdir(right):
+        pathsL, pathsR = list_images(left), list_images(right)
+        if len(pathsL) != len(pathsR):
+            print(f"Warning: {len(pathsL)} left vs {len(pathsR)} right images, extra frames are ignored.")
+        for pathL, pathR in zip(pathsL, pathsR):
+            with span("decode"):
+                imgL, imgR = cv2.imread(pathL), cv2.imread(pathR)
+            if imgL is None or imgR is None:
+                print(f"Warning: Could not read {pathL} or {pathR}")
+                continue
+            yield os.path.splitext(os.path.basename(pathL))[0], imgL, imgR
+        return
+
+    capL, capR = cv2.VideoCapture(left), cv2.VideoCapture(right)
+    if not capL.isOpened() or not capR.isOpened():
+        raise RuntimeError(f"Failed to open {left} or {right}")
+    try:
+        index = 0
+        while True:
+            okL, imgL = capL.read()
+            okR, imgR = capR.read()
+            if not (okL and okR):
+                return
+            yield f"{index:06d}", imgL, imgR
+            index += 1
+    finally:
+        capL.release()
+        capR.release()
+
+
+def count_stereo_pairs(left, right):
+    if os.path.isdir(left) and os.path.isdir(right):
+        return min(len(list_images(left)), len(list_images(right)))
+    counts = []
+    for path in (left, right):
+        cap = cv2.VideoCapture(path)
+        counts.append(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+        cap.release()
+    return min(counts)
+
+
+class StereoRectifier:
+    """
+    由雙相機校準結果 (K1, D1, K2, D2, R, T) 建立校正 remap 表。
+    同一影像大小只建立一次，整段序列共用。
+    """
+    def __init__(self, K1, D1, K2, D2, R, T, alpha=0):
+        self.params = [np.asarray(m, np.float64) for m in (K1, D1, K2, D2, R)]
+        self.params.append(np.asarray(T, np.float64).reshape(3, 1))
+        self.alpha = alpha
+        self._maps = {}
+        self.Q = None
+
+    @classmethod
+    def load(cls, path, pair=None, **kwargs):
+        # .npz，需包含 K1, D1, K2, D2, R, T；
+        # 或 calibration_service 的校準資料庫 (以 pair=(左相機, 右相機) 指定，只有一對時可省略)
+        with np.load(path) as data:
+            if "K1" in data:
+                return cls(data["K1"], data["D1"], data["K2"], data["D2"], data["R"], data["T"], **kwargs)
+        from src.calibration_service import CalibrationDatabase
+        db = CalibrationDatabase.load(path)
+        if pair is None:
+            if len(db.pairs) != 1:
+                raise ValueError(f"{path} contains {len(db.pairs)} stereo pairs, specify one")
+            pair = next(iter(db.pairs))
+        return cls(*db.stereo_params(*pair), **kwargs)
+
+    def _get_maps(self, image_size):
+        if image_size not in self._maps:
+            K1, D1, K2, D2, R, T = self.params
+            R1, R2, P1, P2, Q, _, _ = cv2.stereoRectify(K1, D1, K2, D2, image_size, R, T, alpha=self.alpha)
+            mapsL = cv2.initUndistortRectifyMap(K1, D1, R1, P1, image_size, cv2.CV_16SC2)
+            mapsR = cv2.initUndistortRectifyMap(K2, D2, R2, P2, image_size, cv2.CV_16SC2)
+            self._maps[image_size] = (mapsL, mapsR)
+            self.Q = Q
+        return self._maps[image_size]
+
+    def rectify(self, imgL, imgR):
+        h, w = imgL.shape[:2]
+        mapsL, mapsR = self._get_maps((w, h))
+        return (cv2.remap(imgL, mapsL[0], mapsL[1], cv2.INTER_LINEAR),
+                cv2.remap(imgR, mapsR[0], mapsR[1], cv2.INTER_LINEAR))
+
+    def focal_baseline(self):
+        # 由 Q 矩陣取得焦距 (像素) 與基線長度
+        if self.Q is None:
+            return None
+        return self.Q[2, 3], abs(1.0 / self.Q[3, 2])
+
+
+def make_matcher(kind, num_disparities=NUM_DISPARITIES, block_size=BLOCK_SIZE, memory_budget=MEMORY_BUDGET):
+    """
+    回傳 compute(grayL, grayR) -> int16 視差 (單位 1/16 像素)。kind 為 DISPARITY_MODES 之一。
+    """
+    if kind == "bm":
+        return lambda grayL, grayR: compute_disparity(grayL, grayR, num_disparities, block_size)
+    if kind in DISPARITY_MODES:
+        return lambda grayL, grayR: compute_disparity_mode(grayL, grayR, kind, num_disparities, block_size,
+                                                           memory_budget=memory_budget)[0]
+    raise ValueError(f"Unknown matcher: {kind}")
+
+
+def disparity_to_depth(disparity, focal, baseline):
+    # depth = f * B / d，無效視差的深度為 0
+    disp = disparity.astype(np.float32) / 16.0
+    depth = np.zeros_like(disp)
+    valid = disp > 0
+    depth[valid] = focal * baseline / disp[valid]
+    return depth
+
+
+def stream_disparity(left, right, rectifier=None, matcher="bm", focal_baseline=None, prefetch_size=2):
+    """
+    讀取 -> 校正 -> 視差 -> 深度 的 generator，產生 (name, disparity, depth)。
+    depth 在沒有焦距/基線資訊時為 None。讀取在背景執行緒進行，記憶體用量有上限。
+    """
+    compute = make_matcher(matcher) if isinstance(matcher, str) else matcher
+    for name, imgL, imgR in prefetch(iter_stereo_pairs(left, right), prefetch_size):
+        if rectifier is not None:
+            with span("rectify"):
+                imgL, imgR = rectifier.rectify(imgL, imgR)
+        grayL = cv2.cvtColor(imgL, cv2.COLOR_BGR2GRAY)
+        grayR = cv2.cvtColor(imgR, cv2.COLOR_BGR2GRAY)
+        disparity = compute(grayL, grayR)
+
+        fb = focal_baseline
+        if fb is None and rectifier is not None:
+            fb = rectifier.focal_baseline()
+        depth = disparity_to_depth(disparity, *fb) if fb is not None else None
+        yield name, disparity, depth
+
+
+class NpyAppender:
+    """
+    逐幀附加寫入 .npy，不需要事先知道總幀數 (影片的 CAP_PROP_FRAME_COUNT 只是估計值)。
+    檔頭固定保留 HEADER_SIZE bytes，幀資料直接接在後面；close() 時回到檔頭以實際幀數改寫 shape，
+    不需要暫存檔，也不會多複製一次資料。結果可以 np.load(path, mmap_mode="r") 讀取。
+    """
+    HEADER_SIZE = 128  # npy 檔頭需為 64 的倍數；足以容納 (N, H, W) 的 shape
+
+    def __init__(self, path, dtype):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.frame_shape = None
+        self.count = 0
+        self._file = open(path, "wb")
+
+    def _header(self):
+        header = {"descr": np.lib.format.dtype_to_descr(self.dtype), "fortran_order": False,
+                  "shape": (self.count,) + (self.frame_shape or ())}
+        text = repr(header).encode("latin1")
+        prefix = np.lib.format.magic(1, 0)
+        size = self.HEADER_SIZE - len(prefix) - 2  # 2 bytes 的檔頭長度 (format 1.0)
+        if len(text) + 1 > size:
+            raise ValueError(f"Shape {header['shape']} does not fit in the reserved npy header")
+        return prefix + size.to_bytes(2, "little") + text.ljust(size - 1) + b"\n"
+
+    def append(self, frame):
+        frame = np.ascontiguousarray(frame, self.dtype)
+        if self.frame_shape is None:
+            self.frame_shape = frame.shape
+            self._file.write(self._header())
+        elif frame.shape != self.frame_shape:
+            raise ValueError(f"Frame shape {frame.shape} differs from {self.frame_shape}")
+        self._file.write(frame.tobytes())
+        self.count += 1
+
+    def close(self):
+        # 中斷時已寫入的幀仍會記錄在檔頭中
+        self._file.seek(0)
+        self._file.write(self._header())
+        self._file.close()
+
+
+def process_stereo_sequence(left, right, output_dir, fmt="png", progress=None, **kwargs):
+    """
+    處理整段序列並寫入 output_dir：
+      fmt="png": 每幀一張 16-bit PNG (視差 * 16，無效為 0；深度以校準單位 (通常為 mm) 存成 depth_*.png)
+      fmt="npy": 單一 disparity.npy (N, H, W) int16 (以及 depth.npy float32，可 memory-map 讀取)，N 為實際讀到的幀數
+    回傳處理的幀數。progress(done, total) 的 total 為估計值 (影片的幀數標頭可能不準)。
+    """
+    if fmt not in ("png", "npy"):
+        raise ValueError(f"Unknown output format: {fmt}")
+    os.makedirs(output_dir, exist_ok=True)
+    total = count_stereo_pairs(left, right)
+    disp_store = depth_store = None
+    count = 0
+    try:
+        for name, disparity, depth in stream_disparity(left, right, **kwargs):
+            if fmt == "png":
+                cv2.imwrite(os.path.join(output_dir, f"disp_{name}.png"), np.clip(disparity, 0, None).astype(np.uint16))
+                if depth is not None:
+                    cv2.imwrite(os.path.join(output_dir, f"depth_{name}.png"), np.clip(depth, 0, 65535).astype(np.uint16))
+            else:
+                if disp_store is None:
+                    disp_store = NpyAppender(os.path.join(output_dir, "disparity.npy"), np.int16)
+                    if depth is not None:
+                        depth_store = NpyAppender(os.path.join(output_dir, "depth.npy"), np.float32)
+                disp_store.append(disparity)
+                if depth_store is not None:
+                    depth_store.append(depth)
+            count += 1
+            if progress is not None:
+                progress(count, max(total, count))
+    finally:
+        for store in (disp_store, depth_store):
+            if store is not None:
+                store.close()
+    return count
@@ -0,0 +1,142 @@
+import threading
+import traceback
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+from PyQt5.QtWidgets import QMessageBox
+
+from src.profiling import span
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+class TaskSignals(QObject):
+    # QRunnable 不是 QObject，所以訊號放在獨立物件中
+    # 這個物件在主執行緒建立，訊號會以 queued connection 送回主執行緒
+    progress = pyqtSignal(int, int)   # (完成數, 總數)
+    partial = pyqtSignal(object)      # 工作進行中產生的部分結果 (例如每張繪製好的影像)
+    result = pyqtSignal(object)
+    error = pyqtSignal(object)        # 例外物件
+    finished = pyqtSignal()
+
+
+class Task(QRunnable):
+    """
+    在 QThreadPool 中執行的工作。fn 的第一個參數是 Task 本身，
+    可用 task.report(done, total) 回報進度 (同時檢查是否已被取消)，
+    以 task.publish(item) 把部分結果送回主執行緒 (不必等整個工作結束才顯示)。
+    """
+    def __init__(self, name, fn, *args, **kwargs):
+        super().__init__()
+        self.setAutoDelete(False)  # 由 TaskScheduler 管理生命週期
+        self.name = name
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = TaskSignals()
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def check_cancelled(self):
+        if self._cancelled.is_set():
+            raise TaskCancelled(self.name)
+
+    def report(self, done, total):
+        self.check_cancelled()
+        self.signals.progress.emit(done, total)
+
+    def publish(self, item):
+        self.check_cancelled()
+        self.signals.partial.emit(item)
+
+    def run(self):
+        try:
+            self.check_cancelled()
+            # 整個工作 (例如 "1.1 Find Corners") 記為一個 span，內含各階段的 span
+            with span(f"task:{self.name}"):
+                result = self.fn(self, *self.args, **self.kwargs)
+        except TaskCancelled:
+            print(f"Task '{self.name}' cancelled.")
+        except Exception as e:
+            traceback.print_exc()
+            self.signals.error.emit(e)
+        else:
+            if not self.cancelled:
+                self.signals.result.emit(result)
+        finally:
+            self.signals.finished.emit()
+
+
+class TaskScheduler(QObject):
+    """
+    將 OpenCV 運算移出 Qt 事件迴圈。
+    處理器以 submit() 送出工作，結果/錯誤/進度會在主執行緒以 callback 回傳，
+    因此 callback 中可以安全地操作 UI (QMessageBox, 結果影像庫...)。
+    """
+    def __init__(self, parent_window, max_threads=None):
+        super().__init__(parent_window)
+        self.parent = parent_window
+        self.pool = QThreadPool(self)
+        if max_threads is not None:
+            self.pool.setMaxThreadCount(max_threads)
+        self.tasks = {}  # name -> Task，同名工作同時只允許一個
+
+    def submit(self, name, fn, *args, on_result=None, on_error=None, on_progress=None, on_partial=None, **kwargs):
+        if self.is_running(name):
+            print(f"Task '{name}' is already running.")
+            return None
+
+        task = Task(name, fn, *args, **kwargs)
+        if on_result is not None:
+            task.signals.result.connect(on_result)
+        if on_partial is not None:
+            task.signals.partial.connect(on_partial)
+        task.signals.error.connect(on_error if on_error is not None else self._default_error)
+        task.signals.progress.connect(on_progress if on_progress is not None else
+                                      lambda done, total: self._default_progress(name, done, total))
+        task.signals.finished.connect(lambda: self._on_finished(name, task))
+
+        self.tasks[name] = task
+        self._show_status(f"{name}: running...")
+        self.pool.start(task)
+        return task
+
+    def is_running(self, name):
+        return name in self.tasks
+
+    def cancel(self, name):
+        task = self.tasks.get(name)
+        if task is not None:
+            task.cancel()
+
+    def cancel_all(self):
+        for task in self.tasks.values():
+            task.cancel()
+
+    def wait_all(self, msecs=-1):
+        # 關閉視窗前呼叫，確保背景工作結束
+        return self.pool.waitForDone(msecs)
+
+    def _on_finished(self, name, task):
+        if self.tasks.get(name) is task:
+            del self.tasks[name]
+        self._show_status(f"{name}: {'cancelled' if task.cancelled else 'done'}", 3000)
+
+    def _default_progress(self, name, done, total):
+        self._show_status(f"{name}: {done}/{total}")
+
+    def _default_error(self, error):
+        QMessageBox.critical(self.parent, "Error", str(error))
+
+    def _show_status(self, text, timeout=0):
+        try:
+            self.parent.statusBar().showMessage(text, timeout)
+        except AttributeError:
+            print(text)
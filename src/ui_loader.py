@@ -0,0 +1,89 @@
+"""
+.ui 檔的預先編譯：第一次啟動 (或 .ui 被修改) 時以 uic.compileUi 轉成 Python 模組，
+之後直接 import 編譯好的模組，不必每次啟動都解析 XML，也不需要匯入 PyQt5.uic。
+
+編譯結果的第一行記錄來源 .ui 的 mtime/大小與 PyQt 版本，不一致時重新編譯。
+"""
+import importlib.util
+import io
+import os
+
+from PyQt5.QtCore import PYQT_VERSION_STR
+
+_HEADER = "# compiled-from-ui:"
+
+
+def compiled_path_for(ui_path):
+    # MainWindow-cvdlhw1.ui -> MainWindow_cvdlhw1_ui.py (需要是合法的模組名稱)
+    base, _ = os.path.splitext(ui_path)
+    folder, name = os.path.split(base)
+    return os.path.join(folder, name.replace("-", "_") + "_ui.py")
+
+
+def _source_stamp(ui_path):
+    stat = os.stat(ui_path)
+    return f"{_HEADER} {stat.st_mtime_ns} {stat.st_size} pyqt{PYQT_VERSION_STR}"
+
+
+def is_fresh(py_path, ui_path):
+    # 編譯結果存在且第一行與目前 .ui 的 mtime/大小、PyQt 版本一致
+    try:
+        with open(py_path, encoding="utf-8") as f:
+            first = f.readline().rstrip("\n")
+        return first == _source_stamp(ui_path)
+    except OSError:
+        return False
+
+
+def compile_ui(ui_path, py_path=None):
+    """
+    將 .ui 編譯成 Python 模組並回傳路徑。先寫入暫存檔再改名，其他行程不會讀到寫到一半的檔案。
+    """
+    from PyQt5 import uic
+
+    py_path = py_path or compiled_path_for(ui_path)
+    code = io.StringIO()
+    with open(ui_path, encoding="utf-8") as f:
+        uic.compileUi(f, code)
+    tmp_path = f"{py_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(_source_stamp(ui_path) + "\n")
+        f.write(code.getvalue())
+    os.replace(tmp_path, py_path)
+    return py_path
+
+
+def _import_compiled(py_path):
+    name = os.path.splitext(os.path.basename(py_path))[0]
+    spec = importlib.util.spec_from_file_location(name, py_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_ui(ui_path, widget):
+    """
+    與 uic.loadUi(ui_path, widget) 相同：建立 .ui 中的元件並設為 widget 的屬性。
+    使用編譯好的模組 (過期時重新編譯)；資料夾無法寫入時退回 uic.loadUi。
+    回傳使用的方式："compiled"、"recompiled" 或 "loadUi"。
+    """
+    py_path = compiled_path_for(ui_path)
+    how = "compiled"
+    if not is_fresh(py_path, ui_path):
+        try:
+            compile_ui(ui_path, py_path)
+            how = "recompiled"
+        except OSError as e:
+            print(f"Cannot write compiled UI {py_path} ({e}), using uic.loadUi.")
+            from PyQt5 import uic
+            uic.loadUi(ui_path, widget)
+            return "loadUi"
+
+    module = _import_compiled(py_path)
+    ui_class = next(value for key, value in vars(module).items() if key.startswith("Ui_"))
+    ui = ui_class()
+    ui.setupUi(widget)
+    # loadUi 會把每個元件設為 widget 的屬性 (例如 self.findCornersButton)，這裡保持相同
+    for key, value in vars(ui).items():
+        setattr(widget, key, value)
+    return how
@@ -1,32 +1,142 @@
+import threading
+from collections import OrderedDict
+
 import cv2
 import numpy as np
 
+
+def fit_size(shape, max_size):
+    """
+    在 max_size (寬, 高) 內保持長寬比的大小 (寬, 高)，不放大。
+    max_size 的寬或高為 None 時不限制該方向。
+    """
+    h, w = shape[:2]
+    max_w, max_h = max_size
+    scale = min(1.0, (max_w or w) / w, (max_h or h) / h)
+    return max(1, int(w * scale)), max(1, int(h * scale))
+
+
+class PreviewService:
+    """
+    顯示用的縮圖服務：
+      - 以 INTER_AREA 縮小 (縮小時品質最好且沒有鋸齒)，以 cv2.resize(dst=...) 直接寫入
+        預覽大小的輸出陣列 (或並排畫布中的區域)，不產生全解析度的暫存影像。
+        輸出陣列每次呼叫各自配置，不共用緩衝區：預覽在背景工作中產生、之後才交給 UI 執行緒，
+        也可能被快取或被呼叫端保留，共用的緩衝區會被下一次呼叫覆寫
+      - 並排比較圖在預覽解析度組合：每張影像直接縮小到畫布的對應區域，
+        不必先 np.hstack 全解析度影像再縮小
+      - 以 (source_id, 大小) 快取結果 (LRU)，相同的預覽不必重新計算
+    快取中的預覽是共用且唯讀的。
+    """
+    def __init__(self, max_entries=64, interpolation=cv2.INTER_AREA):
+        self.max_entries = max_entries
+        self.interpolation = interpolation
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def cached(self, source_id, size):
+        if source_id is None:
+            return None
+        with self._lock:
+            img = self._entries.get((source_id, size))
+            if img is not None:
+                self._entries.move_to_end((source_id, size))
+            return img
+
+    def _store(self, source_id, size, img):
+        if source_id is None:
+            return img
+        img.flags.writeable = False
+        with self._lock:
+            self._entries[(source_id, size)] = img
+            self._entries.move_to_end((source_id, size))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return img
+
+    def _resize_into(self, img, dst):
+        # 大小相同時只複製；放大時 INTER_AREA 等同 INTER_LINEAR
+        if img.shape[:2] == dst.shape[:2]:
+            dst[...] = img
+        else:
+            cv2.resize(img, (dst.shape[1], dst.shape[0]), dst=dst, interpolation=self.interpolation)
+        return dst
+
+    def preview(self, img, size, source_id=None, keep_aspect=True):
+        """
+        回傳縮小後的影像。keep_aspect=True 時 size 為上限 (寬, 高)，否則為輸出大小。
+        影像已小於上限時直接回傳原影像 (不複製)。
+        """
+        target = fit_size(img.shape, size) if keep_aspect else tuple(size)
+        hit = self.cached(source_id, target)
+        if hit is not None:
+            return hit
+        if target == (img.shape[1], img.shape[0]):
+            return img
+        out = np.empty((target[1], target[0]) + img.shape[2:], img.dtype)
+        return self._store(source_id, target, self._resize_into(img, out))
+
+    def side_by_side(self, images, size, labels=None, source_id=None, font_scale=4, thickness=10, origin=(20, 100)):
+        """
+        將多張影像並排組成 size (寬, 高) 的畫布 (每張平分寬度，與 hstack 後 resize 的結果幾何相同)。
+        labels 依各影像原始解析度的字型大小/位置換算後，畫在預覽解析度的畫布上。
+        """
+        hit = self.cached(source_id, tuple(size))
+        if hit is not None:
+            return hit
+        width, height = size
+        channels = max(img.shape[2] if img.ndim == 3 else 1 for img in images)
+        canvas = np.empty((height, width, 3) if channels > 1 else (height, width), np.uint8)
+        x = 0
+        for i, img in enumerate(images):
+            x_end = width * (i + 1) // len(images)
+            if img.ndim == 2 and canvas.ndim == 3:
+                img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+            self._resize_into(img, canvas[:, x:x_end])
+            if labels and labels[i]:
+                sx, sy = (x_end - x) / img.shape[1], height / img.shape[0]
+                cv2.putText(canvas[:, x:x_end], labels[i], (int(origin[0] * sx), int(origin[1] * sy)),
+                            cv2.FONT_HERSHEY_SIMPLEX, font_scale * sy, (255, 255, 255), max(1, round(thickness * sy)))
+            x = x_end
+        return self._store(source_id, tuple(size), canvas)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# 整個行程共用的預覽服務
+preview_service = PreviewService()
+
+
 class ImageWindow:
     """
     一個簡單的輔助類別，用於調整大小並顯示 OpenCV 影像。
+    提供 gallery (GalleryDock / GalleryWidget) 時顯示在主視窗的結果面板中 (不阻塞)，
+    否則使用 cv2.imshow (呼叫端需自行 waitKey)。
+    縮圖由 preview_service 產生 (INTER_AREA)；提供 source_id 時相同來源的縮圖會被快取。
     """
-    def __init__(self, img, title, max_height=600):
+    def __init__(self, img, title, max_height=600, gallery=None, source_id=None):
         if img is None:
             print(f"Error: Image provided to ImageWindow '{title}' is None.")
             return
 
         # 保持長寬比
         try:
-            h, w = img.shape[:2]
-            if h > max_height:
-                scale = max_height / h
-                new_w = int(w * scale)
-                new_h = int(h * scale)
-                resized_image = cv2.resize(img, (new_w, new_h))
+            resized_image = preview_service.preview(img, (None, max_height), source_id)
+
+            if gallery is not None:
+                gallery.add_image(resized_image, title)
             else:
-                resized_image = img
-                
-            cv2.imshow(title, resized_image)
-            
+                cv2.imshow(title, resized_image)
+
         except Exception as e:
             print(f"Error displaying image '{title}': {e}")
             # 如果調整大小失敗 (例如 img 是空的)，也嘗試顯示原始影像
             try:
-                cv2.imshow(title, img)
+                if gallery is not None:
+                    gallery.add_image(img, title)
+                else:
+                    cv2.imshow(title, img)
             except Exception as e_inner:
                 print(f"Failed to show image '{title}' completely: {e_inner}")
\ No newline at end of file
@@ -0,0 +1,93 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from src.profiling import span
+
+
+class UndistortService:
+    """
+    以預先計算的 remap 表取代逐張呼叫 cv2.undistort。
+    remap 表依 (內參, 畸變係數, 影像大小, alpha) 建立一次並快取，
+    之後每張影像只需要一次 cv2.remap。
+    """
+    def __init__(self, max_maps=8, fixed_point=True):
+        self.max_maps = max_maps
+        # fixed_point=True 時使用 CV_16SC2 格式 (較省記憶體且 remap 較快，cv2.undistort 內部也是如此)
+        self.fixed_point = fixed_point
+        self._maps = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, mat_intri, cof_dist, image_size, alpha):
+        return (np.asarray(mat_intri, np.float64).tobytes(), np.asarray(cof_dist, np.float64).tobytes(),
+                tuple(image_size), alpha, self.fixed_point)
+
+    def get_maps(self, mat_intri, cof_dist, image_size, alpha=None):
+        """
+        回傳 (map1, map2, new_intri)。image_size 為 (width, height)。
+        alpha=None 時沿用原內參 (與 cv2.undistort 預設行為相同)，
+        否則以 getOptimalNewCameraMatrix(alpha) 決定保留的視野。
+        """
+        key = self._key(mat_intri, cof_dist, image_size, alpha)
+        with self._lock:
+            if key in self._maps:
+                self._maps.move_to_end(key)
+                return self._maps[key]
+
+        if alpha is None:
+            new_intri = np.asarray(mat_intri, np.float64)
+        else:
+            new_intri, _ = cv2.getOptimalNewCameraMatrix(mat_intri, cof_dist, image_size, alpha, image_size)
+        m1type = cv2.CV_16SC2 if self.fixed_point else cv2.CV_32FC1
+        map1, map2 = cv2.initUndistortRectifyMap(mat_intri, cof_dist, None, new_intri, image_size, m1type)
+
+        with self._lock:
+            self._maps[key] = (map1, map2, new_intri)
+            while len(self._maps) > self.max_maps:
+                self._maps.popitem(last=False)
+        return map1, map2, new_intri
+
+    def undistort(self, img, mat_intri, cof_dist, alpha=None, interpolation=cv2.INTER_LINEAR):
+        h, w = img.shape[:2]
+        map1, map2, _ = self.get_maps(mat_intri, cof_dist, (w, h), alpha)
+        with span("undistort"):
+            return cv2.remap(img, map1, map2, interpolation)
+
+    def undistort_folder(self, image_paths, output_dir, mat_intri, cof_dist, alpha=None, workers=None, progress=None):
+        """
+        批次校正多張影像並寫入 output_dir (檔名不變)。
+        imread / remap / imwrite 都會釋放 GIL，所以用 thread pool 即可平行處理，
+        且所有執行緒共用同一份 remap 表。回傳成功寫出的檔案路徑清單。
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        image_paths = list(image_paths)
+
+        def work(image_path):
+            img = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
+            if img is None:
+                print(f"Warning: Could not read {image_path}")
+                return None
+            out_path = os.path.join(output_dir, os.path.basename(image_path))
+            cv2.imwrite(out_path, self.undistort(img, mat_intri, cof_dist, alpha))
+            return out_path
+
+        written = []
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            for i, out_path in enumerate(pool.map(work, image_paths)):
+                if out_path is not None:
+                    written.append(out_path)
+                if progress is not None:
+                    progress(i + 1, len(image_paths))
+        return written
+
+    def clear(self):
+        with self._lock:
+            self._maps.clear()
+
+
+# 整個行程共用的服務 (Q1 與批次工具共用 remap 表)
+undistort_service = UndistortService()